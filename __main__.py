@@ -2,22 +2,75 @@
 
 import sys
 
+from time import sleep, monotonic
+
 from multithreaded.multithreaded import Bot
+import multithreaded.multithreaded as multithreaded
 
 import frontend.windows as windows
 import newfrontend.landing as landing
 
+import backend.accounts as accounts
+import backend.services as services
+from backend.profiler import Sampler
+
+
+PROFILE_SECONDS = 60  # Default duration of profile mode
+
+
+def profile(argv):
+    """
+    Run frontend, new frontend or headless monitors under sampling profiler.
+
+    python3 __main__.py profile [frontend|newfrontend|monitors] [seconds]
+    """
+    target = argv[2].lower() if len(argv) > 2 else "frontend"
+    seconds = float(argv[3]) if len(argv) > 3 else PROFILE_SECONDS
+
+    sampler = Sampler()
+    sampler.start()
+    end = monotonic() + seconds
+    if target == "monitors":
+        accounts.load()
+        monitors = [multithreaded.Accounts(), multithreaded.Positions()]
+        for monitor in monitors:
+            monitor.run()
+        while monotonic() < end:
+            sleep(1)
+        for monitor in monitors:
+            monitor.stop()
+    else:
+        if target == "newfrontend":
+            window = landing.Landing()
+        else:
+            window = windows.Main()
+        while window.isAlive and monotonic() < end:
+            window.update()
+        if window.isAlive:
+            window.quit()
+    sampler.stop()
+
+    sampler.write_collapsed()
+    sampler.write_summary()
+    print(sampler.summary())
+
 
 def main(argv):
     if len(argv) > 1 and argv[1].lower() == "onlybot":
         Bot.main()
+    elif len(argv) > 1 and argv[1].lower() == "profile":
+        profile(argv)
     else:
         if len(argv) > 1 and argv[1].lower() == "newfrontend":
             window = landing.Landing()
         else:
             window = windows.Main()
-        while window.isAlive:
-            window.update()
+        services.start()  # Accounts are loaded by the window
+        try:
+            while window.isAlive:
+                window.update()
+        finally:
+            services.stop()
 
 
 if __name__ == "__main__":
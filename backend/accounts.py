@@ -2,6 +2,8 @@
 Internally managing accounts.
 """
 
+import threading
+
 from json import dumps, loads
 
 from backend.exceptions import BitmexAccountsException
@@ -11,16 +13,43 @@ from backend.exceptions import BitmexAccountsException
 
 HOST = "https://www.bitmex.com/"  # Default host for new accounts
 SAVEFILE = "./accounts"  # Default account savefile location
+GROUP_PREFIX = "group:"  # Account names starting with this refer to whole group
 
 
 # Accounts list
 
-_accounts = []  # Stores all loaded accounts
+_accounts = []  # Stores all loaded accounts (replaced, never changed in place)
+_index = {}  # Account name -> account dict
+_keyIndex = {}  # Api key -> account dict
+_groups = {}  # Group name -> list of account names
+_lock = threading.Lock()  # Held while changing loaded accounts
+
+
+# Internal methods
+
+def _set(accounts):
+    """
+    Replace loaded accounts and rebuild indexes. New list is swapped in whole,
+    so threads reading the old one are never disturbed. Caller holds _lock.
+    """
+    global _accounts, _index, _keyIndex, _groups
+    index = {}
+    keyIndex = {}
+    groups = {}
+    for account in accounts:
+        index[account["name"]] = account
+        keyIndex.setdefault(account["key"], account)
+        for group in account.get("tags", []):
+            groups.setdefault(group, []).append(account["name"])
+    _index = index
+    _keyIndex = keyIndex
+    _groups = groups
+    _accounts = accounts
 
 
 # Methods
 
-def new(name: str, key: str, secret: str, host: str = HOST):
+def new(name: str, key: str, secret: str, host: str = HOST, tags=None):
     """
     Create new account dict.
 
@@ -28,18 +57,25 @@ def new(name: str, key: str, secret: str, host: str = HOST):
     key:    api key
     secret: api secret
     host:   url of bitmex server for this account (https:// has to be included)
+    tags:   list of groups the account belongs to
 
     Returns created account dict.
     """
-    if name in [x["name"] for x in _accounts]:
-        raise BitmexAccountsException("Account '" + name + "' already exists.")
+    if name.startswith(GROUP_PREFIX):
+        raise BitmexAccountsException("Account name can't start with '" +
+                                      GROUP_PREFIX + "'.")
     d = {
         "name": name,
         "key": key,
         "secret": secret,
         "host": host
     }
-    _accounts.append(d)
+    if tags:
+        d["tags"] = list(tags)
+    with _lock:
+        if name in _index:
+            raise BitmexAccountsException("Account '" + name + "' already exists.")
+        _set(_accounts + [d])
     return d
 
 
@@ -49,9 +85,9 @@ def delete(name: str):
 
     name:   name of account to be deleted
     """
-    for i, account in enumerate(_accounts):
-        if account["name"] == name:
-            _accounts.pop(i)
+    with _lock:
+        if name in _index:
+            _set([x for x in _accounts if x["name"] != name])
 
 
 def get(name: str):
@@ -62,9 +98,93 @@ def get(name: str):
 
     Returns account dict or None if account with name doesn't exist.
     """
-    for account in _accounts:
-        if account["name"] == name:
-            return account
+    return _index.get(name)
+
+
+def get_by_key(key: str):
+    """
+    Get account by api key.
+
+    key:    api key
+
+    Returns account dict or None if no account has the key.
+    """
+    return _keyIndex.get(key)
+
+
+def tag(name: str, group: str):
+    """
+    Add account to group.
+
+    name:   name of account
+    group:  name of group (without group: prefix)
+    """
+    with _lock:
+        account = _index.get(name)
+        if account is None:
+            raise BitmexAccountsException("Account '" + name + "' doesn't exist.")
+        tags = account.get("tags", [])
+        if group not in tags:
+            changed = dict(account, tags=tags + [group])
+            _set([changed if x is account else x for x in _accounts])
+
+
+def untag(name: str, group: str):
+    """
+    Remove account from group.
+
+    name:   name of account
+    group:  name of group (without group: prefix)
+    """
+    with _lock:
+        account = _index.get(name)
+        if account is not None and group in account.get("tags", []):
+            changed = dict(account, tags=[x for x in account["tags"] if x != group])
+            _set([changed if x is account else x for x in _accounts])
+
+
+def get_group(group: str):
+    """
+    Returns list of names of accounts in group (in order they were loaded).
+    """
+    return list(_groups.get(group, []))
+
+
+def get_groups():
+    """
+    Returns list of all group names.
+    """
+    return list(_groups.keys())
+
+
+def resolve(names):
+    """
+    Expand "group:name" entries of account name list to names of accounts in
+    that group. Duplicates are dropped, order is kept.
+
+    names:  list of account names and group references
+
+    Returns list of account names.
+    """
+    result = []
+    seen = set()
+    for name in names:
+        if name.startswith(GROUP_PREFIX):
+            expanded = _groups.get(name[len(GROUP_PREFIX):], [])
+        else:
+            expanded = (name,)
+        for x in expanded:
+            if x not in seen:
+                seen.add(x)
+                result.append(x)
+    return result
+
+def get_names():
+    """
+    Returns list of names of all loaded accounts.
+    """
+    return list(_index.keys())
+
 
 def get_all():
     """
@@ -109,8 +229,7 @@ def load(savefile: str = SAVEFILE):
         raise BitmexAccountsException("Internal Error: " + str(e) + "Is '" +
                                       savefile + "' really an account savefile?")
 
-    _accounts.clear()
-    for account in dict:
-        _accounts.append(account)
+    with _lock:
+        _set(list(dict))
 
     f.close()
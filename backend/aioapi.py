@@ -0,0 +1,289 @@
+"""
+Asyncio variant of backend.api. Requests are signed, retried and decoded the
+same way as by the sync client (the code is shared), only sending is awaited.
+
+Uses aiohttp when it is installed. Without it, requests are sent by the sync
+client on default executor threads, so the interface stays the same.
+"""
+
+import time
+import asyncio
+import functools
+
+from time import perf_counter
+from urllib.parse import urljoin
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency
+    aiohttp = None
+
+import backend.api as api
+import backend.codec as codec
+import backend.metrics as metrics
+import backend.trace as trace
+
+from backend.api import LIFE
+from backend.exceptions import BitmexApiException
+
+
+#
+# Constants
+#
+
+VERBS = ("GET", "PUT", "POST", "DELETE")
+
+
+#
+# Sessions
+#
+
+_sessions = {}  # event loop -> aiohttp session
+
+
+def _session():
+    """
+    Returns aiohttp session of running event loop. Sessions keep connections
+    to server open, so that following requests don't have to connect again.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=api.TIMEOUT))
+        _sessions[loop] = session
+    return session
+
+
+async def close():
+    """
+    Close http session of running event loop. Call before the loop ends.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+#
+# Sending
+#
+
+async def _send(verb: str, host: str, key: str, secret: str, path: str, body: bytes,
+                life: int):
+    """
+    Sign and send request once.
+
+    Returns decoded response. Raises api._TransientError if sending it again
+    might help, BitmexApiException otherwise.
+    """
+    if aiohttp is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            api._send, verb, host, key, secret, path, body, life))
+
+    if verb not in VERBS:
+        raise BitmexApiException("Internal Error: Unrecognized http operation: "
+                                 + str(verb) + " (should be all uppercase).")
+    url = urljoin(host, path)
+    expires = api._expires(host, life)
+    headers = api._get_signer(key, secret).headers(verb, path, body, expires)
+    endpoint = api._endpoint(path)
+    spanArgs = {"endpoint": endpoint, "account": metrics.account_label(key)}
+    sent = time.time()
+    start = perf_counter()
+    try:
+        async with _session().request(verb, url, headers=headers,
+                                      data=body or None) as response:
+            content = await response.read()
+    except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+        spanArgs["error"] = type(e).__name__
+        metrics.request(endpoint, verb, key, type(e).__name__, time.time() - sent)
+        raise api._TransientError(str(e))
+    finally:
+        trace.record(verb + " " + endpoint, start, perf_counter(), **spanArgs)
+    return api._handle_response(verb, host, key, endpoint, sent, response.status,
+                                response.reason, response.headers, content)
+
+
+async def _request(verb: str, host: str, key: str, secret: str, path: str,
+                   body: bytes, life: int, reconcile=None):
+    """
+    Send request, retrying transient failures with backoff. Same as
+    api._request(), except reconcile is a coroutine function.
+
+    Returns decoded response.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await _send(verb, host, key, secret, path, body, life)
+        except api._TransientError as e:
+            error = e
+        delay = api._retry_delay(verb, reconcile, attempt, error)
+        if delay is None:
+            raise BitmexApiException("Gave up after %d attempts: %s" % (attempt + 1,
+                                                                        str(error)))
+        attempt += 1
+        metrics.inc("bitmex_retries_total", {"verb": verb})
+        await asyncio.sleep(delay)
+        if reconcile is not None and not error.rejected:
+            try:
+                result = await reconcile()
+            except Exception:
+                result = None
+            if result is not None:
+                return result
+
+
+# Http
+
+async def _get(host: str, key: str, secret: str, path: str, life: int = LIFE,
+               **params):
+    """
+    Send GET request to BitMEX server. See api._get().
+    """
+    path, columns = api._get_path(path, life, params)
+    responseData = await _request("GET", host, key, secret, path, b"", life)
+    if columns and api.PROJECT_COLUMNS:
+        responseData = codec.project(responseData, columns)
+    return responseData
+
+
+async def _put_post_delete(host: str, key: str, secret: str, path: str, verb: str,
+                           life: int = LIFE, **params):
+    """
+    Send PUT, POST or DELETE request to BitMEX server. See
+    api._put_post_delete().
+    """
+    path, json, clOrdID = api._body(path, verb, life, params)
+    reconcile = None
+    if clOrdID is not None:
+
+        async def reconcile():
+            orders = await _get(host, key, secret, "/order", life,
+                                filter={"clOrdID": clOrdID})
+            return orders[0] if orders else None
+
+    return await _request(verb, host, key, secret, path, json, life, reconcile)
+
+
+#
+# Api calls
+#
+# Parameters and return values are the same as of the backend.api functions
+# with the same name.
+#
+
+# Instrument
+
+async def instrument_get(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    GET api call at /instrument. See api.instrument_get().
+    """
+    return await _get(host, key, secret, "/instrument", life, **params)
+
+
+# Order
+
+async def order_get(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    GET api call at /order. See api.order_get().
+    """
+    return await _get(host, key, secret, "/order", life, **params)
+
+
+async def order_put(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    PUT api call at /order. See api.order_put().
+    """
+    return await _put_post_delete(host, key, secret, "/order", "PUT", life, **params)
+
+
+async def order_post(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    POST api call at /order. See api.order_post().
+    """
+    return await _put_post_delete(host, key, secret, "/order", "POST", life, **params)
+
+
+async def order_delete(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    DELETE api call at /order. See api.order_delete().
+    """
+    return await _put_post_delete(host, key, secret, "/order", "DELETE", life, **params)
+
+
+async def order_all_delete(host: str, key: str, secret: str, life: int = LIFE,
+                           **params):
+    """
+    DELETE api call at /order/all. See api.order_all_delete().
+    """
+    return await _put_post_delete(host, key, secret, "/order/all", "DELETE", life,
+                                  **params)
+
+
+async def order_cancel_all_after_post(host: str, key: str, secret: str,
+                                      life: int = LIFE, **params):
+    """
+    POST api call at /order/cancelAllAfter. See
+    api.order_cancel_all_after_post().
+    """
+    return await _put_post_delete(host, key, secret, "/order/cancelAllAfter", "POST",
+                                  life, **params)
+
+
+# Execution
+
+async def execution_trade_history_get(host: str, key: str, secret: str,
+                                      life: int = LIFE, **params):
+    """
+    GET api call at /execution/tradeHistory. See
+    api.execution_trade_history_get().
+    """
+    return await _get(host, key, secret, "/execution/tradeHistory", life, **params)
+
+
+# Position
+
+async def position_get(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    GET api call at /position. See api.position_get().
+    """
+    return await _get(host, key, secret, "/position", life, **params)
+
+
+async def position_leverage_post(host: str, key: str, secret: str, life: int = LIFE,
+                                 **params):
+    """
+    POST api call at /position/leverage. See api.position_leverage_post().
+    """
+    return await _put_post_delete(host, key, secret, "/position/leverage", "POST",
+                                  life, **params)
+
+
+async def position_risk_limit_post(host: str, key: str, secret: str, life: int = LIFE,
+                                   **params):
+    """
+    POST api call at /position/riskLimit. See api.position_risk_limit_post().
+    """
+    return await _put_post_delete(host, key, secret, "/position/riskLimit", "POST",
+                                  life, **params)
+
+
+async def position_transfer_margin_post(host: str, key: str, secret: str,
+                                        life: int = LIFE, **params):
+    """
+    POST api call at /position/transferMargin. See
+    api.position_transfer_margin_post().
+    """
+    return await _put_post_delete(host, key, secret, "/order/transferMargin", "POST",
+                                  life, **params)
+
+
+# User
+
+async def user_margin_get(host: str, key: str, secret: str, life: int = LIFE, **params):
+    """
+    GET api call at /user/margin. See api.user_margin_get().
+    """
+    return await _get(host, key, secret, "/user/margin", life, **params)
@@ -0,0 +1,190 @@
+"""
+Asyncio variants of the backend.core fan-out helpers. They take backend.aioapi
+functions as calls, send them concurrently on the running event loop and
+report failures the same way as backend.core (BitmexCoreMultiException).
+"""
+
+import asyncio
+import functools
+
+from time import monotonic
+
+import backend.core as core
+import backend.aioapi as aioapi
+import backend.accounts as accounts
+import backend.metrics as metrics
+
+from backend.exceptions import *
+
+
+#
+# Functions
+#
+
+async def _call(account, call, **params):
+    """
+    Await call to API for account.
+    """
+    return await call(account["host"], account["key"], account["secret"], **params)
+
+
+async def _gather(accs, calls, coreExc):
+    """
+    Await calls to API concurrently.
+
+    accs:           list of account dicts
+    calls:          list of awaitables, one for each account
+    coreExc:        BitmexCoreMultiException collecting failed calls
+
+    Returns list of {"account": account dict, "response": response dict} for
+    each successful call.
+    """
+    result = []
+    responses = await asyncio.gather(*calls, return_exceptions=True)
+    for account, response in zip(accs, responses):
+        if isinstance(response, Exception):
+            metrics.error("core", response)
+            coreExc.accounts.append(account)
+            coreExc.exceptions.append(response)
+            coreExc.tracebacks.append(type(response))
+        else:
+            result.append({
+                "account": account,
+                "response": response
+            })
+    return result
+
+
+def _get_accounts(accountNames, coreExc):
+    """
+    Returns list of account dicts of account names and groups, missing
+    accounts are recorded in coreExc.
+    """
+    accs = []
+    for name in accounts.resolve(accountNames):
+        account = core.get_account(name, coreExc)
+        if account is not None:
+            accs.append(account)
+    return accs
+
+
+async def for_each_account(accountNames, call, **params):
+    """
+    Call to API for each account. Calls are sent concurrently. New orders are
+    rounded and checked before being sent like in backend.core, raises
+    BitmexCoreException if the exchange would reject them.
+
+    accountNames:   list of account names
+    call:           aioapi function
+    params:         parameters for call
+
+    Returns list of {"account": account dict, "response": response dict} for
+    each successful call.
+    """
+    if call is aioapi.order_post:
+        names = accounts.resolve(accountNames)
+        if names:
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(core.check_order, names[0], params))
+    coreExc = BitmexCoreMultiException()
+    accs = _get_accounts(accountNames, coreExc)
+    start = monotonic()
+    result = await _gather(accs, [_call(x, call, **params) for x in accs], coreExc)
+    metrics.observe("bitmex_fanout_seconds", {"call": call.__name__}, monotonic() - start)
+    if coreExc.exceptions:
+        raise coreExc
+    else:
+        return result
+
+
+async def for_one_account(accountName, call, **params):
+    """
+    Call to API for one account.
+
+    accountName:    account name
+    call:           aioapi function
+    params:         parameters for call
+
+    Returns {"account": account dict, "response": response dict}.
+    """
+    names = accounts.resolve([accountName])
+    if not names:
+        raise BitmexCoreException("Group '" + accountName + "' is empty.")
+    account = accounts.get(names[0])
+    if account is None:
+        raise BitmexCoreException("Account '" + accountName + "' doesn't exist.")
+
+    try:
+        response = await _call(account, call, **params)
+        return {
+            "account": account,
+            "response": response
+        }
+    except Exception as e:
+        metrics.error("core", e)
+        raise BitmexCoreException(account["name"] + ":\n" + str(e))
+
+
+async def available_margins(accs, coreExc, maxAge=core.MARGIN_MAX_AGE):
+    """
+    Get available margin of each account (in bitcoins). Shares cache with
+    backend.core, margins fetched less than maxAge seconds ago are reused.
+
+    accs:           list of account dicts
+    coreExc:        BitmexCoreMultiException collecting failed calls
+    maxAge:         how old margins may be reused (in seconds)
+
+    Returns dict of account name -> available margin float for each account
+    whose margin is known.
+    """
+    result = {}
+    missing = []
+    for account in accs:
+        cached = core.cached_available_margin(account["name"])
+        if cached is not None and cached[0] < maxAge:
+            result[account["name"]] = cached[1]
+        else:
+            missing.append(account)
+    calls = [_call(x, aioapi.user_margin_get, currency="XBt") for x in missing]
+    for foo in await _gather(missing, calls, coreExc):
+        available = foo["response"]["availableMargin"] * 1e-8
+        core.remember_available_margin(foo["account"]["name"], available)
+        result[foo["account"]["name"]] = available
+    return result
+
+
+async def for_each_relative(accountNames, call, percent, marginPerContract,
+                            maxMarginAge=core.MARGIN_MAX_AGE, **params):
+    """
+    Call to API for each account with orderQty parameter relative to each accounts
+    available margin (rounded to fit instrument lot size, prices to its tick).
+    Margins of all accounts are fetched first, then all orders are sent
+    concurrently. Orders the exchange would reject fail without being sent.
+
+    accountNames:       list of account names
+    call:               aioapi function
+    percent:            order value = (percent / 100) * available margin
+    marginPerContract:  how much margin is equal to one contract (in bitcoin)
+    maxMarginAge:       how old available margins may be reused (in seconds)
+    params:             parameters for call
+
+    Returns list of {"account": account dict, "response": response dict} for
+    each successful call.
+    """
+    coreExc = BitmexCoreMultiException()
+    accs = _get_accounts(accountNames, coreExc)
+    start = monotonic()
+    margins = await available_margins(accs, coreExc, maxMarginAge)
+    accs = [x for x in accs if x["name"] in margins]
+    orders = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+        core.relative_quantities, accs, margins, percent, marginPerContract, params,
+        coreExc))
+    accs = [x[0] for x in orders]
+    calls = [_call(x, call, orderQty=y, **params) for x, y in orders]
+    result = await _gather(accs, calls, coreExc)
+    metrics.observe("bitmex_fanout_seconds", {"call": call.__name__ + "_relative"},
+                    monotonic() - start)
+    if coreExc.exceptions:
+        raise coreExc
+    else:
+        return result
@@ -3,15 +3,21 @@ Communication with BitMEX REST API.
 """
 
 import time
+import uuid
+import threading
+import random
 import hashlib
 import hmac
 import requests
 
 from requests.auth import HTTPBasicAuth
 from urllib.parse import urlparse, urljoin, urlencode
-from json import dumps, loads
-from datetime import datetime
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 
+import backend.codec as codec
+import backend.metrics as metrics
+import backend.trace as trace
 from backend.exceptions import BitmexApiException
 
 
@@ -22,12 +28,175 @@ from backend.exceptions import BitmexApiException
 API_ROOT = "/api/v1/"  # Root location of api calls
 LIFE = 5  # Default request life in seconds
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+TIMEOUT = 10  # Seconds before waiting for server response is given up
+RETRY_ATTEMPTS = {  # How many times at most is request of each verb sent
+    "GET": 4,
+    "PUT": 3,
+    "POST": 3,  # Only if it can be reconciled or was rejected, see _retry_delay()
+    "DELETE": 4
+}
+RETRY_STATUSES = (502, 503, 504)  # Server overloaded or unreachable
+BACKOFF_BASE = 0.5  # Seconds, first retry waits up to this long
+BACKOFF_MAX = 8  # Seconds, no retry waits longer than this
+RETRY_AFTER_MAX = 30  # Seconds, rate limited requests asked to wait longer give up
+CL_ORD_ID_PREFIX = "bma-"  # Prefix of automatically assigned clOrdIDs
+PROJECT_COLUMNS = False  # Keep only requested columns of GET responses and
+                         # fail on missing ones (for testing, costs a copy)
+CLOCK_SMOOTHING = 0.2  # Weight of new sample in server clock offset estimate
 
 
 #
 # Internal functions
 #
 
+class Signer:
+    """
+    Signs requests of one api key. Keeps HMAC already keyed with api secret
+    and only copies it for each request, so that the secret isn't encoded and
+    hashed into the key again every time.
+    """
+
+    PATH_CACHE_SIZE = 256  # How many encoded paths to remember
+
+    def __init__(self, key: str, secret: str):
+        self.key = key
+        self._hmac = hmac.new(bytes(secret, 'utf8'), digestmod=hashlib.sha256)
+        self._paths = {}  # path str -> path bytes
+
+    def _path(self, path: str):
+        """
+        Returns path encoded to bytes. Cached.
+        Internal method.
+        """
+        encoded = self._paths.get(path)
+        if encoded is None:
+            if len(self._paths) >= self.PATH_CACHE_SIZE:
+                self._paths.clear()
+            encoded = bytes(path, 'utf8')
+            self._paths[path] = encoded
+        return encoded
+
+    def signature(self, verb: str, path: str, body: bytes, expires: int):
+        """
+        Generate request signature compatible with BitMEX.
+
+        verb:       method verb (POST, GET, ...)
+        path:       request path including query (i.e. /api/v1/order?count=2)
+        body:       json body of request as bytes (or str)
+        expires:    request expiration in unix time
+
+        Returns signature as string
+        """
+        if isinstance(body, str):
+            body = bytes(body, 'utf8')
+        signature = self._hmac.copy()
+        signature.update(bytes(verb, 'utf8'))
+        signature.update(self._path(path))
+        signature.update(bytes(str(expires), 'utf8'))
+        signature.update(body)
+        return signature.hexdigest()
+
+    def headers(self, verb: str, path: str, body: bytes, expires: int):
+        """
+        Generate request headers compatible with BitMEX.
+
+        verb:       method verb (POST, GET, ...)
+        path:       request path including query (i.e. /api/v1/order?count=2)
+        body:       json body of request as bytes (or str)
+        expires:    request expiration in unix time
+
+        Returns headers as a dict
+        """
+        return {
+            "api-key": self.key,
+            "api-expires": str(expires),
+            "api-signature": self.signature(verb, path, body, expires),
+            "content-type": "application/json"
+        }
+
+
+_signers = {}  # (key, secret) -> Signer
+_local = threading.local()  # Per thread http session (keeps connections open)
+_clocks = {}  # host -> {"offset": float, "rtt": float, "samples": int}
+
+
+def _get_signer(key, secret):
+    """
+    Returns Signer of api key. Signers are created once and then reused.
+    """
+    signer = _signers.get((key, secret))
+    if signer is None:
+        signer = Signer(key, secret)
+        _signers[(key, secret)] = signer
+    return signer
+
+
+def _update_clock(host, serverTime, sent, received):
+    """
+    Update estimate of how much is server clock ahead of local clock.
+
+    host:       url of bitmex server
+    serverTime: server unix time when response was made
+    sent:       local unix time when request was sent
+    received:   local unix time when response was received
+    """
+    rtt = received - sent
+    offset = serverTime - (sent + received) / 2
+    clock = _clocks.get(host)
+    if clock is None:
+        clock = {"offset": offset, "rtt": rtt, "samples": 1}
+        _clocks[host] = clock
+    else:
+        clock["offset"] += CLOCK_SMOOTHING * (offset - clock["offset"])
+        clock["rtt"] += CLOCK_SMOOTHING * (rtt - clock["rtt"])
+        clock["samples"] += 1
+    metrics.set_gauge("bitmex_clock_offset_seconds", {"host": host}, clock["offset"])
+    metrics.set_gauge("bitmex_rtt_seconds", {"host": host}, clock["rtt"])
+
+
+def _update_clock_from_date(host, date, sent, received):
+    """
+    Update server clock estimate from http Date header of response.
+    """
+    try:
+        serverTime = parsedate_to_datetime(date).timestamp()
+    except Exception:
+        return
+    # Date header is truncated to whole seconds, on average it is half a
+    # second behind
+    _update_clock(host, serverTime + 0.5, sent, received)
+
+
+def _expires(host, life):
+    """
+    Returns request expiration in server unix time.
+    """
+    return int(time.time() + clock_offset(host)) + life
+
+
+def _session():
+    """
+    Returns http session of current thread. Sessions keep connections to server
+    open, so that following requests don't have to connect again.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def _url_path(url):
+    """
+    Returns path of url with query (the part of url BitMEX signs).
+    """
+    parsedURL = urlparse(url)
+    path = parsedURL.path
+    if parsedURL.query:
+        path = path + '?' + parsedURL.query
+    return path
+
+
 def _generate_signature(secret, verb, url, json, expires):
     """
     Generate request signature compatible with BitMEX.
@@ -40,20 +209,7 @@ def _generate_signature(secret, verb, url, json, expires):
 
     Returns signature as string
     """
-    # Parse the url so we can remove the base and extract just the path.
-    parsedURL = urlparse(url)
-    path = parsedURL.path
-    if parsedURL.query:
-        path = path + '?' + parsedURL.query
-
-    if isinstance(json, (bytes, bytearray)):
-        json = json.decode('utf8')
-
-    message = verb + path + str(expires) + json
-
-    signature = hmac.new(bytes(secret, 'utf8'), bytes(message, 'utf8'),
-                         digestmod=hashlib.sha256).hexdigest()
-    return signature
+    return Signer("", secret).signature(verb, _url_path(url), json, expires)
 
 
 def _generate_headers(life, key, secret, verb, url, json):
@@ -69,15 +225,8 @@ def _generate_headers(life, key, secret, verb, url, json):
 
     Returns headers as a dict
     """
-    # Unix time + 5 seconds
-    expires = int(time.time()) + 5
-    headers = {
-        "api-key": key,
-        "api-expires": str(expires),
-        "api-signature": _generate_signature(secret, verb, url, json, expires),
-        "content-type": "application/json"
-    }
-    return headers
+    expires = _expires(urljoin(url, "/"), life)
+    return _get_signer(key, secret).headers(verb, _url_path(url), json, expires)
 
 
 # Utility
@@ -107,14 +256,224 @@ def _json_sanitize(dict):
         if isinstance(value, datetime):
             dict[key] = _datetime_to_str(value)
         elif not isinstance(value, str):
-            dict[key] = dumps(value)
+            dict[key] = codec.dumps_str(value)
+
+
+# Retrying
+
+class _TransientError(Exception):
+    """
+    Request failed in a way that may not happen if it is sent again.
+    Internal exception.
+
+    retryAfter: seconds the server asked to wait before sending it again
+                (None if it didn't ask)
+    rejected:   true if the server surely didn't execute the request
+    """
+
+    def __init__(self, message, retryAfter=None, rejected=False):
+        super().__init__(message)
+        self.retryAfter = retryAfter
+        self.rejected = rejected
+
+
+def _backoff(attempt):
+    """
+    Returns how many seconds to wait before retry number 'attempt' (counted
+    from 0). Exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_after(headers):
+    """
+    Returns seconds from Retry-After header (None if it is missing or can't be
+    parsed).
+    """
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_delay(verb, reconcile, attempt, error):
+    """
+    Decide if request which failed with transient error is sent again. Shared
+    by sync and async clients. POST request is sent again only if it can be
+    reconciled or the server surely rejected it, otherwise it could be executed
+    twice.
+
+    verb:       http operation verb
+    reconcile:  reconcile function of request (see _request()) or None
+    attempt:    number of failed attempt (counted from 0)
+    error:      _TransientError of failed attempt
+
+    Returns how many seconds to wait before next attempt or None to give up.
+    """
+    if attempt + 1 >= RETRY_ATTEMPTS.get(verb, 1):
+        return None
+    if verb == "POST" and reconcile is None and not error.rejected:
+        return None
+    if error.retryAfter is not None:
+        if error.retryAfter > RETRY_AFTER_MAX:
+            return None
+        return error.retryAfter
+    return _backoff(attempt)
+
+
+def _new_cl_ord_id():
+    """
+    Returns new unique clOrdID. It is assigned to an order once and then kept
+    for all retries of that order.
+    """
+    return CL_ORD_ID_PREFIX + uuid.uuid4().hex
+
+
+def _endpoint(path: str):
+    """
+    Returns endpoint of full request path (i.e. /order), used as metric label.
+    """
+    return path[len(API_ROOT) - 1:].split("?")[0].replace("//", "/")
+
+
+def _handle_response(verb: str, host: str, key: str, endpoint: str, sent: float,
+                     status: int, reason: str, headers, content: bytes):
+    """
+    Record received response and decode it. Shared by sync and async clients.
+
+    Returns decoded response. Raises _TransientError if sending request again
+    might help, BitmexApiException otherwise.
+    """
+    received = time.time()
+    metrics.request(endpoint, verb, key, status, received - sent, headers)
+    if "Date" in headers:
+        _update_clock_from_date(host, headers["Date"], sent, received)
+
+    if status == 429:  # Rate limited, request wasn't executed
+        raise _TransientError("%d %s" % (status, reason), _retry_after(headers),
+                              rejected=True)
+    if status in RETRY_STATUSES:
+        raise _TransientError("%d %s" % (status, reason))
+    try:
+        responseData = codec.loads(content)
+    except Exception as e:
+        raise BitmexApiException("%d: %s" % (status, str(e)))
+    if status == 200:  # Success
+        return responseData
+    else:              # Error
+        raise BitmexApiException("%d %s: %s" % (status,
+                                                responseData["error"]["name"],
+                                                responseData["error"]["message"]))
+
+
+def _send(verb: str, host: str, key: str, secret: str, path: str, body: bytes,
+          life: int):
+    """
+    Sign and send request once.
+
+    Returns decoded response. Raises _TransientError if sending it again
+    might help, BitmexApiException otherwise.
+    """
+    url = urljoin(host, path)
+    expires = _expires(host, life)
+    headers = _get_signer(key, secret).headers(verb, path, body, expires)
+    endpoint = _endpoint(path)
+    sent = time.time()
+    try:
+        with trace.span(verb + " " + endpoint, endpoint=endpoint,
+                        account=metrics.account_label(key)):
+            session = _session()
+            if verb == "GET":
+                response = session.get(url, headers=headers, timeout=TIMEOUT)
+            elif verb == "PUT":
+                response = session.put(url, headers=headers, data=body, timeout=TIMEOUT)
+            elif verb == "POST":
+                response = session.post(url, headers=headers, data=body, timeout=TIMEOUT)
+            elif verb == "DELETE":
+                response = session.delete(url, headers=headers, data=body,
+                                          timeout=TIMEOUT)
+            else:
+                raise BitmexApiException("Internal Error: Unrecognized http operation: "
+                                         + str(verb) + " (should be all uppercase).")
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        metrics.request(endpoint, verb, key, type(e).__name__, time.time() - sent)
+        raise _TransientError(str(e))
+    return _handle_response(verb, host, key, endpoint, sent, response.status_code,
+                            response.reason, response.headers, response.content)
+
+
+def _request(verb: str, host: str, key: str, secret: str, path: str, body: bytes,
+             life: int, reconcile=None):
+    """
+    Send request, retrying transient failures with backoff (or as long as the
+    server asks when rate limited). See _retry_delay() for which requests are
+    retried.
+
+    verb:       http operation verb
+    host:       url of bitmex server (https:// has to be included)
+    key:        api key id
+    secret:     api key secret
+    path:       full path including api root and query
+    body:       json body as bytes
+    life:       how many seconds before request expires
+    reconcile:  function called before every retry, if it returns anything
+                but None, the request is considered done with that result
+                (used to find out whether failed request reached the server)
+
+    Returns decoded response.
+    """
+    attempt = 0
+    while True:
+        try:
+            return _send(verb, host, key, secret, path, body, life)
+        except _TransientError as e:
+            error = e
+        delay = _retry_delay(verb, reconcile, attempt, error)
+        if delay is None:
+            raise BitmexApiException("Gave up after %d attempts: %s" % (attempt + 1,
+                                                                        str(error)))
+        attempt += 1
+        metrics.inc("bitmex_retries_total", {"verb": verb})
+        time.sleep(delay)
+        if reconcile is not None and not error.rejected:
+            try:
+                result = reconcile()
+            except Exception:
+                result = None
+            if result is not None:
+                return result
 
 
 # Http
 
+def _get_path(path: str, life: int, params: dict):
+    """
+    Prepare GET request. Shared by sync and async clients.
+
+    Returns (full path with query, requested columns or None).
+    """
+    path = API_ROOT + path
+
+    if life < 0:
+        raise BitmexApiException("Request life of " + str(life) + " is negative")
+
+    columns = params.get("columns")
+    if params:
+        _json_sanitize(params)
+        path = path + "?" + urlencode(params)
+    return path, columns
+
+
 def _get(host: str, key: str, secret: str, path: str, life: int = LIFE, **params):
     """
-    Send GET request to BitMEX server.
+    Send GET request to BitMEX server. Transient failures are retried.
 
     host:   url of bitmex server (https:// has to be included)
     key:    api key id
@@ -125,32 +484,40 @@ def _get(host: str, key: str, secret: str, path: str, life: int = LIFE, **params
 
     Returns response json as dict.
     """
-    verb = "GET"
+    path, columns = _get_path(path, life, params)
+    responseData = _request("GET", host, key, secret, path, b"", life)
+    if columns and PROJECT_COLUMNS:
+        responseData = codec.project(responseData, columns)
+    return responseData
+
+
+def _body(path: str, verb: str, life: int, params: dict):
+    """
+    Prepare PUT, POST or DELETE request. New orders get clOrdID if they don't
+    have one. Shared by sync and async clients.
+
+    Returns (full path, json body bytes, clOrdID of new order or None).
+    """
+    clOrdID = None
+    if verb == "POST" and path == "/order":
+        if not params.get("clOrdID"):
+            params["clOrdID"] = _new_cl_ord_id()
+        clOrdID = params["clOrdID"]
+
     path = API_ROOT + path
 
     if life < 0:
         raise BitmexApiException("Request life of " + str(life) + " is negative")
 
-    url = urljoin(host, path)
-    if params:
-        _json_sanitize(params)
-        url = url + "?" + urlencode(params)
-    headers = _generate_headers(life, key, secret, verb, url, "")
-    response = requests.get(url, headers=headers)
-
-    responseData = loads(response.text)
-    if response.status_code == 200:  # Success
-        return responseData
-    else:                            # Error
-        raise BitmexApiException("%d %s: %s" % (response.status_code,
-                                                responseData["error"]["name"],
-                                                responseData["error"]["message"]))
+    return path, codec.dumps(params), clOrdID
 
 
 def _put_post_delete(host: str, key: str, secret: str, path: str, verb: str,
                      life: int = LIFE, **params):
     """
-    Send PUT, POST or DELETE request to BitMEX server.
+    Send PUT, POST or DELETE request to BitMEX server. Transient failures are
+    retried. New orders get clOrdID if they don't have one, so that a retried
+    order is looked up by it instead of being placed twice.
 
     host:   url of bitmex server (https:// has to be included)
     key:    api key id
@@ -166,32 +533,65 @@ def _put_post_delete(host: str, key: str, secret: str, path: str, verb: str,
 
     Returns response json as dict.
     """
-    path = API_ROOT + path
+    path, json, clOrdID = _body(path, verb, life, params)
+    reconcile = None
+    if clOrdID is not None:
 
-    if life < 0:
-        raise BitmexApiException("Request life of " + str(life) + " is negative")
+        def reconcile():
+            orders = _get(host, key, secret, "/order", life, filter={"clOrdID": clOrdID})
+            return orders[0] if orders else None
 
-    url = urljoin(host, path)
-    json = dumps(params)
-    print(json)  # DEBUG
-    headers = _generate_headers(life, key, secret, verb, url, json)
-    if verb == "PUT":
-        response = requests.put(url, headers=headers, data=json)
-    elif verb == "POST":
-        response = requests.post(url, headers=headers, data=json)
-    elif verb == "DELETE":
-        response = requests.delete(url, headers=headers, data=json)
-    else:
-        raise BitmexApiException("Internal Error: Unrecognized http operation: "
-                                 + str(verb) + " (should be all uppercase).")
+    return _request(verb, host, key, secret, path, json, life, reconcile)
+
+
+# Clock
+
+def sync_clock(host: str):
+    """
+    Measure server clock offset and round trip time precisely using
+    unauthenticated GET at api root, which returns server timestamp.
+
+    host:   url of bitmex server (https:// has to be included)
+    """
+    sent = time.time()
+    try:
+        response = _session().get(urljoin(host, API_ROOT), timeout=TIMEOUT)
+        received = time.time()
+        timestamp = codec.loads(response.content)["timestamp"]
+    except Exception as e:
+        raise BitmexApiException("Wasn't able to get server time: " + str(e))
+    if isinstance(timestamp, str):  # Datetime string
+        serverTime = _str_to_datetime(timestamp).replace(tzinfo=timezone.utc).timestamp()
+    else:                           # Milliseconds
+        serverTime = timestamp / 1000
+    _update_clock(host, serverTime, sent, received)
 
-    responseData = loads(response.text)
-    if response.status_code == 200:  # Success
-        return responseData
-    else:                            # Error
-        raise BitmexApiException("%d %s: %s" % (response.status_code,
-                                                responseData["error"]["name"],
-                                                responseData["error"]["message"]))
+
+def clock_offset(host: str):
+    """
+    Returns how many seconds is server clock estimated to be ahead of local
+    clock (0 before first response from host).
+    """
+    clock = _clocks.get(host)
+    return clock["offset"] if clock is not None else 0
+
+
+def clock_stats(host: str):
+    """
+    Get measured clock skew between this machine and server.
+
+    host:   url of bitmex server (https:// has to be included)
+
+    Returns {
+        "offset": float (seconds server clock is ahead of local clock),
+        "rtt": float (smoothed round trip time in seconds),
+        "samples": int
+    } or None if nothing was measured yet.
+    """
+    clock = _clocks.get(host)
+    if clock is None:
+        return None
+    return dict(clock)
 
 
 #
@@ -394,7 +794,36 @@ def order_cancel_all_after_post(host: str, key: str, secret: str, life: int = LI
 
     Returns empty dict.
     """
-    return _put_post_delete(host, key, secret, "/cancelAllAfter", "POST", life, **params)
+    return _put_post_delete(host, key, secret, "/order/cancelAllAfter", "POST", life, **params)
+
+
+# Execution
+
+def execution_trade_history_get(host: str, key: str, secret: str, life: int = LIFE,
+                                **params):
+    """
+    GET api call at /execution/tradeHistory.
+
+    Get executions which affected position of account.
+
+    str host:               url of bitmex server (https:// has to be included)
+    str key:                api key id
+    str secret:             api key secret
+    [int life]:             how many seconds before request expires
+
+    params:
+    [str symbol]:           filter by position symbol
+    [dict filter]:          dict, only retrieve for executions with matching columns
+    [list columns]:         truncate execution info to only contain these columns
+    [int count]:            limit how many executions to retrieve
+    [int start]:            skip this many executions
+    [bool reverse]:         if true, sort by newest first (default false)
+    [datetime startTime]:   don't show executions before this time
+    [datetime endTime]:     don't show executions after this time
+
+    Returns executions information dict list.
+    """
+    return _get(host, key, secret, "/execution/tradeHistory", life, **params)
 
 
 # Position
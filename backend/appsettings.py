@@ -0,0 +1,96 @@
+"""
+Saving and loading settings of the program itself (which background services
+run, see backend.services).
+"""
+
+from json import loads, dumps
+
+from backend.exceptions import BitmexException
+
+
+#
+# Constants
+#
+
+SAVEFILE = "./appsettings"
+
+
+#
+# Settings dict
+#
+
+_settings = {  # Stores loaded settings, values here are defaults
+    "store": True,  # Keep local store synced and answer views from it
+    "heartbeat": True,  # Run dead man's switch (see backend.heartbeat)
+}
+
+
+#
+# Functions
+#
+
+# Getters and setters
+
+def get_store():
+    """
+    Returns if local store is synced in background and views answer from it.
+    """
+    return _settings["store"]
+
+def set_store(enabled: bool):
+    """
+    Set if local store is synced in background and views answer from it.
+    """
+    _settings["store"] = enabled
+
+
+def get_heartbeat():
+    """
+    Returns if dead man's switch runs.
+    """
+    return _settings["heartbeat"]
+
+def set_heartbeat(enabled: bool):
+    """
+    Set if dead man's switch runs.
+    """
+    _settings["heartbeat"] = enabled
+
+
+# Manipulating with savefile
+
+def save(savefile: str = SAVEFILE):
+    """
+    Save settings to savefile. Warning: Replaces old savefile.
+    """
+    try:
+        f = open(savefile, "w")
+    except Exception as e:
+        raise BitmexException(str(e))
+
+    f.write(dumps(_settings))
+    f.close()
+
+def load(savefile: str = SAVEFILE):
+    """
+    Load settings from savefile. Settings missing in savefile keep their
+    defaults.
+    """
+    try:
+        f = open(savefile, "r")
+    except Exception as e:
+        raise BitmexException("Internal Error: " + str(e) + "Does '" +
+                              savefile + "' really exist?")
+
+    json = f.read()
+    f.close()
+
+    try:
+        dict = loads(json)
+    except Exception as e:
+        raise BitmexException("Internal Error: " + str(e) + "Is '" +
+                              savefile + "' really a settings savefile?")
+
+    for key in _settings.keys():
+        if key in dict.keys():
+            _settings[key] = dict[key]
@@ -1,5 +1,9 @@
 """
 Saving and loading bot settings.
+
+Settings without profile are used by the bot of the GUI. Named profiles hold
+settings of other bots (see multithreaded.botmanager), every getter and setter
+takes profile name as its last argument.
 """
 
 from json import loads, dumps
@@ -24,74 +28,149 @@ _settings = {  # Stores loaded settings, values here are defaults
     "tradeDiff": 1000,
     "closeDiff": 100,
     "account": "",
+    "quantity": 1,
+    "dryRun": True,
 }
+NEWER_KEYS = ("quantity", "dryRun")  # May be missing in older savefiles
+_profiles = {}  # Profile name -> settings dict like the one above
 
 
 #
 # Functions
 #
 
+# Profiles
+
+def _get(profile):
+    """
+    Returns settings dict of profile (None for settings without profile).
+    Raises BitmexBotException if profile doesn't exist.
+    """
+    if profile is None:
+        return _settings
+    if not profile in _profiles:
+        raise BitmexBotException("Bot settings profile '" + profile +
+                                 "' doesn't exist.")
+    return _profiles[profile]
+
+def new_profile(profile: str, **values):
+    """
+    Create profile with settings copied from settings without profile,
+    changed by values (keys of the settings dict). Replaces existing profile
+    of the same name.
+    """
+    for key in values.keys():
+        if not key in _settings.keys():
+            raise BitmexBotException("Unknown bot setting '" + key + "'.")
+    settings = dict(_settings)
+    settings.update(values)
+    _profiles[profile] = settings
+
+def delete_profile(profile: str):
+    """
+    Delete profile.
+    """
+    _get(profile)
+    del _profiles[profile]
+
+def get_profile_names():
+    """
+    Returns list of names of all profiles.
+    """
+    return sorted(_profiles.keys())
+
+def exists(profile: str):
+    """
+    Returns if profile exists.
+    """
+    return profile in _profiles
+
+
 # Getters and setters
 
-def get_first_contract():
+def get_first_contract(profile: str = None):
     """
     Returns configured symbol of first contract.
     """
-    return _settings["contract1"]
+    return _get(profile)["contract1"]
 
-def set_first_contract(symbol: str):
+def set_first_contract(symbol: str, profile: str = None):
     """
     Set symbol of first contract.
     """
-    _settings["contract1"] = symbol
+    _get(profile)["contract1"] = symbol
 
-def get_second_contract():
+def get_second_contract(profile: str = None):
     """
     Returns configured symbol of second contract.
     """
-    return _settings["contract2"]
+    return _get(profile)["contract2"]
 
-def set_second_contract(symbol: str):
+def set_second_contract(symbol: str, profile: str = None):
     """
     Set symbol of second contract.
     """
-    _settings["contract2"] = symbol
+    _get(profile)["contract2"] = symbol
 
-def get_trade_difference():
+def get_trade_difference(profile: str = None):
     """
     Returns difference between contract prices that will execute trade.
     """
-    return _settings["tradeDiff"]
+    return _get(profile)["tradeDiff"]
 
-def set_trade_difference(difference: int):
+def set_trade_difference(difference: int, profile: str = None):
     """
     Set difference between contract prices that will execute trade.
     """
-    _settings["tradeDiff"] = difference
+    _get(profile)["tradeDiff"] = difference
 
-def get_close_difference():
+def get_close_difference(profile: str = None):
     """
     Returns difference between contract prices that will close the trade.
     """
-    return _settings["closeDiff"]
+    return _get(profile)["closeDiff"]
 
-def set_close_difference(difference: int):
+def set_close_difference(difference: int, profile: str = None):
     """
     Set difference between contract prices that will close the trade.
     """
-    _settings["closeDiff"] = difference
+    _get(profile)["closeDiff"] = difference
 
-def get_account():
+def get_account(profile: str = None):
     """
     Returns name of account which bot is supposed to use.
     """
-    return _settings["account"]
+    return _get(profile)["account"]
 
-def set_account(accountName: str):
+def set_account(accountName: str, profile: str = None):
     """
     Set account (by its name) which bot is supposed to use.
     """
-    _settings["account"] = accountName
+    _get(profile)["account"] = accountName
+
+def get_quantity(profile: str = None):
+    """
+    Returns how many contracts bot trades in each leg.
+    """
+    return _get(profile)["quantity"]
+
+def set_quantity(quantity: int, profile: str = None):
+    """
+    Set how many contracts bot trades in each leg.
+    """
+    _get(profile)["quantity"] = quantity
+
+def get_dry_run(profile: str = None):
+    """
+    Returns if bot only simulates its orders (see backend.fakeexchange).
+    """
+    return _get(profile)["dryRun"]
+
+def set_dry_run(dryRun: bool, profile: str = None):
+    """
+    Set if bot only simulates its orders instead of sending them.
+    """
+    _get(profile)["dryRun"] = dryRun
 
 
 # Manipulating with savefile
@@ -105,12 +184,12 @@ def save(savefile: str = SAVEFILE):
     except Exception as e:
         raise BitmexBotException(str(e))
 
-    f.write(dumps(_settings))
+    f.write(dumps(dict(_settings, profiles=_profiles)))
     f.close()
 
 def load(savefile: str = SAVEFILE):
     """
-    Load settings from savefile.
+    Load settings (and profiles) from savefile.
     """
     try:
         f = open(savefile, "r")
@@ -128,9 +207,14 @@ def load(savefile: str = SAVEFILE):
                                  savefile + "' really a bot settings savefile?")
 
     for key in _settings.keys():
-        if not key in dict.keys():
+        if not key in dict.keys() and not key in NEWER_KEYS:
             raise BitmexBotException("Internal Error: The '" + savefile +
                                      "' savefile is incomplete.")
 
     for key in _settings.keys():
-        _settings[key] = dict[key]
+        if key in dict.keys():
+            _settings[key] = dict[key]
+
+    _profiles.clear()
+    for profile, values in dict.get("profiles", {}).items():
+        new_profile(profile, **{k: v for k, v in values.items() if k in _settings})
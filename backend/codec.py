@@ -0,0 +1,79 @@
+"""
+Encoding and decoding JSON exchanged with BitMEX. Uses orjson if it is
+installed, standard library json otherwise.
+"""
+
+import json
+
+from backend.exceptions import BitmexApiException
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+#
+# Functions
+#
+
+def loads(data):
+    """
+    Decode JSON straight from bytes (str is accepted too).
+
+    Returns decoded object.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """
+    Encode object to JSON.
+
+    Returns JSON as bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return bytes(json.dumps(obj), 'utf8')
+
+
+def dumps_str(obj):
+    """
+    Encode object to JSON.
+
+    Returns JSON as str.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf8')
+    return json.dumps(obj)
+
+
+def project(data, columns):
+    """
+    Drop all keys except columns from decoded dict or each dict of decoded list.
+    This copies every record after it was fully decoded, so it saves nothing.
+    Only asking the server for fewer columns (columns parameter of GET
+    requests) makes responses smaller and faster to decode. Meant for
+    verifying that code reads only the columns it requested.
+
+    data:       decoded dict or list of dicts
+    columns:    iterable of keys to keep
+
+    Returns projected dict or list of dicts. Raises BitmexApiException naming
+    requested columns some record is missing.
+    """
+    columns = tuple(columns)
+    items = [data] if isinstance(data, dict) else data
+    projected = []
+    for item in items:
+        try:
+            projected.append({x: item[x] for x in columns})
+        except KeyError:
+            missing = [x for x in columns if x not in item]
+            raise BitmexApiException("Response is missing requested columns: " +
+                                     ", ".join(missing))
+    if isinstance(data, dict):
+        return projected[0]
+    return projected
@@ -2,19 +2,66 @@
 Core functions. Should be simple enought to be directly used by user.
 """
 
+import threading
+
 from sys import exc_info
+from time import sleep, monotonic
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from utility import significant_figures
 
 import backend.api as api
 import backend.accounts as accounts
+import backend.instruments as instruments
+import backend.sizing as sizing
+import backend.store as store
+import backend.shards as shards
+import backend.metrics as metrics
+import backend.trace as trace
 from backend.exceptions import *
 
 
 # Constants
 
 HISTORY_COUNT = 20  # How many history orders to fetch
+PAGE_COUNT = 500  # How many records to fetch per request when paginating
+PAGE_DELAY = 1  # Seconds before next page of account whose rate limit is close
+PAGE_RATE_RESERVE = 10  # Requests left in rate limit below which pages are delayed
 SIGNIFICANT_FIGURES = 5  # When rounding ints and floats
+OPEN_STATUSES = ("New", "PartiallyFilled", "PendingNew", "PendingReplace")  # Orders
+                                                # with these statuses are open
+REGULAR_TYPES = ("Market", "Limit")  # Other order types are stop or take profit
+POSITION_COLUMNS = [  # Position fields read by position_info()
+    "symbol", "currentQty", "homeNotional", "foreignNotional", "avgEntryPrice",
+    "markPrice", "liquidationPrice", "posMargin", "crossMargin", "leverage",
+    "unrealisedPnl", "unrealisedRoePcnt", "realisedPnl", "riskLimit"
+]
+POSITION_ALL_COLUMNS = [  # Position fields read by position_info_all()
+    "symbol", "realisedPnl", "crossMargin", "leverage", "riskLimit"
+]
+ORDER_COLUMNS = [  # Order fields read by active_order_info() and stop_order_info()
+    "orderID", "symbol", "side", "orderQty", "price", "displayQty", "leavesQty",
+    "stopPx", "avgPx", "ordType", "ordStatus", "execInst", "transactTime"
+]
+INSTRUMENT_COLUMNS = [  # Instrument fields read by instrument_* functions
+    "symbol", "tickSize", "isInverse", "multiplier", "lastPrice", "bidPrice",
+    "midPrice", "askPrice"
+]
+MAX_WORKERS = 16  # How many requests may be waiting for the server at once
+MARGIN_MAX_AGE = 0  # Available margins fetched less than this many seconds ago
+                    # are reused when placing relative orders (0 never reuses)
+
+
+# Open orders snapshot
+
+_openOrders = {}  # Last known open orders of each account, see open_order_snapshot()
+_openOrdersLock = threading.Lock()  # Held while reading or changing _openOrders
+
+
+# Concurrency
+
+_executor = ThreadPoolExecutor(MAX_WORKERS)  # Sends requests of fan-out calls
+_margins = {}  # account name -> (monotonic time, available margin in bitcoins)
 
 
 #
@@ -32,105 +79,204 @@ def _tick_round(quantity, tick):
 
     Returns rounded number.
     """
-    return tick * round(float(quantity) / tick)
+    return round(tick * round(float(quantity) / tick), 10)  # Drop float noise
+
+
+def _instrument(accountName, symbol):
+    """
+    Get cached instrument metadata for checking orders before they are sent.
+
+    Returns instrument dict or None if it couldn't be found out.
+    """
+    try:
+        return instruments.get(accountName, symbol)
+    except Exception as e:
+        metrics.error("core", e)
+        return None
+
+
+def _round_prices(params, instrument):
+    """
+    Round price and stopPx in order parameters to instrument tick (in place).
+    """
+    tick = instrument.get("tickSize")
+    if not tick:
+        return
+    for field in ("price", "stopPx"):
+        if params.get(field) is not None:
+            params[field] = _tick_round(params[field], tick)
 
 
 # Api
 
-def _for_each_account(accountNames, call, **params):
+def _get_account(name, coreExc):
     """
-    Call to API for each account.
+    Get account by name, recording missing account in coreExc.
 
-    accountNames:   list of account names
+    Returns account dict or None.
+    """
+    account = accounts.get(name)
+    if account is None:
+        coreExc.accounts.append({"name": name})
+        coreExc.exceptions.append(BitmexAccountsException("Account '" + name +
+                                                          "' doesn't exist."))
+        coreExc.tracebacks.append(None)
+    return account
+
+
+def _submit(account, call, **params):
+    """
+    Start call to API for account on a worker thread (or in worker process
+    of the account if backend.shards is started and can run the call).
+
+    account:        account dict
     call:           api function
     params:         parameters for call
 
+    Returns (account dict, future of response) tuple.
+    """
+    if shards.is_running() and shards.can_run(call):  # Multi-process execution
+        return account, shards.submit(account, call, **params)
+    key = account["key"]
+    secret = account["secret"]
+    host = account["host"]
+    return account, _executor.submit(_traced_call, trace.current(), account["name"],
+                                     call, host, key, secret, **params)
+
+
+def _traced_call(parent, accountName, call, host, key, secret, **params):
+    """
+    Call to API inside a span carrying account name and symbol.
+    """
+    with trace.span(call.__name__, parent=parent, accountName=accountName,
+                    symbol=params.get("symbol")):
+        return call(host, key, secret, **params)
+
+
+def _gather(jobs, coreExc):
+    """
+    Wait for calls started by _submit().
+
+    jobs:           list of (account dict, future) tuples
+    coreExc:        BitmexCoreMultiException collecting failed calls
+
     Returns list of {"account": account dict, "response": response dict} for
     each successful call.
     """
     result = []
-    coreExc = BitmexCoreMultiException()
-    for name in accountNames:
+    for account, job in jobs:
         try:
-            account = accounts.get(name)
-        except Exception as e:
-            coreExc.exceptions.append(e)
-            coreExc.tracebacks.append(exc_info()[0])
-            continue
-        key = account["key"]
-        secret = account["secret"]
-        host = account["host"]
-        try:
-            response = call(host, key, secret, **params)
+            response = job.result()
             dict = {
                 "account": account,
                 "response": response
             }
             result.append(dict)
         except Exception as e:
+            metrics.error("core", e)
             coreExc.accounts.append(account)
             coreExc.exceptions.append(e)
             coreExc.tracebacks.append(exc_info()[0])
+    return result
+
+
+def _for_each_account(accountNames, call, **params):
+    """
+    Call to API for each account. Calls are sent concurrently. New orders get
+    prices rounded to instrument tick and are checked before being sent, raises
+    BitmexCoreException if the exchange would reject them.
+
+    accountNames:   list of account names
+    call:           api function
+    params:         parameters for call
+
+    Returns list of {"account": account dict, "response": response dict} for
+    each successful call.
+    """
+    names = accounts.resolve(accountNames)
+    if call is api.order_post and names:
+        check_order(names[0], params)
+    coreExc = BitmexCoreMultiException()
+    jobs = []
+    for name in names:
+        account = _get_account(name, coreExc)
+        if account is None:
+            continue
+        jobs.append(_submit(account, call, **params))
+    start = monotonic()
+    result = _gather(jobs, coreExc)
+    metrics.observe("bitmex_fanout_seconds", {"call": call.__name__}, monotonic() - start)
     if coreExc.exceptions:
         raise coreExc
     else:
         return result
 
 
+def _available_margins(accs, coreExc, maxAge=MARGIN_MAX_AGE):
+    """
+    Get available margin of each account (in bitcoins). Margins fetched less
+    than maxAge seconds ago are reused, the rest is fetched concurrently.
+
+    accs:           list of account dicts
+    coreExc:        BitmexCoreMultiException collecting failed calls
+    maxAge:         how old margins may be reused (in seconds)
+
+    Returns dict of account name -> available margin float for each account
+    whose margin is known.
+    """
+    result = {}
+    jobs = []
+    now = monotonic()
+    for account in accs:
+        cached = _margins.get(account["name"])
+        if cached is not None and now - cached[0] < maxAge:
+            result[account["name"]] = cached[1]
+        else:
+            jobs.append(_submit(account, api.user_margin_get, currency="XBt"))
+    for foo in _gather(jobs, coreExc):
+        available = foo["response"]["availableMargin"] * 1e-8
+        _margins[foo["account"]["name"]] = (monotonic(), available)
+        result[foo["account"]["name"]] = available
+    return result
+
+
 def _for_each_relative(accountNames, call, percent, marginPerContract,
-                       **params):
+                       maxMarginAge=MARGIN_MAX_AGE, **params):
     """
     Call to API for each account with orderQty parameter relative to each accounts
-    available margin (rounded to fit instrument tick).
+    available margin (rounded to fit instrument lot size, prices to its tick).
+    Margins of all accounts are fetched first, then all orders are sent
+    concurrently. Orders the exchange would reject fail without being sent.
 
     accountNames:       list of account names
     call:               api function
     percent:            order value = (percent / 100) * available margin
     marginPerContract:  how much margin is equal to one contract (in bitcoin)
+    maxMarginAge:       how old available margins may be reused (in seconds)
     params:             parameters for call
 
     Returns list of {"account": account dict, "response": response dict} for
     each successful call.
     """
-    result = []
     coreExc = BitmexCoreMultiException()
-    # Get instrument tick size
-    for name in accountNames:
-        # Get account
-        try:
-            account = accounts.get(name)
-        except Exception as e:
-            coreExc.exceptions.append(e)
-            coreExc.tracebacks.append(exc_info()[0])
-            continue
-        key = account["key"]
-        secret = account["secret"]
-        host = account["host"]
-        # Get account available margin
-        try:
-            available = account_available_margin(name)
-        except Exception as e:
-            coreExc.accounts.append(account)
-            coreExc.exceptions.append(e)
-            coreExc.tracebacks.append(exc_info()[0])
-            continue
-        # Compute order quantity
-        orderValue = percent / 100.0 * available  # * leverage
-        orderQty = orderValue / marginPerContract
-        orderQty = round(orderQty)
-        params["orderQty"] = orderQty
-        # Send api call
-        try:
-            response = call(host, key, secret, **params)
-            dict = {
-                "account": account,
-                "response": response
-            }
-            result.append(dict)
-        except Exception as e:
-            coreExc.accounts.append(account)
-            coreExc.exceptions.append(e)
-            coreExc.tracebacks.append(exc_info()[0])
+    # Get accounts
+    accs = []
+    for name in accounts.resolve(accountNames):
+        account = _get_account(name, coreExc)
+        if account is not None:
+            accs.append(account)
+    # Get available margins of all accounts at once
+    start = monotonic()
+    margins = _available_margins(accs, coreExc, maxMarginAge)
+    accs = [x for x in accs if x["name"] in margins]
+    # Send api calls (orders the exchange would reject aren't sent)
+    jobs = []
+    for account, orderQty in relative_quantities(accs, margins, percent,
+                                                 marginPerContract, params, coreExc):
+        jobs.append(_submit(account, call, orderQty=orderQty, **params))
+    result = _gather(jobs, coreExc)
+    metrics.observe("bitmex_fanout_seconds", {"call": call.__name__ + "_relative"},
+                    monotonic() - start)
     if coreExc.exceptions:
         raise coreExc
     else:
@@ -148,11 +294,12 @@ def _for_one_account(accountName, call, **params):
     Returns {"account": account dict, "response": response dict}.
     """
     # Get account
-    account = None
-    try:
-        account = accounts.get(accountName)
-    except Exception as e:
-        raise BitmexCoreException(str(e))
+    names = accounts.resolve([accountName])
+    if not names:
+        raise BitmexCoreException("Group '" + accountName + "' is empty.")
+    account = accounts.get(names[0])
+    if account is None:
+        raise BitmexCoreException("Account '" + accountName + "' doesn't exist.")
     key = account["key"]
     secret = account["secret"]
     host = account["host"]
@@ -165,14 +312,332 @@ def _for_one_account(accountName, call, **params):
             "response": response
         }
     except Exception as e:
+        metrics.error("core", e)
         raise BitmexCoreException(account["name"] + ":\n" + str(e))
         raise coreExc
 
 
+def _page_delay(accountName):
+    """
+    Returns how many seconds to wait before requesting next page for account.
+    Pages follow each other right away unless last response of the account
+    said its rate limit is close (unknown, i.e. in worker processes of
+    backend.shards, counts as not close).
+    """
+    remaining = metrics.get_gauge("bitmex_ratelimit_remaining", {"account": accountName})
+    if remaining is not None and remaining < PAGE_RATE_RESERVE:
+        return PAGE_DELAY
+    return 0
+
+
+def _for_each_paginated(accountNames, call, accountParams=None, pageSize=PAGE_COUNT,
+                        **params):
+    """
+    Call to API for each account in parallel, page by page. Pages are requested
+    through _submit(), next page of account once previous one arrived, so at
+    most one page per account waits in memory.
+
+    accountNames:   list of account names
+    call:           api function supporting start and count parameters
+    accountParams:  dict of account name -> additional parameters for call
+                    specific to that account
+    pageSize:       how many records to request at once
+    params:         parameters for call
+
+    Yields {"account": account name, "record": response record dict}. Raises
+    BitmexCoreMultiException after all other records were yielded if any
+    account failed. If the generator is closed before that, no more pages are
+    requested.
+    """
+    coreExc = BitmexCoreMultiException()
+    pending = {}  # future -> (account dict, start, params)
+    delayed = []  # (monotonic time when due, account dict, start, params)
+
+    def request(account, start, pageParams):
+        job = _submit(account, call, start=start, count=pageSize, **pageParams)
+        pending[job[1]] = (account, start, pageParams)
+
+    for name in accounts.resolve(accountNames):
+        account = _get_account(name, coreExc)
+        if account is None:
+            continue
+        pageParams = dict(params)
+        if accountParams and name in accountParams:
+            pageParams.update(accountParams[name])
+        request(account, 0, pageParams)
+
+    try:
+        while pending or delayed:
+            now = monotonic()
+            for item in [x for x in delayed if x[0] <= now]:
+                delayed.remove(item)
+                request(*item[1:])
+            timeout = min(x[0] for x in delayed) - now if delayed else None
+            if not pending:
+                sleep(max(0, timeout))
+                continue
+            finished, foo = wait(list(pending), timeout, FIRST_COMPLETED)
+            for future in finished:
+                account, start, pageParams = pending.pop(future)
+                try:
+                    page = future.result()
+                except Exception as e:
+                    metrics.error("core", e)
+                    coreExc.accounts.append(account)
+                    coreExc.exceptions.append(e)
+                    coreExc.tracebacks.append(exc_info()[0])
+                    continue
+                if len(page) == pageSize:  # Not last page yet
+                    delay = _page_delay(account["name"])
+                    if delay:
+                        delayed.append((monotonic() + delay, account,
+                                        start + pageSize, pageParams))
+                    else:
+                        request(account, start + pageSize, pageParams)
+                for record in page:
+                    yield {"account": account["name"], "record": record}
+    finally:
+        for future in pending:
+            future.cancel()
+    if coreExc.exceptions:
+        raise coreExc
+
+
+def _from_store(accountNames, get, **params):
+    """
+    Read records of each account from local store in the same shape as
+    _for_each_account() returns.
+
+    accountNames:   list of account names
+    get:            store function taking account name as first argument
+    params:         parameters for get
+
+    Returns list of {"account": account dict, "response": stored records}.
+    """
+    result = []
+    coreExc = BitmexCoreMultiException()
+    for name in accounts.resolve(accountNames):
+        account = accounts.get(name)
+        try:
+            response = get(name, **params)
+            if response is None:
+                raise BitmexCoreException("Nothing stored yet, sync first.")
+            result.append({
+                "account": account,
+                "response": response
+            })
+        except Exception as e:
+            coreExc.accounts.append(account)
+            coreExc.exceptions.append(e)
+            coreExc.tracebacks.append(exc_info()[0])
+    if coreExc.exceptions:
+        raise coreExc
+    else:
+        return result
+
+
+#
+# Fan-out
+#
+# For backend modules sending their own calls concurrently with core's ones
+# (i.e. through another exchange than backend.api).
+#
+
+def get_account(accountName, coreExc):
+    """
+    Get account by name, recording missing account in coreExc.
+
+    accountName:    name of account
+    coreExc:        BitmexCoreMultiException collecting failed accounts
+
+    Returns account dict or None.
+    """
+    return _get_account(accountName, coreExc)
+
+
+def submit(account, call, **params):
+    """
+    Start call to API for account on core's worker threads (or in worker
+    process of the account if backend.shards is started). Wait for it with
+    gather().
+
+    account:        account dict (see get_account())
+    call:           api function (or function of other exchange taking the
+                    same arguments)
+    params:         parameters for call
+
+    Returns (account dict, future of response) tuple.
+    """
+    return _submit(account, call, **params)
+
+
+def gather(jobs, coreExc):
+    """
+    Wait for calls started by submit().
+
+    jobs:           list of (account dict, future) tuples
+    coreExc:        BitmexCoreMultiException collecting failed calls
+
+    Returns list of {"account": account dict, "response": response dict} for
+    each successful call.
+    """
+    return _gather(jobs, coreExc)
+
+
+def check_order(accountName, params):
+    """
+    Round prices of new order to instrument tick and find out whether the
+    exchange would reject it, before it is sent to each account.
+
+    accountName:    name of account (for downloading instrument metadata)
+    params:         parameters of order (prices are rounded in place)
+
+    Raises BitmexCoreException if the exchange would reject the order. Orders
+    whose instrument couldn't be found out are let through.
+    """
+    if not params.get("symbol"):
+        return
+    instrument = _instrument(accountName, params["symbol"])
+    if instrument is None:
+        return
+    _round_prices(params, instrument)
+    reason = sizing.check(instrument, params.get("orderQty"), params.get("price"),
+                          params.get("stopPx"))
+    if reason is not None:
+        raise BitmexCoreException(reason)
+
+
+def relative_quantities(accs, margins, percent, marginPerContract, params, coreExc):
+    """
+    Compute order quantity of each account relative to its available margin,
+    rounded to instrument lot size and capped by its maximum order quantity.
+    Prices of the order are rounded to instrument tick.
+
+    accs:               list of account dicts
+    margins:            dict of account name -> available margin (in bitcoins)
+                        of each account in accs
+    percent:            order value = (percent / 100) * available margin
+    marginPerContract:  how much margin is equal to one contract (in bitcoin)
+    params:             parameters of order without orderQty (prices are
+                        rounded in place)
+    coreExc:            BitmexCoreMultiException collecting accounts whose
+                        order the exchange would reject
+
+    Returns list of (account dict, orderQty) tuples of orders to send.
+    """
+    instrument = None
+    if accs and params.get("symbol"):
+        instrument = _instrument(accs[0]["name"], params["symbol"])
+    if instrument is None:
+        return [(x, round(percent / 100.0 * margins[x["name"]] / marginPerContract))
+                for x in accs]  # * leverage
+    _round_prices(params, instrument)
+    quantities = sizing.quantities([margins[x["name"]] for x in accs], percent,
+                                   marginPerContract, instrument)
+    result = []
+    for account, orderQty in zip(accs, quantities):
+        reason = sizing.check(instrument, orderQty, params.get("price"),
+                              params.get("stopPx"))
+        if reason is not None:
+            coreExc.accounts.append(account)
+            coreExc.exceptions.append(BitmexCoreException(reason))
+            coreExc.tracebacks.append(None)
+        else:
+            result.append((account, orderQty))
+    return result
+
+
+#
+# Local store
+#
+
+def _sync_paginated(accountNames, call, table, put):
+    """
+    Download records newer than stored watermark of each account into store.
+
+    accountNames:   list of names of accounts to use
+    call:           paginated api function
+    table:          store table holding the records
+    put:            store function saving list of records of one account
+
+    Returns how many records were stored.
+    """
+    accountNames = accounts.resolve(accountNames)
+    accountParams = {}
+    for name in accountNames:
+        lastTime = store.watermark(table, name)
+        if lastTime is not None:
+            accountParams[name] = {"startTime": lastTime}
+    count = 0
+    buffers = {name: [] for name in accountNames}
+    try:
+        for item in _for_each_paginated(accountNames, call, accountParams):
+            buffer = buffers[item["account"]]
+            buffer.append(item["record"])
+            if len(buffer) >= PAGE_COUNT:
+                put(item["account"], buffer)
+                count += len(buffer)
+                buffer.clear()
+    finally:  # Keep what was downloaded even if some account failed
+        for name, buffer in buffers.items():
+            if buffer:
+                put(name, buffer)
+                count += len(buffer)
+    return count
+
+
+@trace.traced
+def sync_orders(accountNames):
+    """
+    Download orders changed since last sync of each account into local store.
+
+    accountNames:       list of names of accounts to use
+
+    Returns how many orders were stored.
+    """
+    return _sync_paginated(accountNames, api.order_get, "orders", store.put_orders)
+
+
+@trace.traced
+def sync_executions(accountNames):
+    """
+    Download executions newer than last sync of each account into local store.
+
+    accountNames:       list of names of accounts to use
+
+    Returns how many executions were stored.
+    """
+    return _sync_paginated(accountNames, api.execution_trade_history_get,
+                           "executions", store.put_executions)
+
+
+@trace.traced
+def sync_positions(accountNames):
+    """
+    Replace stored positions of each account with current ones.
+
+    accountNames:       list of names of accounts to use
+    """
+    for foo in _for_each_account(accountNames, api.position_get):
+        store.put_positions(foo["account"]["name"], foo["response"])
+
+
+@trace.traced
+def sync_margins(accountNames):
+    """
+    Store current margin snapshot of each account.
+
+    accountNames:       list of names of accounts to use
+    """
+    for foo in _for_each_account(accountNames, api.user_margin_get, currency="XBt"):
+        store.put_margin(foo["account"]["name"], foo["response"])
+
+
 #
 # Accounts
 #
 
+@trace.traced
 def account_available_margin(accountName):
     """
     Get available margin for account (in bitcoins).
@@ -185,14 +650,41 @@ def account_available_margin(accountName):
         "currency": "XBt"
     }
     response = _for_one_account(accountName, api.user_margin_get, **params)["response"]
-    return response["availableMargin"] * 1e-8
+    available = response["availableMargin"] * 1e-8
+    _margins[accountName] = (monotonic(), available)
+    return available
 
 
-def account_margin_stats(accountNames):
+def cached_available_margin(accountName):
+    """
+    Get last known available margin of account (in bitcoins) without asking
+    the server. Margins are remembered by account_available_margin(),
+    account_margin_stats() and relative orders.
+
+    Returns (seconds since it was fetched, available margin float) or None.
+    """
+    cached = _margins.get(accountName)
+    if cached is None:
+        return None
+    return monotonic() - cached[0], cached[1]
+
+
+def remember_available_margin(accountName, available):
+    """
+    Remember freshly fetched available margin of account (in bitcoins), so
+    that relative orders can reuse it (see cached_available_margin()).
+    """
+    _margins[accountName] = (monotonic(), available)
+
+
+@trace.traced
+def account_margin_stats(accountNames, fromStore=False):
     """
     Get account margin statistics for each account (monetary values in bitcoins).
 
     accountNames:       list of names of accounts to use
+    fromStore:          answer from local store instead of asking the server
+                        (see sync_margins())
 
     Returns list of {
         "account": str,
@@ -207,8 +699,14 @@ def account_margin_stats(accountNames):
         "currency": "XBt"
     }
 
-    data = _for_each_account(accountNames, api.user_margin_get, **params)
+    if fromStore:
+        data = _from_store(accountNames, store.get_margin)
+    else:
+        data = _for_each_account(accountNames, api.user_margin_get, **params)
     for foo in data:  # for each account
+        if not fromStore:  # Fresh margins can be reused by relative orders
+            _margins[foo["account"]["name"]] = (monotonic(),
+                                                foo["response"]["availableMargin"] * 1e-8)
         account = {
             "name": foo["account"]["name"],
             "stats": {
@@ -225,6 +723,7 @@ def account_margin_stats(accountNames):
 # Instruments
 #
 
+@trace.traced
 def instrument_price(accountName, symbol):
     """
     Get instruments last traded price, bid price, mid price and ask price.
@@ -240,7 +739,8 @@ def instrument_price(accountName, symbol):
     }
     """
     params = {
-        "symbol": symbol
+        "symbol": symbol,
+        "columns": INSTRUMENT_COLUMNS
     }
     instrument = _for_one_account(accountName, api.instrument_get, **params)["response"][0]
     return {
@@ -250,6 +750,7 @@ def instrument_price(accountName, symbol):
         "askPrice": instrument["askPrice"],
     }
 
+@trace.traced
 def instrument_tick(accountName, symbol):
     """
     Get instruments tick size.
@@ -260,12 +761,14 @@ def instrument_tick(accountName, symbol):
     Returns tick size float.
     """
     params = {
-        "symbol": symbol
+        "symbol": symbol,
+        "columns": INSTRUMENT_COLUMNS
     }
     response = _for_one_account(accountName, api.instrument_get, **params)["response"]
     return response[0]["tickSize"]
 
 
+@trace.traced
 def instrument_is_inverse(accountName, symbol):
     """
     Find out if instrument prices are in CURRENCY/BITCOIN (inversed)
@@ -276,12 +779,14 @@ def instrument_is_inverse(accountName, symbol):
     Returns true if inverse, false if not.
     """
     params = {
-        "symbol": symbol
+        "symbol": symbol,
+        "columns": INSTRUMENT_COLUMNS
     }
     response = _for_one_account(accountName, api.instrument_get, **params)["response"]
     return response[0]["isInverse"]
 
 
+@trace.traced
 def instrument_contract_value(accountName, symbol):
     """
     Get how much currency does one contract of specific instrument contain.
@@ -292,12 +797,14 @@ def instrument_contract_value(accountName, symbol):
     Returns contract value as float.
     """
     params = {
-        "symbol": symbol
+        "symbol": symbol,
+        "columns": INSTRUMENT_COLUMNS
     }
     response = _for_one_account(accountName, api.instrument_get, **params)["response"]
     return abs(response[0]["multiplier"] * 1e-8)
 
 
+@trace.traced
 def instrument_margin_per_contract(accountName, symbol, price,
                                    forceContractValue=None, forceInverse=None):
     """
@@ -339,6 +846,7 @@ def instrument_margin_per_contract(accountName, symbol, price,
     return marginPerContract
 
 
+@trace.traced
 def open_instruments(accountName):
     """
     Get all open instruments.
@@ -349,12 +857,13 @@ def open_instruments(accountName):
     """
     result = []
     response = _for_one_account(accountName, api.instrument_get,
-                                filter={"state": "Open"})["response"]
+                                filter={"state": "Open"}, columns=["symbol"])["response"]
     for instrument in response:
         result.append(instrument["symbol"])
     return result
 
 
+@trace.traced
 def instrument_info(accountNames):
     """
     Get info about all instruments of each account.
@@ -373,7 +882,8 @@ def instrument_info(accountNames):
     """
     result = []
     # Get all currently open instruments
-    data = _for_one_account(accountNames[0], api.instrument_get, filter={"state": "Open"})
+    data = _for_one_account(accountNames[0], api.instrument_get, filter={"state": "Open"},
+                            columns=["symbol"])
     # Get positions of each account (there won't be all though)
     data2 = position_info_all(accountNames)
     for foo in data2:  # for each account
@@ -413,6 +923,7 @@ def instrument_info(accountNames):
 
 # Limit
 
+@trace.traced
 def order_limit(accountNames, symbol, quantity, limitPrice, sell=False, hidden=False,
                 displayQty=0, timeInForce="GoodTillCancel", reduceOnly=False,
                 stopLoss=False, stopPrice=None, trigger="Last"):
@@ -472,6 +983,7 @@ def order_limit(accountNames, symbol, quantity, limitPrice, sell=False, hidden=F
         _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_limit_post_only(accountNames, symbol, quantity, limitPrice, sell=False,
                           reduceOnly=False, stopLoss=False, stopPrice=None,
                           trigger="Last"):
@@ -519,6 +1031,7 @@ def order_limit_post_only(accountNames, symbol, quantity, limitPrice, sell=False
         _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_stop_limit(accountNames, symbol, quantity, limitPrice, stopPrice,
                      sell=False, trigger="Last", closeOnTrigger=False,
                      hidden=False, displayQty=0, timeInForce="GoodTillCancel"):
@@ -573,6 +1086,7 @@ def order_stop_limit(accountNames, symbol, quantity, limitPrice, stopPrice,
     _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_stop_limit_post_only(accountNames, symbol, quantity, limitPrice, stopPrice,
                                sell=False, trigger="Last", closeOnTrigger=False):
     """
@@ -614,6 +1128,7 @@ def order_stop_limit_post_only(accountNames, symbol, quantity, limitPrice, stopP
     _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_take_profit_limit(accountNames, symbol, quantity, limitPrice, triggerPrice,
                             sell=False, trigger="Last", closeOnTrigger=False,
                             hidden=False, displayQty=0, timeInForce="GoodTillCancel"):
@@ -668,6 +1183,7 @@ def order_take_profit_limit(accountNames, symbol, quantity, limitPrice, triggerP
     _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_take_profit_limit_post_only(accountNames, symbol, quantity, limitPrice,
                                       triggerPrice, sell=False, trigger="Last",
                                       closeOnTrigger=False):
@@ -712,6 +1228,7 @@ def order_take_profit_limit_post_only(accountNames, symbol, quantity, limitPrice
 
 # Limit relative
 
+@trace.traced
 def order_limit_relative(accountNames, symbol, percent, limitPrice,
                          sell=False, hidden=False, displayQty=0,
                          timeInForce="GoodTillCancel", reduceOnly=False,
@@ -783,13 +1300,18 @@ def order_limit_relative(accountNames, symbol, percent, limitPrice,
             raise BitmexCoreException(str(trigger) + " isn't a valid trigger. " +
                                       "Choose from Mark, Last and Index.")
         params["execInst"] = ", ".join(execInst)
+        coreExc = BitmexCoreMultiException()
+        jobs = []
         for response in responses:
-            account = response["account"]["name"]
             orderQty = response["response"]["orderQty"]
-            params["orderQty"] = orderQty
-            _for_one_account(account, api.order_post, **params)
+            jobs.append(_submit(response["account"], api.order_post,
+                                orderQty=orderQty, **params))
+        _gather(jobs, coreExc)
+        if coreExc.exceptions:
+            raise coreExc
 
 
+@trace.traced
 def order_limit_relative_post_only(accountNames, symbol, percent, limitPrice,
                                    sell=False, reduceOnly=False,
                                    forceContractValue=None, forceInverse=None,
@@ -849,13 +1371,18 @@ def order_limit_relative_post_only(accountNames, symbol, percent, limitPrice,
         else:
             raise BitmexCoreException(str(trigger) + " isn't a valid trigger. " +
                                       "Choose from Mark, Last and Index.")
+        coreExc = BitmexCoreMultiException()
+        jobs = []
         for response in responses:
-            account = response["account"]["name"]
             orderQty = response["response"]["orderQty"]
-            params["orderQty"] = orderQty
-            _for_one_account(account, api.order_post, **params)
+            jobs.append(_submit(response["account"], api.order_post,
+                                orderQty=orderQty, **params))
+        _gather(jobs, coreExc)
+        if coreExc.exceptions:
+            raise coreExc
 
 
+@trace.traced
 def order_stop_limit_relative(accountNames, symbol, percent, limitPrice, stopPrice,
                               sell=False, trigger="Last", closeOnTrigger=False,
                               hidden=False, displayQty=0, timeInForce="GoodTillCancel",
@@ -925,6 +1452,7 @@ def order_stop_limit_relative(accountNames, symbol, percent, limitPrice, stopPri
                        **params)
 
 
+@trace.traced
 def order_stop_limit_relative_post_only(accountNames, symbol, percent, limitPrice,
                                         stopPrice, sell=False, trigger="Last",
                                         closeOnTrigger=False, forceContractValue=None,
@@ -982,6 +1510,7 @@ def order_stop_limit_relative_post_only(accountNames, symbol, percent, limitPric
                        **params)
 
 
+@trace.traced
 def order_take_profit_limit_relative(accountNames, symbol, percent, limitPrice,
                                      triggerPrice, forceContractValue=None, forceInverse=None,
                                      sell=False, trigger="Last", closeOnTrigger=False,
@@ -1051,6 +1580,7 @@ def order_take_profit_limit_relative(accountNames, symbol, percent, limitPrice,
                        **params)
 
 
+@trace.traced
 def order_take_profit_limit_relative_post_only(accountNames, symbol, percent, limitPrice,
                                                triggerPrice, forceContractValue=None,
                                                forceInverse=None, sell=False, trigger="Last",
@@ -1110,6 +1640,7 @@ def order_take_profit_limit_relative_post_only(accountNames, symbol, percent, li
 
 # Market
 
+@trace.traced
 def order_market(accountNames, symbol, quantity, sell=False, stopLoss=False,
                  stopPrice=None, trigger="Last"):
     """
@@ -1147,6 +1678,7 @@ def order_market(accountNames, symbol, quantity, sell=False, stopLoss=False,
         _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_stop_market(accountNames, symbol, quantity, stopPrice, sell=False,
                       trigger="Last", closeOnTrigger=False):
     """
@@ -1185,6 +1717,7 @@ def order_stop_market(accountNames, symbol, quantity, stopPrice, sell=False,
     _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_take_profit_market(accountNames, symbol, quantity, triggerPrice, sell=False,
                              trigger="Last", closeOnTrigger=False):
     """
@@ -1223,6 +1756,7 @@ def order_take_profit_market(accountNames, symbol, quantity, triggerPrice, sell=
     _for_each_account(accountNames, api.order_post, **params)
 
 
+@trace.traced
 def order_trailing_stop(accountNames, symbol, quantity, trailValue, sell=False,
                         trigger="Last", closeOnTrigger=False):
     """
@@ -1269,11 +1803,14 @@ def order_trailing_stop(accountNames, symbol, quantity, trailValue, sell=False,
 
 # Getting position info
 
-def position_info(accountNames):
+@trace.traced
+def position_info(accountNames, fromStore=False):
     """
     Get info about open positions of each account.
 
     accountNames:       list of names of accounts to use
+    fromStore:          answer from local store instead of asking the server
+                        (see sync_positions())
 
     Returns list of {
         "name": str,
@@ -1295,7 +1832,11 @@ def position_info(accountNames):
     }.
     """
     result = []
-    data = _for_each_account(accountNames, api.position_get, filter={"isOpen": True})
+    if fromStore:
+        data = _from_store(accountNames, store.get_positions, isOpen=True)
+    else:
+        data = _for_each_account(accountNames, api.position_get, filter={"isOpen": True},
+                                 columns=POSITION_COLUMNS)
     for foo in data:
         account = {
             "name": foo["account"]["name"],
@@ -1330,6 +1871,7 @@ def position_info(accountNames):
     return result
 
 
+@trace.traced
 def position_info_all(accountNames):
     """
     Get info about open and closed positions.
@@ -1347,7 +1889,7 @@ def position_info_all(accountNames):
     }.
     """
     result = []
-    data = _for_each_account(accountNames, api.position_get)
+    data = _for_each_account(accountNames, api.position_get, columns=POSITION_ALL_COLUMNS)
     for foo in data:
         account = {
             "name": foo["account"]["name"],
@@ -1376,6 +1918,7 @@ def position_info_all(accountNames):
 
 # Amending positions
 
+@trace.traced
 def position_leverage(accountNames, symbol, leverage):
     """
     Change leverage of position for each account.
@@ -1391,6 +1934,7 @@ def position_leverage(accountNames, symbol, leverage):
     _for_each_account(accountNames, api.position_leverage_post, **params)
 
 
+@trace.traced
 def position_risk_limit(accountNames, symbol, riskLimit):
     """
     Change leverage of position for each account.
@@ -1406,6 +1950,7 @@ def position_risk_limit(accountNames, symbol, riskLimit):
     _for_each_account(accountNames, api.position_risk_limit_post, **params)
 
 
+@trace.traced
 def position_transfer_margin(accountNames, symbol, amount):
     """
     Change leverage of position for each account. Warning: Doesn't work.
@@ -1427,11 +1972,128 @@ def position_transfer_margin(accountNames, symbol, amount):
 
 # Getting order info
 
-def active_order_info(accountNames):
+def _refresh_open_orders(accountNames, incremental=True):
+    """
+    Update in-memory open orders snapshots of each account from the server.
+    If incremental, only orders changed since last seen transactTime are
+    downloaded (page by page) and merged into the previous snapshot of the
+    account. Accounts without previous snapshot, or which had no orders in it
+    yet, get all their open orders instead.
+
+    accountNames:       list of names of accounts to use
+    incremental:        false to drop previous snapshots and fetch everything
+    """
+    accountParams = {}  # account name -> parameters of its requests
+    with _openOrdersLock:
+        for name in accountNames:
+            snapshot = _openOrders.get(name)
+            if incremental and snapshot is not None and snapshot["lastTime"] is not None:
+                accountParams[name] = {"startTime": snapshot["lastTime"]}
+            else:
+                accountParams[name] = {"filter": {"open": True}}
+
+    records = {name: [] for name in accountNames}
+    coreExc = None
+    try:
+        for item in _for_each_paginated(accountNames, api.order_get, accountParams,
+                                        columns=ORDER_COLUMNS):
+            records[item["account"]].append(item["record"])
+    except BitmexCoreMultiException as e:
+        coreExc = e
+    failed = set(x["name"] for x in coreExc.accounts) if coreExc else set()
+
+    # Merge responses into snapshots
+    with _openOrdersLock:
+        for name, orders in records.items():
+            if name in failed:  # Has to be downloaded whole next time
+                _openOrders.pop(name, None)
+                continue
+            if "startTime" in accountParams[name]:
+                snapshot = _openOrders.get(name)
+                if snapshot is None:  # Dropped by other thread meanwhile
+                    continue
+            else:
+                snapshot = {"orders": {}, "lastTime": None}
+                _openOrders[name] = snapshot
+            for order in orders:
+                if order["ordStatus"] in OPEN_STATUSES:
+                    snapshot["orders"][order["orderID"]] = order
+                else:  # Filled or canceled since last snapshot
+                    snapshot["orders"].pop(order["orderID"], None)
+                if snapshot["lastTime"] is None or order["transactTime"] > snapshot["lastTime"]:
+                    snapshot["lastTime"] = order["transactTime"]
+    if coreExc is not None:
+        raise coreExc
+
+
+def _snapshot_order(accountName, orderID):
+    """
+    Returns copy of order from open orders snapshot of account (None if it
+    isn't there).
+    """
+    with _openOrdersLock:
+        order = _openOrders.get(accountName, {"orders": {}})["orders"].get(orderID)
+        return dict(order) if order is not None else None
+
+
+@trace.traced
+def open_order_snapshot(accountNames, incremental=True, fromStore=False):
+    """
+    Get open orders of each account with one request per account and partition
+    them into regular and stop/take profit orders. Snapshot is kept in memory so
+    that both active and stop order views can be served by the same requests.
+    If incremental, only orders changed since last seen transactTime are
+    downloaded and merged into the previous snapshot of the account.
+
+    accountNames:       list of names of accounts to use
+    incremental:        false to drop previous snapshots and fetch everything
+    fromStore:          answer from local store instead of asking the server
+                        (see sync_orders())
+
+    Returns list of {
+        "name": str,
+        "orders": list of raw order dicts (Market and Limit),
+        "stopOrders": list of raw order dicts (all other types)
+    }.
+    """
+    accountNames = accounts.resolve(accountNames)
+    if fromStore:
+        for foo in _from_store(accountNames, store.get_orders, statuses=OPEN_STATUSES):
+            snapshot = {
+                "orders": {x["orderID"]: x for x in foo["response"]},
+                "lastTime": store.watermark("orders", foo["account"]["name"])
+            }
+            with _openOrdersLock:
+                _openOrders[foo["account"]["name"]] = snapshot
+    else:
+        _refresh_open_orders(accountNames, incremental)
+
+    # Partition in one pass
+    result = []
+    with _openOrdersLock:
+        for name in accountNames:
+            account = {
+                "name": name,
+                "orders": [],
+                "stopOrders": []
+            }
+            for order in _openOrders.get(name, {"orders": {}})["orders"].values():
+                if order["ordType"] in REGULAR_TYPES:
+                    account["orders"].append(dict(order))
+                else:
+                    account["stopOrders"].append(dict(order))
+            result.append(account)
+    return result
+
+
+@trace.traced
+def active_order_info(accountNames, snapshot=None):
     """
     Get info about active non-stop non-take-profit orders of each account.
 
     accountNames:       list of names of accounts to use
+    snapshot:           result of open_order_snapshot() to use instead of
+                        fetching a new one
 
     Returns list of {
         "name": str,
@@ -1453,15 +2115,14 @@ def active_order_info(accountNames):
     }.
     """
     result = []
-    data = _for_each_account(accountNames, api.order_get, filter={"open": True})
-    for foo in data:
+    if snapshot is None:
+        snapshot = open_order_snapshot(accountNames)
+    for foo in snapshot:
         account = {
-            "name": foo["account"]["name"],
+            "name": foo["name"],
             "orders": []
         }
-        for order in foo["response"]:
-            if not order["ordType"] in ("Market", "Limit"):  # Skip stop and take profit orders
-                continue
+        for order in foo["orders"]:
             if order["ordType"] == "Limit":
                 orderValue = instrument_margin_per_contract(accountNames[0], order["symbol"],
                                                             order["price"])
@@ -1488,11 +2149,14 @@ def active_order_info(accountNames):
     return result
 
 
-def stop_order_info(accountNames):
+@trace.traced
+def stop_order_info(accountNames, snapshot=None):
     """
     Get info about active stop and take profit orders of each account.
 
     accountNames:       list of names of accounts to use
+    snapshot:           result of open_order_snapshot() to use instead of
+                        fetching a new one
 
     Returns list of {
         "name": str,
@@ -1512,15 +2176,14 @@ def stop_order_info(accountNames):
     }.
     """
     result = []
-    data = _for_each_account(accountNames, api.order_get, filter={"open": True})
-    for foo in data:
+    if snapshot is None:
+        snapshot = open_order_snapshot(accountNames)
+    for foo in snapshot:
         account = {
-            "name": foo["account"]["name"],
+            "name": foo["name"],
             "orders": []
         }
-        for order in foo["response"]:
-            if order["ordType"] in ("Market", "Limit"):  # Only stop and take profit orders
-                continue
+        for order in foo["stopOrders"]:
             dict = {
                 "orderID": order["orderID"],
                 "symbol": order["symbol"],
@@ -1539,6 +2202,7 @@ def stop_order_info(accountNames):
     return result
 
 
+@trace.traced
 def history_order_info(accountNames):
     """
     Get info about non-active orders of each account.
@@ -1590,8 +2254,48 @@ def history_order_info(accountNames):
     return result
 
 
+def history_order_iter(accountNames, startTime=None, endTime=None):
+    """
+    Iterate over whole order history of each account. Accounts are fetched in
+    parallel page by page, so memory usage doesn't grow with history length.
+
+    accountNames:       list of names of accounts to use
+    startTime:          don't include orders before this datetime
+    endTime:            don't include orders after this datetime
+
+    Yields {"account": str, "record": raw order dict}.
+    """
+    params = {}
+    if startTime is not None:
+        params["startTime"] = startTime
+    if endTime is not None:
+        params["endTime"] = endTime
+    return _for_each_paginated(accountNames, api.order_get, **params)
+
+
+def trade_history_iter(accountNames, startTime=None, endTime=None):
+    """
+    Iterate over whole trade history (executions) of each account. Accounts are
+    fetched in parallel page by page, so memory usage doesn't grow with history
+    length.
+
+    accountNames:       list of names of accounts to use
+    startTime:          don't include executions before this datetime
+    endTime:            don't include executions after this datetime
+
+    Yields {"account": str, "record": raw execution dict}.
+    """
+    params = {}
+    if startTime is not None:
+        params["startTime"] = startTime
+    if endTime is not None:
+        params["endTime"] = endTime
+    return _for_each_paginated(accountNames, api.execution_trade_history_get, **params)
+
+
 # Amending orders
 
+@trace.traced
 def order_qty(accountName, orderID, qty):
     """
     Amend contract quantity of order.
@@ -1607,6 +2311,7 @@ def order_qty(accountName, orderID, qty):
     _for_one_account(accountName, api.order_put, **params)
 
 
+@trace.traced
 def order_price(accountName, orderID, orderPrice):
     """
     Amend limit price of order.
@@ -1622,6 +2327,7 @@ def order_price(accountName, orderID, orderPrice):
     _for_one_account(accountName, api.order_put, **params)
 
 
+@trace.traced
 def order_stop_price(accountName, orderID, stopPrice):
     """
     Amend stop price of order.
@@ -1637,6 +2343,130 @@ def order_stop_price(accountName, orderID, stopPrice):
     _for_one_account(accountName, api.order_put, **params)
 
 
+def _amend_each(host, key, secret, amendments):
+    """
+    Amend orders of one account one after another. Called on worker thread
+    by order_amend_many().
+
+    amendments:     list of (order id, dict of new values) tuples
+
+    Returns list of (order id, amended order dict or None, error str or None).
+    """
+    result = []
+    for orderID, values in amendments:
+        try:
+            order = api.order_put(host, key, secret, orderID=orderID, **values)
+            result.append((orderID, order, None))
+        except Exception as e:
+            metrics.error("core", e)
+            result.append((orderID, None, str(e)))
+    return result
+
+
+def plan_price_shift(orders, ticks=0, percent=0, stop=False):
+    """
+    Compute new prices of orders shifted by number of ticks and percentage of
+    their current price, rounded to instrument tick. Current prices are taken
+    from last open orders snapshot (see open_order_snapshot()), orders missing
+    in it are skipped.
+
+    orders:         list of (account name, order id) tuples
+    ticks:          shift by this many ticks (may be negative)
+    percent:        shift by this many percent (may be negative)
+    stop:           shift stop price instead of limit price
+
+    Returns list of (account name, order id, dict of new values) for
+    order_amend_many().
+    """
+    field = "stopPx" if stop else "price"
+    result = []
+    for name, orderID in orders:
+        order = _snapshot_order(name, orderID)
+        if order is None or order.get(field) is None:
+            continue
+        tick = instruments.get(name, order["symbol"])["tickSize"]
+        price = order[field] * (1 + percent / 100.0) + ticks * tick
+        price = _tick_round(price, tick)
+        if price > 0 and price != order[field]:
+            result.append((name, orderID, {field: price}))
+    return result
+
+
+def plan_qty_scale(orders, factor):
+    """
+    Compute new remaining quantities of orders multiplied by factor, rounded
+    to instrument lot size (at least one lot). Current quantities are taken
+    from last open orders snapshot (see open_order_snapshot()), orders missing
+    in it are skipped.
+
+    orders:         list of (account name, order id) tuples
+    factor:         multiply remaining quantity by this
+
+    Returns list of (account name, order id, dict of new values) for
+    order_amend_many().
+    """
+    result = []
+    for name, orderID in orders:
+        order = _snapshot_order(name, orderID)
+        if order is None:
+            continue
+        lot = instruments.get(name, order["symbol"]).get("lotSize") or 1
+        leavesQty = max(lot, sizing.round_to(order["leavesQty"] * factor, lot))
+        if leavesQty != order["leavesQty"]:
+            result.append((name, orderID, {"leavesQty": leavesQty}))
+    return result
+
+
+@trace.traced
+def order_amend_many(amendments):
+    """
+    Amend many orders at once. Orders of one account are amended one after
+    another, accounts are amended concurrently. Amended orders are merged into
+    the open orders snapshot right away.
+
+    amendments:     list of (account name, order id, dict of new values)
+                    tuples (see plan_price_shift() and plan_qty_scale())
+
+    Returns {
+        "succeeded": dict of account name -> number of amended orders,
+        "failed": dict of account name -> error message
+    }.
+    """
+    coreExc = BitmexCoreMultiException()
+    perAccount = {}  # account name -> list of (order id, values)
+    for name, orderID, values in amendments:
+        perAccount.setdefault(name, []).append((orderID, values))
+    jobs = []
+    for name, foo in perAccount.items():
+        account = _get_account(name, coreExc)
+        if account is None:
+            continue
+        jobs.append(_submit(account, _amend_each, amendments=foo))
+
+    result = {
+        "succeeded": {},
+        "failed": {}
+    }
+    for foo in _gather(jobs, coreExc):
+        name = foo["account"]["name"]
+        errors = []
+        for orderID, order, error in foo["response"]:
+            if error is not None:
+                errors.append(orderID + ": " + error)
+                continue
+            result["succeeded"][name] = result["succeeded"].get(name, 0) + 1
+            with _openOrdersLock:
+                snapshot = _openOrders.get(name)
+                if snapshot is not None and orderID in snapshot["orders"]:
+                    snapshot["orders"][orderID].update(order)
+        if errors:
+            result["failed"][name] = "\n".join(errors)
+    for account, e in zip(coreExc.accounts, coreExc.exceptions):
+        result["failed"][account["name"]] = str(e)
+    return result
+
+
+@trace.traced
 def order_cancel(accountName, orderID):
     """
     Cancel order.
@@ -1648,3 +2478,143 @@ def order_cancel(accountName, orderID):
         "orderID": orderID
     }
     _for_one_account(accountName, api.order_delete, **params)
+
+
+# Mass cancelling
+
+def _cancel_report(jobs, coreExc):
+    """
+    Wait for cancel calls started by _submit(). Account may have more calls
+    (one per order type), so it is in both succeeded and failed if only some
+    of them failed.
+
+    jobs:           list of (account dict, future) tuples
+    coreExc:        BitmexCoreMultiException with already failed accounts
+
+    Returns {
+        "succeeded": dict of account name -> number of cancelled orders,
+        "failed": dict of account name -> error messages of its failed calls
+                  joined by "; "
+    }.
+    """
+    result = {
+        "succeeded": {},
+        "failed": {}
+    }
+    for foo in _gather(jobs, coreExc):
+        name = foo["account"]["name"]
+        cancelled = [x for x in foo["response"] if x.get("ordStatus") == "Canceled"]
+        result["succeeded"][name] = result["succeeded"].get(name, 0) + len(cancelled)
+    for account, e in zip(coreExc.accounts, coreExc.exceptions):
+        name = account["name"]
+        if name in result["failed"]:
+            result["failed"][name] += "; " + str(e)
+        else:
+            result["failed"][name] = str(e)
+    return result
+
+
+@trace.traced
+def order_cancel_many(orders):
+    """
+    Cancel many orders at once. Orders of one account are cancelled with one
+    request, accounts are cancelled concurrently.
+
+    orders:         list of (account name, order id) tuples
+
+    Returns {
+        "succeeded": dict of account name -> number of cancelled orders,
+        "failed": dict of account name -> error message
+    }.
+    """
+    coreExc = BitmexCoreMultiException()
+    orderIDs = {}  # account name -> list of order ids
+    for name, orderID in orders:
+        orderIDs.setdefault(name, []).append(orderID)
+    jobs = []
+    for name, ids in orderIDs.items():
+        account = _get_account(name, coreExc)
+        if account is None:
+            continue
+        jobs.append(_submit(account, api.order_delete, orderID=",".join(ids)))
+    return _cancel_report(jobs, coreExc)
+
+
+@trace.traced
+def order_cancel_all(accountNames, symbol=None, side=None, ordType=None):
+    """
+    Cancel all open orders of each account, optionally only those matching
+    symbol, side and order type. One request per account, accounts are
+    cancelled concurrently.
+
+    accountNames:   list of account names
+    symbol:         only cancel orders of this symbol
+    side:           only cancel orders of this side ("Buy" or "Sell")
+    ordType:        only cancel orders of this type (i.e. "Limit") or list of
+                    types (one request per type, sent concurrently)
+
+    Returns {
+        "succeeded": dict of account name -> number of cancelled orders,
+        "failed": dict of account name -> error messages joined by "; "
+    }. Account is in both if only requests of some order types failed.
+    """
+    if ordType is None or isinstance(ordType, str):
+        ordType = [ordType]
+    cancels = []  # Parameters of each request of an account
+    for orderType in ordType:
+        params = {}
+        if symbol is not None:
+            params["symbol"] = symbol
+        filter = {}
+        if side is not None:
+            filter["side"] = side
+        if orderType is not None:
+            filter["ordType"] = orderType
+        if filter:
+            params["filter"] = filter
+        cancels.append(params)
+
+    coreExc = BitmexCoreMultiException()
+    jobs = []
+    for name in accounts.resolve(accountNames):
+        account = _get_account(name, coreExc)
+        if account is None:
+            continue
+        for params in cancels:
+            jobs.append(_submit(account, api.order_all_delete, **params))
+    return _cancel_report(jobs, coreExc)
+
+
+# Dead man's switch
+
+@trace.traced
+def order_cancel_all_after(accountNames, timeout, life=api.LIFE):
+    """
+    Set (or reset) server-side timer of each account, which cancels all its
+    orders when it runs out. Calls are sent concurrently.
+
+    accountNames:   list of account names
+    timeout:        milliseconds until orders are cancelled (0 turns timer off)
+    life:           seconds before requests expire (late timer reset is
+                    rejected by server instead of being applied)
+
+    Returns list of names of accounts whose timer was set.
+    """
+    result = _for_each_account(accountNames, api.order_cancel_all_after_post,
+                               life=life, timeout=timeout)
+    return [x["account"]["name"] for x in result]
+
+
+def accounts_with_open_orders(accountNames):
+    """
+    Returns names of accounts which had open orders in their last known open
+    orders snapshot (see open_order_snapshot()). Accounts without snapshot
+    are included, because they may have open orders.
+    """
+    result = []
+    with _openOrdersLock:
+        for name in accounts.resolve(accountNames):
+            snapshot = _openOrders.get(name)
+            if snapshot is None or snapshot["orders"]:
+                result.append(name)
+    return result
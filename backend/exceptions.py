@@ -37,6 +37,10 @@ class BitmexCoreMultiException(BitmexCoreException):
         return result
 
 
+class BitmexStoreException(BitmexException):
+    pass
+
+
 class BitmexGUIException(BitmexException):
     pass
 
@@ -0,0 +1,352 @@
+"""
+Execution algorithms. Slice one large parent order of each account into
+smaller child orders, either evenly over time (TWAP) or by visible size
+(iceberg, next child is placed once previous one fills). Steps run on the
+shared scheduler, every step polls children of all accounts and places the
+next ones concurrently.
+
+Orders are sent through exchange, an object with order_post, order_get and
+order_delete functions taking the same arguments as backend.api calls (the
+backend.api module itself by default, backend.fakeexchange for testing).
+"""
+
+import threading
+
+import backend.api as api
+import backend.core as core
+import backend.accounts as accounts
+import backend.instruments as instruments
+import backend.scheduler as scheduler
+import backend.sizing as sizing
+
+from backend.exceptions import *
+
+
+#
+# Constants
+#
+
+POLL_INTERVAL = 2  # Seconds between iceberg steps
+MAX_FAILURES = 3  # Failed calls in a row after which account is given up
+OPEN_STATUSES = core.OPEN_STATUSES
+
+
+#
+# Classes
+#
+
+class Execution:
+    """
+    Abstract class. Only for inheriting.
+
+    Parent order executed for each account. Inheriting classes decide when
+    and how big the next child order is in _next_qty().
+
+    accountNames:   list of account names and groups
+    symbol:         instrument symbol
+    quantity:       how many contracts to buy or sell in each account
+    sell:           true to sell, false to buy
+    limitPrice:     price of child limit orders (None for market orders)
+    lot:            lot size children are rounded to (None to look it up)
+    exchange:       object with api order calls (see module docstring)
+    """
+
+    def __init__(self, accountNames, symbol: str, quantity: int, sell: bool = False,
+                 limitPrice: float = None, lot: int = None, exchange=api):
+        self.symbol = symbol
+        self.quantity = quantity
+        self.sell = sell
+        self.limitPrice = limitPrice
+        self.exchange = exchange
+        self.lot = lot
+        self.interval = POLL_INTERVAL  # Seconds between steps
+        self.names = accounts.resolve(accountNames)
+        self.done = False
+        self.steps = 0
+        self._job = None
+        self._lock = threading.Lock()
+        self._state = {}  # account name -> see status()
+        self._abandoned = []  # Names of accounts given up since last step
+        for name in self.names:
+            self._state[name] = {
+                "filled": 0,
+                "working": None,  # orderID of open child order
+                "children": 0,
+                "failures": 0,
+                "error": None
+            }
+
+    # Internal methods
+
+    def _call_each(self, calls):
+        """
+        Call exchange for many accounts concurrently.
+
+        calls:      list of (account name, function, params dict)
+
+        Returns dict of account name -> response. Failed calls and calls
+        which found no order (empty response) are left out and retried by
+        following steps, account is given up after MAX_FAILURES failures in
+        a row (see _fail()).
+        """
+        coreExc = BitmexCoreMultiException()
+        jobs = []
+        for name, function, params in calls:
+            account = core.get_account(name, coreExc)
+            if account is not None:
+                jobs.append(core.submit(account, function, **params))
+        result = {}
+        for foo in core.gather(jobs, coreExc):
+            name = foo["account"]["name"]
+            if not foo["response"]:  # i.e. child order wasn't found
+                self._fail(name, BitmexCoreException(
+                    "Order " + str(self._state[name]["working"]) + " not found."))
+                continue
+            result[name] = foo["response"]
+            self._state[name]["failures"] = 0
+        for account, e in zip(coreExc.accounts, coreExc.exceptions):
+            self._fail(account["name"], e)
+        return result
+
+    def _fail(self, name, exception):
+        """
+        Count failed call of account. Accounts which don't exist or failed
+        MAX_FAILURES times in a row are given up, their working children are
+        cancelled at the end of the step.
+        """
+        state = self._state[name]
+        state["failures"] += 1
+        if state["error"] is not None:
+            return
+        if (state["failures"] >= MAX_FAILURES or
+                isinstance(exception, BitmexAccountsException)):
+            state["error"] = str(exception)
+            self._abandoned.append(name)
+
+    def _abandon(self):
+        """
+        Cancel working children of accounts given up during the step, so
+        that nothing keeps resting in the book on their behalf.
+        """
+        abandoned = self._abandoned
+        self._abandoned = []
+        self._cancel([(x, self._state[x]["working"]) for x in abandoned
+                      if self._state[x]["working"]])
+
+    def _poll(self):
+        """
+        Update fills of working children of all accounts. Children still open
+        which are due to be replaced are cancelled (their fills are counted
+        from the cancel response, so nothing filled in between is missed).
+        """
+        working = [(x, y["working"]) for x, y in self._state.items() if y["working"]]
+        calls = [(x, self.exchange.order_get, {"filter": {"orderID": y}})
+                 for x, y in working]
+        responses = self._call_each(calls)
+        cancel = []
+        for name, orderID in working:
+            orders = responses.get(name)
+            if orders is None:  # Failed, counted by _call_each()
+                continue
+            if orders[0]["ordStatus"] not in OPEN_STATUSES:
+                self._state[name]["filled"] += orders[0].get("cumQty", 0)
+                self._state[name]["working"] = None
+            elif self._replace_open():
+                cancel.append((name, orderID))
+        self._cancel(cancel)
+
+    def _cancel(self, children):
+        """
+        Cancel children and count their fills.
+
+        children:   list of (account name, orderID)
+        """
+        responses = self._call_each([(x, self.exchange.order_delete, {"orderID": y})
+                                     for x, y in children])
+        for name, orderID in children:
+            if responses.get(name):
+                self._state[name]["filled"] += responses[name][0].get("cumQty", 0)
+                self._state[name]["working"] = None
+
+    def _place(self):
+        """
+        Place next child order of each account which has none working.
+        """
+        calls = []
+        for name, state in self._state.items():
+            if state["working"] or state["error"]:
+                continue
+            qty = self._next_qty(self.quantity - state["filled"])
+            qty = sizing.round_to(qty, self.lot)
+            qty = min(qty, self.quantity - state["filled"])
+            if qty <= 0:
+                continue
+            params = {
+                "symbol": self.symbol,
+                "orderQty": qty,
+                "side": "Sell" if self.sell else "Buy"
+            }
+            if self.limitPrice is None:
+                params["ordType"] = "Market"
+            else:
+                params["ordType"] = "Limit"
+                params["price"] = self.limitPrice
+            calls.append((name, self.exchange.order_post, params))
+        for name, order in self._call_each(calls).items():
+            state = self._state[name]
+            state["children"] += 1
+            if order["ordStatus"] in OPEN_STATUSES:
+                state["working"] = order["orderID"]
+            else:
+                state["filled"] += order.get("cumQty", 0)
+
+    def _step(self):
+        """
+        One step of execution. Called by scheduler.
+        """
+        with self._lock:
+            if self.done:
+                return
+            self._poll()
+            self._place()
+            self._abandon()
+            self.steps += 1
+            if self._finished():
+                self._stop()
+
+    def _finished(self):
+        """
+        Returns true if no account has anything more to do.
+        """
+        return all(x["error"] or (not x["working"] and x["filled"] >= self.quantity)
+                   for x in self._state.values())
+
+    def _stop(self):
+        """
+        Stop scheduled steps. Caller holds lock.
+        """
+        self.done = True
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def _next_qty(self, remaining):
+        """
+        Returns size of next child order. Should be overridden.
+        """
+        return remaining
+
+    def _replace_open(self):
+        """
+        Returns if children still open at step should be cancelled and
+        replaced. Can be overridden.
+        """
+        return False
+
+    # Methods
+
+    def start(self):
+        """
+        Start execution on the shared scheduler. First step is taken right away.
+        """
+        if self.lot is None:
+            try:
+                self.lot = instruments.get(self.names[0], self.symbol)["lotSize"] or 1
+            except Exception:
+                self.lot = 1
+        with self._lock:  # First step waits until job is remembered
+            self._job = scheduler.every(self.interval, self._step, delay=0)
+
+    def step(self):
+        """
+        Take one step right away (without scheduler).
+        """
+        if self.lot is None:
+            self.lot = 1
+        self._step()
+
+    def cancel(self):
+        """
+        Stop execution and cancel working children of all accounts.
+        """
+        with self._lock:
+            self._stop()
+            self._cancel([(x, y["working"]) for x, y in self._state.items()
+                          if y["working"]])
+
+    def status(self):
+        """
+        Returns {
+            "done": bool,
+            "steps": int,
+            "accounts": dict of account name -> {
+                "filled": int (contracts filled so far),
+                "working": str or None (orderID of open child order),
+                "children": int (how many child orders were placed),
+                "failures": int (failed calls in a row, retried next step),
+                "error": str or None (account stopped because of this error)
+            }
+        }.
+        """
+        with self._lock:
+            return {
+                "done": self.done,
+                "steps": self.steps,
+                "accounts": {k: dict(v) for k, v in self._state.items()}
+            }
+
+
+class TWAP(Execution):
+    """
+    Time-weighted execution. Parent order is split into equal slices sent
+    every duration / slices seconds. Limit children which aren't filled by
+    the next slice are cancelled and their rest is added to the next slice.
+
+    duration:       seconds over which the order is executed
+    slices:         how many child orders to send
+    """
+
+    def __init__(self, accountNames, symbol: str, quantity: int, duration: float,
+                 slices: int, sell: bool = False, limitPrice: float = None,
+                 lot: int = None, exchange=api):
+        Execution.__init__(self, accountNames, symbol, quantity, sell, limitPrice, lot,
+                           exchange)
+        self.slices = max(1, slices)
+        self.interval = duration / self.slices
+
+    def _next_qty(self, remaining):
+        slicesLeft = self.slices - self.steps
+        if slicesLeft <= 0:
+            return 0
+        return remaining / slicesLeft
+
+    def _replace_open(self):
+        return True
+
+    def _finished(self):
+        if Execution._finished(self):
+            return True
+        # Last slice had one interval to fill, its rest was cancelled
+        return self.steps >= self.slices and not any(x["working"] for x in
+                                                     self._state.values())
+
+
+class Iceberg(Execution):
+    """
+    Iceberg execution. Only one child of visible size is resting in the book,
+    next one is placed once it fills, until the whole parent order is filled.
+
+    visibleQty:     size of each child order
+    interval:       seconds between checks for fills
+    """
+
+    def __init__(self, accountNames, symbol: str, quantity: int, visibleQty: int,
+                 limitPrice: float, sell: bool = False, interval: float = POLL_INTERVAL,
+                 lot: int = None, exchange=api):
+        Execution.__init__(self, accountNames, symbol, quantity, sell, limitPrice, lot,
+                           exchange)
+        self.visibleQty = visibleQty
+        self.interval = interval
+
+    def _next_qty(self, remaining):
+        return min(self.visibleQty, remaining)
@@ -0,0 +1,105 @@
+"""
+Exporting order and trade history to files.
+"""
+
+import csv
+import gzip
+
+from json import dumps
+
+from backend.exceptions import BitmexCoreException
+
+
+#
+# Constants
+#
+
+CSV_COLUMNS = (  # Default columns of csv export
+    "account",
+    "orderID",
+    "execID",
+    "symbol",
+    "side",
+    "orderQty",
+    "price",
+    "stopPx",
+    "ordType",
+    "ordStatus",
+    "execType",
+    "lastQty",
+    "lastPx",
+    "avgPx",
+    "execInst",
+    "transactTime"
+)
+
+
+#
+# Functions
+#
+
+# Utility
+
+def _open(savefile: str):
+    """
+    Open savefile for writing text. Files ending with .gz are gzip compressed.
+    """
+    try:
+        if savefile.endswith(".gz"):
+            return gzip.open(savefile, "wt", newline="")
+        return open(savefile, "w", newline="")
+    except Exception as e:
+        raise BitmexCoreException(str(e))
+
+
+# Exporting
+
+def export_jsonl(records, savefile: str):
+    """
+    Write records one JSON object per line. Records are consumed lazily, so
+    generators from core.history_order_iter() and core.trade_history_iter() can
+    be exported in constant memory. Warning: Replaces old savefile.
+
+    records:    iterable of {"account": str, "record": dict}
+    savefile:   location of savefile (.gz for compression)
+
+    Returns how many records were written.
+    """
+    count = 0
+    f = _open(savefile)
+    try:
+        for item in records:
+            line = dict(item["record"])
+            line["account"] = item["account"]
+            f.write(dumps(line) + "\n")
+            count += 1
+    finally:
+        f.close()
+    return count
+
+
+def export_csv(records, savefile: str, columns=CSV_COLUMNS):
+    """
+    Write records as CSV rows. Records are consumed lazily, so generators from
+    core.history_order_iter() and core.trade_history_iter() can be exported in
+    constant memory. Warning: Replaces old savefile.
+
+    records:    iterable of {"account": str, "record": dict}
+    savefile:   location of savefile (.gz for compression)
+    columns:    which fields of records to write (missing ones are left blank)
+
+    Returns how many records were written.
+    """
+    count = 0
+    f = _open(savefile)
+    try:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for item in records:
+            row = dict(item["record"])
+            row["account"] = item["account"]
+            writer.writerow(row)
+            count += 1
+    finally:
+        f.close()
+    return count
@@ -0,0 +1,187 @@
+"""
+Local in-memory stand-in for the BitMEX order api. Its methods take the same
+arguments as the backend.api order calls, so code which accepts api functions
+(execution algorithms, bots in dry-run mode) can be run against it without
+sending anything to the server.
+"""
+
+import uuid
+import threading
+
+from datetime import datetime, timezone
+
+from backend.exceptions import BitmexApiException
+
+
+#
+# Classes
+#
+
+class FakeExchange:
+    """
+    Fake exchange. Market orders fill right away at current price of their
+    symbol, limit orders fill once the price reaches them. Orders are kept per
+    api key, so accounts don't see each others orders.
+
+    price:      current price of instruments without a price of their own
+    """
+
+    def __init__(self, price: float = 100.0):
+        self.price = price
+        self.prices = {}  # symbol -> current price (see set_price())
+        self.orders = {}  # orderID -> order dict
+        self.posted = 0  # How many orders were placed
+        self._lock = threading.Lock()
+
+    # Internal methods
+
+    def _fill(self, order):
+        """
+        Fill order if it is marketable at current price. Caller holds lock.
+        Internal method.
+        """
+        if order["ordStatus"] not in ("New", "PartiallyFilled"):
+            return
+        price = self.prices.get(order["symbol"], self.price)
+        if order["ordType"] == "Limit":
+            if order["side"] == "Buy" and order["price"] < price:
+                return
+            if order["side"] == "Sell" and order["price"] > price:
+                return
+        order["avgPx"] = price if order["ordType"] != "Limit" else order["price"]
+        order["cumQty"] = order["orderQty"]
+        order["leavesQty"] = 0
+        order["ordStatus"] = "Filled"
+        order["transactTime"] = self._now()
+
+    def _now(self):
+        """
+        Returns current time in api format.
+        Internal method.
+        """
+        return datetime.now(timezone.utc).isoformat()
+
+    def _get_order(self, key, orderID):
+        """
+        Returns order of api key, raises BitmexApiException if there isn't one.
+        Internal method.
+        """
+        order = self.orders.get(orderID)
+        if order is None or order["_key"] != key:
+            raise BitmexApiException("404 Not Found: Order " + str(orderID) +
+                                     " doesn't exist.")
+        return order
+
+    def _public(self, order):
+        """
+        Returns copy of order without internal fields.
+        Internal method.
+        """
+        return {k: v for k, v in order.items() if not k.startswith("_")}
+
+    # Market
+
+    def set_price(self, price: float, symbol: str = None):
+        """
+        Move price of instrument with symbol (of all instruments without their
+        own price if symbol is None), filling limit orders it reaches.
+        """
+        with self._lock:
+            if symbol is None:
+                self.price = price
+            else:
+                self.prices[symbol] = price
+            for order in self.orders.values():
+                self._fill(order)
+
+    # Api calls
+
+    def order_post(self, host: str, key: str, secret: str, life: int = None, **params):
+        """
+        Place order. See api.order_post().
+        """
+        qty = params.get("orderQty", 0)
+        if not qty:
+            raise BitmexApiException("400 ValidationError: Invalid orderQty")
+        side = params.get("side") or ("Buy" if qty > 0 else "Sell")
+        ordType = params.get("ordType") or ("Limit" if "price" in params else "Market")
+        with self._lock:
+            order = {
+                "_key": key,
+                "orderID": str(uuid.uuid4()),
+                "clOrdID": params.get("clOrdID", ""),
+                "symbol": params.get("symbol"),
+                "side": side,
+                "orderQty": abs(qty),
+                "price": params.get("price"),
+                "displayQty": params.get("displayQty"),
+                "stopPx": params.get("stopPx"),
+                "ordType": ordType,
+                "execInst": params.get("execInst", ""),
+                "ordStatus": "New",
+                "cumQty": 0,
+                "leavesQty": abs(qty),
+                "avgPx": None,
+                "transactTime": self._now()
+            }
+            self.orders[order["orderID"]] = order
+            self.posted += 1
+            self._fill(order)
+            return self._public(order)
+
+    def order_get(self, host: str, key: str, secret: str, life: int = None, **params):
+        """
+        List orders of api key. Supports filter by orderID, ordStatus, open
+        and symbol. See api.order_get().
+        """
+        filter = dict(params.get("filter") or {})
+        if params.get("symbol"):
+            filter["symbol"] = params["symbol"]
+        result = []
+        with self._lock:
+            for order in self.orders.values():
+                if order["_key"] != key:
+                    continue
+                if filter.get("open") and order["ordStatus"] not in ("New",
+                                                                    "PartiallyFilled"):
+                    continue
+                if any(order.get(k) != v for k, v in filter.items() if k != "open"):
+                    continue
+                result.append(self._public(order))
+        return result
+
+    def order_put(self, host: str, key: str, secret: str, life: int = None, **params):
+        """
+        Amend open order. See api.order_put().
+        """
+        with self._lock:
+            order = self._get_order(key, params.get("orderID"))
+            if order["ordStatus"] not in ("New", "PartiallyFilled"):
+                raise BitmexApiException("400 Invalid ordStatus")
+            for field in ("price", "stopPx"):
+                if field in params:
+                    order[field] = params[field]
+            if "orderQty" in params:
+                order["orderQty"] = params["orderQty"]
+                order["leavesQty"] = params["orderQty"] - order["cumQty"]
+            if "leavesQty" in params:
+                order["leavesQty"] = params["leavesQty"]
+                order["orderQty"] = order["cumQty"] + params["leavesQty"]
+            order["transactTime"] = self._now()
+            self._fill(order)
+            return self._public(order)
+
+    def order_delete(self, host: str, key: str, secret: str, life: int = None, **params):
+        """
+        Cancel orders (orderID separated with commas). See api.order_delete().
+        """
+        result = []
+        with self._lock:
+            for orderID in str(params.get("orderID", "")).split(","):
+                order = self._get_order(key, orderID)
+                if order["ordStatus"] in ("New", "PartiallyFilled"):
+                    order["ordStatus"] = "Canceled"
+                    order["leavesQty"] = 0
+                    order["transactTime"] = self._now()
+                result.append(self._public(order))
+        return result
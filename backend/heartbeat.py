@@ -0,0 +1,175 @@
+"""
+Dead man's switch. Periodically resets BitMEX cancelAllAfter timer of every
+account with open orders, so that if this program or its network connection
+dies, resting orders are cancelled by the server once the timer runs out.
+
+Heartbeats of all accounts are sent as one concurrent batch on the shared
+scheduler, so one heartbeat takes about one round trip regardless of how many
+accounts there are. Open orders are refreshed incrementally before every
+heartbeat, so orders placed since the last one keep their account armed.
+"""
+
+import threading
+
+from time import monotonic
+
+import backend.core as core
+import backend.accounts as accounts
+import backend.scheduler as scheduler
+import backend.metrics as metrics
+
+from backend.exceptions import BitmexCoreMultiException
+
+
+#
+# Constants
+#
+
+INTERVAL = 15  # Seconds between heartbeats
+TIMEOUT = 60  # Seconds after last heartbeat when orders get cancelled
+JITTER = 2  # Heartbeats are sent randomly up to this many seconds sooner or later
+REQUEST_LIFE = 5  # Seconds before heartbeat request expires
+
+
+#
+# State
+#
+
+_job = None  # Scheduled scheduler.Job
+_lock = threading.Lock()  # Held while reading or changing state, never during requests
+_beatLock = threading.Lock()  # Held during heartbeat requests, so that they don't overlap
+_settings = {}  # Parameters of running heartbeat, see start()
+_armed = set()  # Names of accounts whose timer is currently set
+_status = {  # See status()
+    "lastBeat": None,
+    "armed": [],
+    "failed": {}
+}
+
+
+#
+# Internal functions
+#
+
+def _beat():
+    """
+    Reset timers of accounts with open orders and turn off timers of accounts
+    which don't have open orders anymore. Called by scheduler.
+    """
+    with _beatLock:
+        with _lock:
+            if _job is None:  # Stopped meanwhile
+                return
+            accountNames = _settings["accountNames"]
+            timeout = int(_settings["timeout"] * 1000)
+            life = _settings["life"]
+            armed = set(_armed)
+        if accountNames is None:
+            accountNames = accounts.get_names()
+
+        try:
+            core.open_order_snapshot(accountNames)
+        except BitmexCoreMultiException as e:
+            # Snapshots of failed accounts are dropped, so they stay armed
+            metrics.error("heartbeat", e)
+        names = core.accounts_with_open_orders(accountNames)
+        disarm = [x for x in armed if x not in names]
+        failed = {}
+        rearmed = []
+        disarmed = []
+        for batch, batchTimeout, done in ((names, timeout, rearmed),
+                                          (disarm, 0, disarmed)):
+            if not batch:
+                continue
+            try:
+                done.extend(core.order_cancel_all_after(batch, batchTimeout, life))
+            except BitmexCoreMultiException as e:
+                failed.update({x["name"]: str(y) for x, y in zip(e.accounts,
+                                                                  e.exceptions)})
+                done.extend(x for x in batch if x not in failed)
+
+        with _lock:
+            _armed.update(rearmed)
+            _armed.difference_update(disarmed)
+            metrics.set_gauge("bitmex_heartbeat_armed_accounts", {}, len(_armed))
+            _status["lastBeat"] = monotonic()
+            _status["armed"] = sorted(_armed)
+            _status["failed"] = failed
+
+
+#
+# Functions
+#
+
+def start(accountNames=None, interval: float = INTERVAL, timeout: float = TIMEOUT,
+          jitter: float = JITTER, life: int = REQUEST_LIFE):
+    """
+    Start sending heartbeats. Restarts heartbeat if it is already running.
+
+    accountNames:   list of account names and groups to watch (defaults to all
+                    accounts, including ones added later)
+    interval:       seconds between heartbeats
+    timeout:        seconds after last heartbeat when orders get cancelled
+                    (should be a few intervals, so that one lost heartbeat
+                    doesn't cancel anything)
+    jitter:         heartbeats are sent randomly up to this many seconds
+                    sooner or later
+    life:           seconds before heartbeat request expires
+    """
+    global _job
+    stop(disarm=False)
+    with _lock:
+        _settings["accountNames"] = accountNames
+        _settings["timeout"] = timeout
+        _settings["life"] = life
+        _job = scheduler.every(interval, _beat, jitter=jitter, delay=0)
+
+
+def stop(disarm: bool = True):
+    """
+    Stop sending heartbeats.
+
+    disarm:     also turn off timers of all accounts, so that their orders
+                stay open
+    """
+    global _job
+    with _lock:
+        if _job is not None:
+            _job.cancel()
+            _job = None
+    with _beatLock:  # Wait for running heartbeat
+        with _lock:
+            armed = list(_armed) if disarm else []
+        if not armed:
+            return
+        try:
+            done = core.order_cancel_all_after(armed, 0)
+        except BitmexCoreMultiException as e:
+            failed = [x["name"] for x in e.accounts]
+            done = [x for x in armed if x not in failed]
+        with _lock:
+            _armed.difference_update(done)
+            _status["armed"] = sorted(_armed)
+
+
+def is_running():
+    """
+    Returns if heartbeats are being sent.
+    """
+    return _job is not None
+
+
+def status():
+    """
+    Returns {
+        "lastBeat": monotonic time of last heartbeat or None,
+        "armed": list of names of accounts whose timer is set,
+        "failed": dict of account name -> error of last heartbeat
+    }.
+    """
+    with _lock:
+        return {
+            "lastBeat": _status["lastBeat"],
+            "armed": list(_status["armed"]),
+            "failed": dict(_status["failed"])
+        }
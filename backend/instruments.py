@@ -0,0 +1,125 @@
+"""
+Cached registry of instrument metadata (tick size, lot size, order limits,
+contract value). Metadata barely ever changes, so it is downloaded once per
+server for all open instruments and then served from memory.
+"""
+
+import threading
+
+from time import monotonic
+
+import backend.api as api
+import backend.accounts as accounts
+
+from backend.exceptions import BitmexCoreException
+
+
+#
+# Constants
+#
+
+MAX_AGE = 3600  # Seconds before cached metadata is downloaded again
+COLUMNS = [  # Instrument fields kept in registry
+    "symbol", "state", "tickSize", "lotSize", "maxOrderQty", "maxPrice",
+    "isInverse", "multiplier", "initMargin", "maintMargin"
+]
+
+
+#
+# Registry
+#
+
+_registry = {}  # host -> {"time": monotonic time, "instruments": symbol -> dict}
+_lock = threading.Lock()
+
+
+#
+# Internal functions
+#
+
+def _fetch(account, **params):
+    """
+    Download instruments metadata using account.
+
+    Returns dict of symbol -> instrument dict.
+    """
+    response = api.instrument_get(account["host"], account["key"], account["secret"],
+                                  columns=COLUMNS, **params)
+    return {x["symbol"]: x for x in response}
+
+
+def _get_account(accountName):
+    """
+    Returns account dict, raises BitmexCoreException if it doesn't exist.
+    """
+    names = accounts.resolve([accountName])
+    account = accounts.get(names[0]) if names else None
+    if account is None:
+        raise BitmexCoreException("Account '" + accountName + "' doesn't exist.")
+    return account
+
+
+#
+# Functions
+#
+
+def refresh(accountName):
+    """
+    Download metadata of all open instruments of accounts server.
+
+    accountName:    name of account (for authorization)
+    """
+    account = _get_account(accountName)
+    instruments = _fetch(account, filter={"state": "Open"})
+    with _lock:
+        _registry[account["host"]] = {
+            "time": monotonic(),
+            "instruments": instruments
+        }
+
+
+def get(accountName, symbol, maxAge=MAX_AGE):
+    """
+    Get instrument metadata. Downloaded only if it isn't cached or is older
+    than maxAge seconds.
+
+    accountName:    name of account (for authorization)
+    symbol:         instruments symbol
+    maxAge:         how old cached metadata may be returned (in seconds)
+
+    Returns instrument dict with COLUMNS fields.
+    """
+    account = _get_account(accountName)
+    host = account["host"]
+    entry = _registry.get(host)
+    if entry is None or monotonic() - entry["time"] > maxAge:
+        refresh(accountName)
+        entry = _registry[host]
+    instrument = entry["instruments"].get(symbol)
+    if instrument is None:  # Not open instrument, ask for it alone
+        instrument = _fetch(account, symbol=symbol).get(symbol)
+        if instrument is None:
+            raise BitmexCoreException("Instrument '" + symbol + "' doesn't exist.")
+        with _lock:
+            entry["instruments"][symbol] = instrument
+    return instrument
+
+
+def get_cached(host, symbol):
+    """
+    Get instrument metadata only if it is already cached (never downloads).
+
+    Returns instrument dict or None.
+    """
+    entry = _registry.get(host)
+    if entry is None:
+        return None
+    return entry["instruments"].get(symbol)
+
+
+def clear():
+    """
+    Forget all cached metadata.
+    """
+    with _lock:
+        _registry.clear()
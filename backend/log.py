@@ -65,7 +65,9 @@ def new_entry(results: dict, savefile: str = SAVEFILE):
         key:        name of key of account on which bot currently runs,
         action:     one of "wait", "trade", "hold" or "close" depending on what
                     is currently done ("wait" and "hold" are used for debuging)
-    } as argument.
+        [quoteLatency]: milliseconds from quote to decision
+        [sendLatency]:  milliseconds from decision to orders being sent
+    } as argument. Latencies are written only if present.
     """
     try:
         f = open(savefile, "a")
@@ -74,7 +76,11 @@ def new_entry(results: dict, savefile: str = SAVEFILE):
 
     entry = results["time"].strftime(TIME_FORMAT) + "\t"
     entry += ("{contract1}\t{price1}\t{contract2}\t{price2}\t{difference}\t" +
-              "{key}\t{action}\n").format(**results)
+              "{key}\t{action}").format(**results)
+    if results.get("quoteLatency") is not None:
+        entry += "\t{:.1f}\t{:.1f}".format(results["quoteLatency"],
+                                          results.get("sendLatency") or 0)
+    entry += "\n"
 
     f.write(entry)
     f.close()
@@ -91,7 +97,9 @@ def read_entries(n: int = 0, savefile: str = SAVEFILE):
         price2:     price of second contract,
         difference: difference between the prices,
         key:        name of key of account on which bot ran when entry was made,
-        action:     description of action taken when entry was made
+        action:     description of action taken when entry was made,
+        quoteLatency: milliseconds from quote to decision (or None),
+        sendLatency:  milliseconds from decision to orders being sent (or None)
     } dicts.
     """
     f = None
@@ -123,7 +131,9 @@ def read_entries(n: int = 0, savefile: str = SAVEFILE):
                 "price2": float(entry[4]),
                 "difference": float(entry[5]),
                 "key": entry[6],
-                "action": entry[7]
+                "action": entry[7],
+                "quoteLatency": float(entry[8]) if len(entry) > 8 else None,
+                "sendLatency": float(entry[9]) if len(entry) > 9 else None
             }
         except Exception as e:
             raise BitmexBotException("Internal Error: " + str(e) + " Is '" +
@@ -0,0 +1,268 @@
+"""
+In-process request metrics: counters, gauges and latency histograms. Can be
+exported in Prometheus text format to a file or over local http.
+"""
+
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import backend.accounts as accounts
+from backend.exceptions import BitmexException
+
+
+#
+# Constants
+#
+
+SAVEFILE = "./metrics.prom"  # Default location of exported metrics
+PORT = 9464  # Default port of local http endpoint
+BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Histogram bounds (seconds)
+
+
+#
+# Registry
+#
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> float
+_gauges = {}  # (name, labels) -> float
+_histograms = {}  # (name, labels) -> {"buckets": list of int, "sum": float, "count": int}
+_listeners = []  # Functions called with every request event
+
+
+#
+# Functions
+#
+
+# Utility
+
+def _labels(labels):
+    """
+    Returns labels dict as hashable sorted tuple.
+    """
+    if not labels:
+        return ()
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _format(name, labels, extra=()):
+    """
+    Returns metric name with labels in Prometheus text format.
+    """
+    labels = labels + tuple(extra)
+    if not labels:
+        return name
+    return name + "{" + ",".join('%s="%s"' % (k, v.replace('"', '\\"'))
+                                 for k, v in labels) + "}"
+
+
+def account_label(key: str):
+    """
+    Returns name of account with api key (or the key if no account has it).
+    """
+    account = accounts.get_by_key(key)
+    return account["name"] if account is not None else key
+
+
+# Recording
+
+def inc(name: str, labels: dict = None, value: float = 1):
+    """
+    Increase counter.
+    """
+    index = (name, _labels(labels))
+    with _lock:
+        _counters[index] = _counters.get(index, 0) + value
+
+
+def set_gauge(name: str, labels: dict, value: float):
+    """
+    Set gauge to value.
+    """
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+def observe(name: str, labels: dict, seconds: float):
+    """
+    Add duration to histogram.
+    """
+    index = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(index)
+        if histogram is None:
+            histogram = {"buckets": [0 for x in BUCKETS], "sum": 0.0, "count": 0}
+            _histograms[index] = histogram
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+def add_listener(function):
+    """
+    Register function called with dict of {
+        "endpoint": str,
+        "verb": str,
+        "account": str,
+        "status": str,
+        "seconds": float
+    } after every request sent to BitMEX.
+    """
+    _listeners.append(function)
+
+
+def remove_listener(function):
+    """
+    Unregister function registered by add_listener().
+    """
+    _listeners.remove(function)
+
+
+def request(endpoint: str, verb: str, key: str, status, seconds: float,
+            headers=None):
+    """
+    Record finished request. Called by api.
+
+    endpoint:   path of endpoint (i.e. /order)
+    verb:       http operation verb
+    key:        api key used
+    status:     http status code or name of connection error
+    seconds:    how long did the request take
+    headers:    response headers (for rate limit headroom)
+    """
+    account = account_label(key)
+    labels = {"endpoint": endpoint, "verb": verb, "account": account,
+              "status": status}
+    inc("bitmex_requests_total", labels)
+    observe("bitmex_request_seconds", labels, seconds)
+    if headers is not None:
+        remaining = headers.get("x-ratelimit-remaining")
+        limit = headers.get("x-ratelimit-limit")
+        if remaining is not None:
+            set_gauge("bitmex_ratelimit_remaining", {"account": account}, float(remaining))
+        if limit is not None:
+            set_gauge("bitmex_ratelimit_limit", {"account": account}, float(limit))
+    if _listeners:
+        event = {
+            "endpoint": endpoint,
+            "verb": verb,
+            "account": account,
+            "status": str(status),
+            "seconds": seconds
+        }
+        for listener in list(_listeners):
+            listener(event)
+
+
+def error(source: str, exception: Exception):
+    """
+    Count error raised in source (i.e. "monitor.Positions").
+    """
+    inc("bitmex_errors_total", {"source": source, "type": type(exception).__name__})
+
+
+# Reading
+
+def get_gauge(name: str, labels: dict):
+    """
+    Returns current value of gauge or None if it wasn't set yet.
+    """
+    with _lock:
+        return _gauges.get((name, _labels(labels)))
+
+
+def snapshot():
+    """
+    Returns copy of all recorded metrics as {
+        "counters": dict of (name, labels) -> float,
+        "gauges": dict of (name, labels) -> float,
+        "histograms": dict of (name, labels) -> {"buckets", "sum", "count"}
+    }, labels being tuples of (label, value) pairs.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {k: {"buckets": list(v["buckets"]), "sum": v["sum"],
+                               "count": v["count"]}
+                           for k, v in _histograms.items()}
+        }
+
+
+def reset():
+    """
+    Forget all recorded metrics.
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+# Exporting
+
+def render():
+    """
+    Returns all metrics in Prometheus text exposition format.
+    """
+    data = snapshot()
+    lines = []
+    for (name, labels), value in sorted(data["counters"].items()):
+        lines.append("%s %s" % (_format(name, labels), repr(value)))
+    for (name, labels), value in sorted(data["gauges"].items()):
+        lines.append("%s %s" % (_format(name, labels), repr(value)))
+    for (name, labels), histogram in sorted(data["histograms"].items()):
+        for bound, count in zip(BUCKETS, histogram["buckets"]):
+            lines.append("%s %d" % (_format(name + "_bucket", labels,
+                                            [("le", str(bound))]), count))
+        lines.append("%s %d" % (_format(name + "_bucket", labels, [("le", "+Inf")]),
+                                histogram["count"]))
+        lines.append("%s %s" % (_format(name + "_sum", labels), repr(histogram["sum"])))
+        lines.append("%s %d" % (_format(name + "_count", labels), histogram["count"]))
+    return "\n".join(lines) + "\n"
+
+
+def write(savefile: str = SAVEFILE):
+    """
+    Write all metrics to file in Prometheus text format. Warning: Replaces old
+    savefile.
+    """
+    try:
+        f = open(savefile, "w")
+    except Exception as e:
+        raise BitmexException(str(e))
+
+    f.write(render())
+    f.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves rendered metrics on every GET.
+    """
+
+    def do_GET(self):
+        body = bytes(render(), 'utf8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int = PORT, address: str = "127.0.0.1"):
+    """
+    Serve metrics over http on its own thread.
+
+    Returns server (call .shutdown() to stop it).
+    """
+    server = HTTPServer((address, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
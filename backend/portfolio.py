@@ -0,0 +1,263 @@
+"""
+Portfolio-wide risk aggregation across accounts. Positions are kept in flat
+arrays (one slot per account and symbol) and per-symbol and per-account sums
+are adjusted by the difference whenever one position changes, so updating a
+position is O(1) no matter how many accounts there are.
+"""
+
+import heapq
+import threading
+
+from array import array
+
+
+#
+# Classes
+#
+
+class Portfolio:
+    """
+    Aggregated view of positions of many accounts. Feed it with results of
+    core.position_info() (load() or update_position()) and available margins
+    (update_margin()), then read exposure(), totals(), utilisation() and
+    liquidation_ranking().
+    """
+
+    FIELDS = ("size", "value", "notional", "unrealisedPnl", "margin")  # Summed fields
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Position slots
+        self._slots = {}  # (account name, symbol) -> slot index
+        self._held = {}  # account name -> set of symbols with open position
+        self._keys = []  # slot index -> (account name, symbol) or None if free
+        self._free = []  # Indexes of free slots
+        self._columns = {x: array("d") for x in self.FIELDS}  # Signed values
+        self._mark = array("d")
+        self._liq = array("d")
+        # Aggregates
+        self._symbols = {}  # symbol -> {field: sum, "positions": int}
+        self._accounts = {}  # account name -> {"margin": sum, "available": float}
+        self._totals = self._empty_totals()
+
+    # Internal methods
+
+    def _empty_totals(self):
+        """
+        Returns totals dict with all sums zero.
+        Internal method.
+        """
+        totals = {x: 0.0 for x in self.FIELDS}
+        totals["grossValue"] = 0.0
+        totals["grossNotional"] = 0.0
+        return totals
+
+    def _add(self, slot, sign):
+        """
+        Add (sign 1) or subtract (sign -1) values of slot to aggregates.
+        Caller holds lock.
+        Internal method.
+        """
+        name, symbol = self._keys[slot]
+        sums = self._symbols.setdefault(symbol, dict.fromkeys(self.FIELDS, 0.0))
+        sums["positions"] = sums.get("positions", 0) + sign
+        for field in self.FIELDS:
+            value = self._columns[field][slot] * sign
+            sums[field] += value
+            self._totals[field] += value
+        self._totals["grossValue"] += abs(self._columns["value"][slot]) * sign
+        self._totals["grossNotional"] += abs(self._columns["notional"][slot]) * sign
+        account = self._accounts.setdefault(name, {"margin": 0.0, "available": None})
+        account["margin"] += self._columns["margin"][slot] * sign
+        if sums["positions"] == 0:
+            del self._symbols[symbol]
+
+    def _set(self, name, position):
+        """
+        Store one position and update aggregates by the difference.
+        Caller holds lock.
+        Internal method.
+        """
+        key = (name, position["symbol"])
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._add(slot, -1)
+        if not position["size"]:  # Closed
+            if slot is not None:
+                self._release(slot)
+            return
+        if slot is None:
+            slot = self._allocate(key)
+        sign = 1 if position["size"] > 0 else -1
+        columns = self._columns
+        columns["size"][slot] = position["size"]
+        columns["value"][slot] = sign * abs(position["value"] or 0)
+        columns["notional"][slot] = sign * abs(position["notional"] or 0)
+        columns["unrealisedPnl"][slot] = position["unrealisedPnl"] or 0
+        columns["margin"][slot] = position["margin"] or 0
+        self._mark[slot] = position["markPrice"] or 0
+        self._liq[slot] = position["liqPrice"] or 0
+        self._add(slot, 1)
+
+    def _allocate(self, key):
+        """
+        Returns index of new slot for key.
+        Internal method.
+        """
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            for column in self._columns.values():
+                column.append(0.0)
+            self._mark.append(0.0)
+            self._liq.append(0.0)
+        self._slots[key] = slot
+        self._held.setdefault(key[0], set()).add(key[1])
+        return slot
+
+    def _release(self, slot):
+        """
+        Free slot of closed position.
+        Internal method.
+        """
+        name, symbol = self._keys[slot]
+        del self._slots[(name, symbol)]
+        self._held[name].discard(symbol)
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    # Updating
+
+    def update_position(self, accountName, position):
+        """
+        Update one position of account. Position with zero size is removed.
+
+        accountName:    name of account
+        position:       position dict as returned by core.position_info()
+        """
+        with self._lock:
+            self._set(accountName, position)
+
+    def load(self, accounts):
+        """
+        Update positions of accounts. Positions of these accounts which are
+        missing in the new data are considered closed.
+
+        accounts:       result of core.position_info()
+        """
+        with self._lock:
+            for account in accounts:
+                name = account["name"]
+                symbols = set()
+                for position in account["positions"]:
+                    self._set(name, position)
+                    symbols.add(position["symbol"])
+                for symbol in self._held.get(name, set()) - symbols:
+                    self._set(name, {"symbol": symbol, "size": 0})
+
+    def update_margin(self, accountName, availableMargin):
+        """
+        Update available margin of account (in bitcoins).
+        """
+        with self._lock:
+            account = self._accounts.setdefault(accountName,
+                                                {"margin": 0.0, "available": None})
+            account["available"] = availableMargin
+
+    def rebuild(self):
+        """
+        Recompute all aggregates from stored positions in one pass (drops
+        accumulated float rounding errors).
+        """
+        with self._lock:
+            for account in self._accounts.values():
+                account["margin"] = 0.0
+            self._symbols = {}
+            self._totals = self._empty_totals()
+            for slot, key in enumerate(self._keys):
+                if key is not None:
+                    self._add(slot, 1)
+
+    # Reading
+
+    def exposure(self):
+        """
+        Returns dict of symbol -> {
+            "size": float (net contracts across accounts),
+            "value": float (net value, short positions negative),
+            "notional": float (net notional, short positions negative),
+            "unrealisedPnl": float,
+            "margin": float,
+            "positions": int (how many accounts hold it)
+        }.
+        """
+        with self._lock:
+            return {k: dict(v) for k, v in self._symbols.items()}
+
+    def totals(self):
+        """
+        Returns {
+            "size", "value", "notional", "unrealisedPnl", "margin": float
+            (net sums across all accounts and symbols),
+            "grossValue", "grossNotional": float (sums of absolute values)
+        }.
+        """
+        with self._lock:
+            return dict(self._totals)
+
+    def utilisation(self):
+        """
+        Returns dict of account name -> {
+            "margin": float (margin in positions),
+            "available": float or None (available margin),
+            "utilisation": float or None (percent of margin in positions)
+        }.
+        """
+        result = {}
+        with self._lock:
+            for name, account in self._accounts.items():
+                available = account["available"]
+                total = account["margin"] + (available or 0)
+                result[name] = {
+                    "margin": account["margin"],
+                    "available": available,
+                    "utilisation": account["margin"] / total * 100
+                                   if available is not None and total > 0 else None
+                }
+        return result
+
+    def liquidation_ranking(self, count=None):
+        """
+        Rank positions by how close their mark price is to liquidation.
+
+        count:      return only this many closest positions (None for all)
+
+        Returns list of {
+            "name": str,
+            "symbol": str,
+            "markPrice": float,
+            "liqPrice": float,
+            "distance": float (percent of mark price)
+        }, closest first. Positions without liquidation price are left out.
+        """
+        with self._lock:
+            rows = []
+            for slot, key in enumerate(self._keys):
+                if key is None or not self._liq[slot] or not self._mark[slot]:
+                    continue
+                mark = self._mark[slot]
+                rows.append((abs(mark - self._liq[slot]) / mark * 100, slot))
+            if count is not None:
+                rows = heapq.nsmallest(count, rows)
+            else:
+                rows.sort()
+            return [{
+                "name": self._keys[slot][0],
+                "symbol": self._keys[slot][1],
+                "markPrice": self._mark[slot],
+                "liqPrice": self._liq[slot],
+                "distance": distance
+            } for distance, slot in rows]
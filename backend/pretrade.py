@@ -0,0 +1,148 @@
+"""
+Pre-trade risk calculator. Evaluates potential loss, its share of available
+margin, margin usage and liquidation price estimate of an order for all
+selected accounts at once. Works only from cached instrument metadata and
+margin snapshots, so it can be re-evaluated on every keystroke.
+"""
+
+import backend.core as core
+import backend.accounts as accounts
+import backend.instruments as instruments
+
+from backend.exceptions import BitmexCoreException
+
+
+#
+# Functions
+#
+
+# Instrument math
+
+def contract_value(instrument):
+    """
+    Returns how much currency one contract of instrument contains.
+    """
+    return abs(instrument["multiplier"] * 1e-8)
+
+
+def margin_per_contract(instrument, price):
+    """
+    Returns how much margin (in bitcoins) is in one contract at price.
+    """
+    if instrument["isInverse"]:
+        return (1 / price) * contract_value(instrument)
+    else:
+        return price * contract_value(instrument)
+
+
+def liquidation_price(instrument, entryPx, leverage, short=False):
+    """
+    Estimate liquidation price of isolated position opened at entryPx. Ignores
+    fees, funding and risk limit steps.
+
+    leverage:       position leverage (margin = value / leverage)
+
+    Returns price float.
+    """
+    maint = instrument.get("maintMargin") or 0
+    move = 1 / leverage - maint  # Part of value which can be lost
+    if instrument["isInverse"]:
+        if short:
+            return entryPx / (1 - move) if move < 1 else float("inf")
+        return entryPx / (1 + move)
+    if short:
+        return entryPx * (1 + move)
+    return entryPx * (1 - move)
+
+
+# Evaluation
+
+def refresh(accountNames, symbol):
+    """
+    Download instrument metadata (if it isn't cached) and available margins
+    of all accounts, so that evaluate() has everything it needs. Margins are
+    fetched with one concurrent request per account.
+
+    accountNames:   list of account names and groups
+    symbol:         instruments symbol
+    """
+    names = accounts.resolve(accountNames)
+    if not names:
+        raise BitmexCoreException("No accounts selected.")
+    instruments.get(names[0], symbol)
+    core.account_margin_stats(names)
+
+
+def evaluate(accountNames, symbol, qty, entryPx, exitPx, short=False, leverage=None):
+    """
+    Evaluate order for each account from cached data only (see refresh()).
+
+    accountNames:   list of account names and groups
+    symbol:         instruments symbol
+    qty:            how many contracts in each order
+    entryPx:        order price
+    exitPx:         stop loss price
+    short:          true for short position, false for long
+    leverage:       position leverage (defaults to maximum allowed by
+                    instruments initial margin)
+
+    Returns {
+        "loss": float (per account, in bitcoins),
+        "percent": float (loss in percent of order value),
+        "liquidationPrice": float,
+        "totalLoss": float (all accounts together),
+        "accounts": list of {
+            "name": str,
+            "availableMargin": float or None,
+            "marginPercent": float or None (loss in percent of available margin),
+            "marginUsage": float or None (order margin in percent of
+                                          available margin),
+            "age": float or None (seconds since margin was fetched)
+        }
+    }. Raises BitmexCoreException if instrument metadata isn't cached.
+    """
+    names = accounts.resolve(accountNames)
+    if not names:
+        raise BitmexCoreException("No accounts selected.")
+    account = accounts.get(names[0])
+    if account is None:
+        raise BitmexCoreException("Account '" + names[0] + "' doesn't exist.")
+    instrument = instruments.get_cached(account["host"], symbol)
+    if instrument is None:
+        raise BitmexCoreException("Instrument '" + symbol + "' isn't known yet.")
+
+    entryValue = margin_per_contract(instrument, entryPx) * qty
+    exitValue = margin_per_contract(instrument, exitPx) * qty
+    if short != instrument["isInverse"]:  # Note that we are calculating loss
+        loss = exitValue - entryValue
+    else:
+        loss = entryValue - exitValue
+    if leverage is None:
+        leverage = 1 / (instrument.get("initMargin") or 1)
+    orderMargin = entryValue / leverage
+
+    result = {
+        "loss": loss,
+        "percent": loss / entryValue * 100,
+        "liquidationPrice": liquidation_price(instrument, entryPx, leverage, short),
+        "totalLoss": loss * len(names),
+        "accounts": []
+    }
+    for name in names:
+        cached = core.cached_available_margin(name)
+        account = {
+            "name": name,
+            "availableMargin": None,
+            "marginPercent": None,
+            "marginUsage": None,
+            "age": None
+        }
+        if cached is not None:
+            age, available = cached
+            account["age"] = age
+            account["availableMargin"] = available
+            if available > 0:
+                account["marginPercent"] = loss / available * 100
+                account["marginUsage"] = orderMargin / available * 100
+        result["accounts"].append(account)
+    return result
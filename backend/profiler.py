@@ -0,0 +1,153 @@
+"""
+Sampling profiler attributing time to Tk rendering, JSON parsing, HTTP wait,
+signing and bot log I/O.
+"""
+
+import sys
+import threading
+
+from time import sleep, perf_counter
+
+from backend.exceptions import BitmexException
+
+
+#
+# Constants
+#
+
+INTERVAL = 0.005  # Seconds between samples
+COLLAPSED_SAVEFILE = "./profile.folded"  # Default location of collapsed stacks
+SUMMARY_SAVEFILE = "./profile.txt"  # Default location of summary
+CATEGORIES = (  # (category, substrings of "file:function") checked from innermost frame
+    ("log I/O", ("backend/log.py:",)),
+    ("signing", ("/hmac.py:", "/hashlib.py:", "backend/api.py:signature",
+                 "backend/api.py:headers")),
+    ("JSON parsing", ("/json/", "backend/codec.py:")),
+    ("HTTP wait", ("/requests/", "/urllib3/", "/socket.py:", "/ssl.py:",
+                   "/http/client.py:")),
+    ("Tk rendering", ("/tkinter/",)),
+    ("idle", ("/threading.py:", "/queue.py:", "/selectors.py:",
+              "concurrent/futures/")),
+)
+
+
+#
+# Classes
+#
+
+class Sampler:
+    """
+    Samples stacks of all other threads on its own thread.
+    """
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.stacks = {}  # collapsed stack str -> samples
+        self.categories = {}  # category -> samples
+        self.samples = 0
+        self.seconds = 0
+
+        self._kill_thread = False
+        self.thread = None
+
+    def start(self):
+        """
+        Creates and starts sampling thread.
+        """
+        self._kill_thread = False
+        self.thread = threading.Thread(target=self._main, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling thread.
+        """
+        self._kill_thread = True
+        self.thread.join()
+        self.thread = None
+
+    def _main(self):
+        """
+        Main function of sampling thread.
+        Internal method.
+        """
+        own = threading.get_ident()
+        start = perf_counter()
+        while not self._kill_thread:
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._sample(frame)
+            sleep(self.interval)
+        self.seconds += perf_counter() - start
+
+    def _sample(self, frame):
+        """
+        Record one stack.
+        Internal method.
+        """
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append(code.co_filename.replace("\\", "/") + ":" + code.co_name)
+            frame = frame.f_back
+        category = "other"
+        for label in labels:  # Innermost first
+            for name, patterns in CATEGORIES:
+                if any(x in label for x in patterns):
+                    category = name
+                    break
+            else:
+                continue
+            break
+        stack = ";".join(_short(x) for x in reversed(labels))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.categories[category] = self.categories.get(category, 0) + 1
+        self.samples += 1
+
+    def write_collapsed(self, savefile: str = COLLAPSED_SAVEFILE):
+        """
+        Write stacks in collapsed format ("frame;frame;frame samples" per line)
+        usable by flamegraph tools. Warning: Replaces old savefile.
+        """
+        try:
+            f = open(savefile, "w")
+        except Exception as e:
+            raise BitmexException(str(e))
+
+        for stack, count in sorted(self.stacks.items()):
+            f.write("%s %d\n" % (stack, count))
+        f.close()
+
+    def summary(self):
+        """
+        Returns summary text of how samples divide between categories.
+        """
+        lines = ["Profiled %.1f s, %d samples" % (self.seconds, self.samples)]
+        total = self.samples or 1
+        for category, count in sorted(self.categories.items(), key=lambda x: -x[1]):
+            lines.append("%-14s %6d  %5.1f %%" % (category, count, 100 * count / total))
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, savefile: str = SUMMARY_SAVEFILE):
+        """
+        Write summary to file. Warning: Replaces old savefile.
+        """
+        try:
+            f = open(savefile, "w")
+        except Exception as e:
+            raise BitmexException(str(e))
+
+        f.write(self.summary())
+        f.close()
+
+
+#
+# Functions
+#
+
+def _short(label):
+    """
+    Returns "file:function" label shortened to file basename.
+    """
+    path, function = label.rsplit(":", 1)
+    return path.rsplit("/", 1)[-1] + ":" + function
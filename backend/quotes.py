@@ -0,0 +1,218 @@
+"""
+Shared quote cache. Prices of all watched instruments of one server are polled
+with a single request on the shared scheduler, no matter how many bots or
+frames watch them, and listeners are told about every quote which changed.
+"""
+
+import threading
+
+from time import time
+from datetime import datetime
+
+import backend.api as api
+import backend.accounts as accounts
+import backend.metrics as metrics
+import backend.scheduler as scheduler
+
+from backend.exceptions import BitmexCoreException
+
+
+#
+# Constants
+#
+
+POLL_INTERVAL = 1  # Seconds between quote requests to one server
+PRICE_FIELDS = ("lastPrice", "bidPrice", "midPrice", "askPrice")
+COLUMNS = ["symbol", "timestamp"] + list(PRICE_FIELDS)
+
+
+#
+# Cache
+#
+
+_quotes = {}  # (host, symbol) -> quote dict (see get())
+_watched = {}  # host -> {"account": account name, "symbols": symbol -> count,
+               #          "job": scheduler.Job, "lock": lock held while polling}
+_listeners = []  # Functions called with (host, quote) of every changed quote
+_lock = threading.Lock()
+
+
+#
+# Internal functions
+#
+
+def _parse_time(timestamp):
+    """
+    Returns api timestamp as server unix time (None if it is missing).
+    """
+    if not timestamp:
+        return None
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def _poll(host, symbol=None):
+    """
+    Download quotes of all open instruments of host in one request, store the
+    watched ones and notify listeners about those which changed. Called by
+    scheduler.
+
+    symbol:     poll only if quote of this symbol isn't cached (when called
+                by many threads at once, only the first one sends request)
+    """
+    with _lock:
+        entry = _watched.get(host)
+        if entry is None:
+            return
+    with entry["lock"]:
+        if symbol is not None and (host, symbol) in _quotes:
+            return
+        _download(host, entry)
+
+
+def _download(host, entry):
+    """
+    Poll quotes of host. Caller holds polling lock of host.
+    """
+    with _lock:
+        accountName = entry["account"]
+        symbols = set(entry["symbols"])
+    account = accounts.get(accountName)
+    if account is None:
+        raise BitmexCoreException("Account '" + accountName + "' doesn't exist.")
+
+    response = api.instrument_get(host, account["key"], account["secret"],
+                                  filter={"state": "Open"}, columns=COLUMNS)
+    received = time()
+    offset = api.clock_offset(host)
+    changed = []
+    with _lock:
+        for instrument in response:
+            symbol = instrument["symbol"]
+            if symbol not in symbols:
+                continue
+            serverTime = _parse_time(instrument.get("timestamp"))
+            quote = {
+                "symbol": symbol,
+                # Local unix time of the quote, estimated from server clock
+                "time": serverTime - offset if serverTime is not None else received,
+                "received": received
+            }
+            for field in PRICE_FIELDS:
+                quote[field] = instrument.get(field)
+            old = _quotes.get((host, symbol))
+            _quotes[(host, symbol)] = quote
+            if old is None or any(old[x] != quote[x] for x in PRICE_FIELDS):
+                changed.append(quote)
+        listeners = list(_listeners)
+    for quote in changed:
+        for function in listeners:
+            try:
+                function(host, quote)
+            except Exception as e:
+                metrics.error("quotes", e)
+
+
+#
+# Functions
+#
+
+def watch(accountName, symbols):
+    """
+    Start polling quotes of symbols on server of account (the account is used
+    for authorization). Every call should be paired with unwatch().
+
+    accountName:    name of account
+    symbols:        list of instrument symbols
+
+    Returns host of the server.
+    """
+    account = accounts.get(accountName)
+    if account is None:
+        raise BitmexCoreException("Account '" + accountName + "' doesn't exist.")
+    host = account["host"]
+    with _lock:
+        entry = _watched.get(host)
+        if entry is None:
+            entry = {"account": accountName, "symbols": {}, "job": None,
+                     "lock": threading.Lock()}
+            _watched[host] = entry
+        for symbol in symbols:
+            entry["symbols"][symbol] = entry["symbols"].get(symbol, 0) + 1
+        if entry["job"] is None:
+            entry["job"] = scheduler.every(POLL_INTERVAL, _poll, host, delay=0)
+    return host
+
+
+def unwatch(accountName, symbols):
+    """
+    Stop polling quotes of symbols watched with watch(). Polling of server
+    stops once nothing on it is watched.
+    """
+    account = accounts.get(accountName)
+    if account is None:
+        return
+    host = account["host"]
+    with _lock:
+        entry = _watched.get(host)
+        if entry is None:
+            return
+        for symbol in symbols:
+            count = entry["symbols"].get(symbol, 0) - 1
+            if count > 0:
+                entry["symbols"][symbol] = count
+            else:
+                entry["symbols"].pop(symbol, None)
+                _quotes.pop((host, symbol), None)
+        if not entry["symbols"]:
+            entry["job"].cancel()
+            del _watched[host]
+
+
+def get(host, symbol):
+    """
+    Get last polled quote of instrument (never downloads).
+
+    Returns {
+        "symbol": str,
+        "lastPrice": float,
+        "bidPrice": float,
+        "midPrice": float,
+        "askPrice": float,
+        "time": float (local unix time of the quote),
+        "received": float (local unix time when it was downloaded)
+    } or None if symbol isn't watched or wasn't polled yet.
+    """
+    return _quotes.get((host, symbol))
+
+
+def refresh(host, symbol):
+    """
+    Get quote of instrument, polling host right away if it isn't cached yet.
+    Threads asking at once share one request.
+
+    Returns quote dict (see get()) or None if symbol isn't watched or isn't
+    open instrument.
+    """
+    quote = _quotes.get((host, symbol))
+    if quote is None:
+        _poll(host, symbol)
+        quote = _quotes.get((host, symbol))
+    return quote
+
+
+def add_listener(function):
+    """
+    Call function(host, quote) whenever a polled quote changes (see get() for
+    quote dict). Called on scheduler worker thread, so it should be quick.
+    """
+    with _lock:
+        _listeners.append(function)
+
+
+def remove_listener(function):
+    """
+    Stop calling function added with add_listener().
+    """
+    with _lock:
+        if function in _listeners:
+            _listeners.remove(function)
@@ -0,0 +1,161 @@
+"""
+One shared scheduler for periodic and delayed background jobs (heartbeats,
+execution slices, ...). A single thread waits for the next due job and hands
+it to a small pool of worker threads, so a slow job doesn't delay others.
+"""
+
+import heapq
+import random
+import threading
+
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor
+
+import backend.metrics as metrics
+
+
+#
+# Constants
+#
+
+WORKERS = 4  # How many jobs may run at once
+
+
+#
+# Classes
+#
+
+class Job:
+    """
+    Handle of scheduled job. Returned by schedule() and every().
+
+    function:   called with args when job is due
+    interval:   seconds between runs of repeating job (None runs once)
+    jitter:     repeating job runs randomly up to this many seconds sooner or
+                later each time, so that jobs started together drift apart
+    """
+
+    def __init__(self, function, args, interval=None, jitter=0):
+        self.function = function
+        self.args = args
+        self.interval = interval
+        self.jitter = jitter
+        self.cancelled = False
+        self.runs = 0
+
+    def cancel(self):
+        """
+        Don't run this job anymore. Run in progress is not interrupted.
+        """
+        self.cancelled = True
+
+    def _next_delay(self):
+        """
+        Returns seconds until next run of repeating job.
+        Internal method.
+        """
+        delay = self.interval + random.uniform(-self.jitter, self.jitter)
+        return max(0, delay)
+
+
+#
+# Scheduler state
+#
+
+_queue = []  # heap of (due monotonic time, sequence number, Job)
+_counter = 0  # Sequence number breaking ties of jobs due at the same time
+_condition = threading.Condition()
+_thread = None
+_executor = None
+
+
+#
+# Internal functions
+#
+
+def _push(job, delay):
+    """
+    Insert job to queue and wake scheduler thread.
+    """
+    global _counter
+    with _condition:
+        _counter += 1
+        heapq.heappush(_queue, (monotonic() + delay, _counter, job))
+        _condition.notify()
+    _start()
+
+
+def _start():
+    """
+    Start scheduler thread and workers if they aren't running.
+    """
+    global _thread, _executor
+    with _condition:
+        if _thread is None:
+            _executor = ThreadPoolExecutor(WORKERS)
+            _thread = threading.Thread(target=_main, daemon=True)
+            _thread.start()
+
+
+def _run(job):
+    """
+    Run job on worker thread, then reschedule it if it repeats.
+    """
+    try:
+        job.function(*job.args)
+    except Exception as e:
+        metrics.error("scheduler." + getattr(job.function, "__name__", "job"), e)
+    job.runs += 1
+    if job.interval is not None and not job.cancelled:
+        _push(job, job._next_delay())
+
+
+def _main():
+    """
+    Main function of scheduler thread.
+    """
+    while True:
+        with _condition:
+            while not _queue or _queue[0][0] > monotonic():
+                timeout = _queue[0][0] - monotonic() if _queue else None
+                _condition.wait(timeout)
+            due, _, job = heapq.heappop(_queue)
+        if not job.cancelled:
+            _executor.submit(_run, job)
+
+
+#
+# Functions
+#
+
+def schedule(delay: float, function, *args):
+    """
+    Run function(*args) once after delay seconds.
+
+    Returns Job.
+    """
+    job = Job(function, args)
+    _push(job, delay)
+    return job
+
+
+def every(interval: float, function, *args, jitter: float = 0, delay: float = None):
+    """
+    Run function(*args) repeatedly, interval seconds after previous run
+    finished (with random jitter of up to jitter seconds each way).
+
+    delay:  seconds before first run (defaults to interval)
+
+    Returns Job.
+    """
+    job = Job(function, args, interval, jitter)
+    _push(job, job._next_delay() if delay is None else delay)
+    return job
+
+
+def pending():
+    """
+    Returns how many jobs are waiting in queue.
+    """
+    with _condition:
+        return sum(1 for x in _queue if not x[2].cancelled)
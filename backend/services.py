@@ -0,0 +1,140 @@
+"""
+Background services of the program, started at startup and stopped at exit
+according to app settings (see backend.appsettings).
+
+Store service opens local store and keeps it synced by jobs on the shared
+scheduler. Once every account was synced, views answer from the store (see
+from_store()) instead of asking the server themselves.
+
+Heartbeat service runs dead man's switch of all accounts (see
+backend.heartbeat), so that their orders get cancelled if the program dies.
+Stopping it on exit turns the switch off.
+"""
+
+import threading
+
+import backend.core as core
+import backend.accounts as accounts
+import backend.appsettings as settings
+import backend.scheduler as scheduler
+import backend.store as store
+import backend.heartbeat as heartbeat
+import backend.metrics as metrics
+
+from backend.exceptions import BitmexException
+
+
+#
+# Constants
+#
+
+SYNC_INTERVAL = 15  # Seconds between syncs of positions, margins and orders
+HISTORY_SYNC_INTERVAL = 60  # Seconds between syncs of executions
+JITTER = 1  # Sync jobs run randomly up to this many seconds sooner or later
+
+
+#
+# State
+#
+
+_lock = threading.Lock()
+_jobs = []  # Scheduled scheduler.Jobs of running services
+_synced = set()  # Names of sync functions whose last run succeeded for all accounts
+
+
+#
+# Internal functions
+#
+
+def _sync(function):
+    """
+    Run sync function for all accounts. Called by scheduler.
+    """
+    try:
+        function(accounts.get_names())
+    except Exception as e:
+        metrics.error("services", e)
+        with _lock:
+            _synced.discard(function.__name__)
+        return
+    with _lock:
+        if store.is_open():  # Not stopped meanwhile
+            _synced.add(function.__name__)
+
+
+#
+# Functions
+#
+
+def start():
+    """
+    Load app settings (creating the savefile if it doesn't exist) and start
+    enabled services. Accounts should be loaded already.
+    """
+    try:
+        settings.load()
+    except BitmexException:
+        settings.save()
+    stop()
+    if settings.get_store():
+        start_store()
+    if settings.get_heartbeat():
+        heartbeat.start()
+
+
+def stop():
+    """
+    Stop all running services.
+    """
+    heartbeat.stop()
+    stop_store()
+
+
+def set_heartbeat(enabled: bool):
+    """
+    Start or stop heartbeat service and remember it in app settings.
+    """
+    settings.set_heartbeat(enabled)
+    settings.save()
+    if enabled:
+        heartbeat.start()
+    else:
+        heartbeat.stop()
+
+
+def start_store(savefile: str = store.SAVEFILE):
+    """
+    Open local store and schedule its sync jobs. First sync runs right away.
+    """
+    stop_store()
+    store.open(savefile)
+    with _lock:
+        for function, interval in ((core.sync_positions, SYNC_INTERVAL),
+                                   (core.sync_margins, SYNC_INTERVAL),
+                                   (core.sync_orders, SYNC_INTERVAL),
+                                   (core.sync_executions, HISTORY_SYNC_INTERVAL)):
+            _jobs.append(scheduler.every(interval, _sync, function, jitter=JITTER,
+                                         delay=0))
+
+
+def stop_store():
+    """
+    Cancel sync jobs and close local store.
+    """
+    with _lock:
+        while _jobs:
+            _jobs.pop().cancel()
+        _synced.clear()
+    store.close()
+
+
+def from_store(table: str):
+    """
+    Returns if views should answer from local store instead of asking the
+    server (store service runs and last sync of table succeeded for every
+    account).
+
+    table:  "positions", "margins", "orders" or "executions"
+    """
+    with _lock:
+        return "sync_" + table in _synced
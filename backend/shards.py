@@ -0,0 +1,239 @@
+"""
+Optional multi-process execution of api calls. Accounts are sharded across a
+pool of worker processes, each with its own threads and http connections, so
+signing and JSON parsing of many accounts isn't limited by one interpreter.
+
+Calls are pickled by reference, so worker processes only run module-level
+functions of backend.api (see can_run()). Core sends every other call (i.e.
+lambdas, closures or bound methods) to its own threads as if shards weren't
+running.
+"""
+
+import sys
+import zlib
+import pickle
+import threading
+import multiprocessing
+
+from queue import Empty
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from backend.exceptions import BitmexCoreException
+
+
+#
+# Constants
+#
+
+WORKER_THREADS = 16  # How many requests may each worker process wait for at once
+CHECK_INTERVAL = 1  # Seconds between checks that worker process is still alive
+SHARDED_MODULE = "backend.api"  # Only functions of this module run in workers
+
+
+#
+# Worker process
+#
+
+def _run(responses, job):
+    """
+    Call to API and send result back to parent process. Results are pickled
+    here, since queue pickles on its own thread and would drop unpicklable
+    ones without telling anyone.
+    """
+    jobID, call, host, key, secret, params = pickle.loads(job)
+    try:
+        data = pickle.dumps((jobID, True, call(host, key, secret, **params)))
+    except Exception as e:
+        try:
+            data = pickle.dumps((jobID, False, e))
+        except Exception:  # Exception couldn't be pickled
+            data = pickle.dumps((jobID, False, BitmexCoreException(str(e))))
+    responses.put(data)
+
+
+def _worker(requests, responses):
+    """
+    Main function of worker process. Runs jobs from requests queue on its
+    own threads until None is received.
+    """
+    executor = ThreadPoolExecutor(WORKER_THREADS)
+    while True:
+        job = requests.get()
+        if job is None:
+            break
+        executor.submit(_run, responses, job)
+    executor.shutdown()
+
+
+#
+# Classes
+#
+
+class _Shard:
+    """
+    One worker process with queues for jobs and their results.
+    """
+
+    def __init__(self, context):
+        self.requests = context.Queue()
+        self.responses = context.Queue()
+        self.futures = {}  # job id -> Future
+        self.lock = threading.Lock()
+        self.nextID = 0
+        self.dead = False  # Worker process exited, jobs can't be sent anymore
+
+        self.process = context.Process(target=_worker,
+                                       args=(self.requests, self.responses),
+                                       daemon=True)
+        self.process.start()
+        self.thread = threading.Thread(target=self._receive, daemon=True)
+        self.thread.start()
+
+    def submit(self, call, host, key, secret, params):
+        """
+        Send job to worker process. Job is pickled right away, so that the
+        future fails if it can't be sent.
+
+        Returns Future of its result.
+        """
+        future = Future()
+        with self.lock:
+            if self.dead:
+                future.set_exception(BitmexCoreException("Worker process died."))
+                return future
+            jobID = self.nextID
+            self.nextID += 1
+            try:
+                job = pickle.dumps((jobID, call, host, key, secret, params))
+            except Exception as e:
+                future.set_exception(BitmexCoreException(
+                    "Couldn't send call to worker process: " + str(e)))
+                return future
+            self.futures[jobID] = future
+        self.requests.put(job)
+        return future
+
+    def stop(self):
+        """
+        Stop worker process after it finishes sent jobs.
+        """
+        self.requests.put(None)
+        self.process.join()
+        self.responses.put(None)
+        self.thread.join()
+
+    def _receive(self):
+        """
+        Resolve futures with results sent by worker process. Fails all waiting
+        futures if worker process dies.
+        Internal method.
+        """
+        while True:
+            try:
+                item = self.responses.get(timeout=CHECK_INTERVAL)
+            except Empty:
+                if not self.process.is_alive():
+                    self._fail_all()
+                    break
+                continue
+            if item is None:
+                break
+            jobID, success, value = pickle.loads(item)
+            with self.lock:
+                future = self.futures.pop(jobID)
+            if success:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _fail_all(self):
+        """
+        Mark shard as dead and fail futures of jobs which won't be finished.
+        Internal method.
+        """
+        with self.lock:
+            self.dead = True
+            futures = list(self.futures.values())
+            self.futures.clear()
+        for future in futures:
+            future.set_exception(BitmexCoreException("Worker process died."))
+
+
+#
+# Pool
+#
+
+_shards = []  # Running shards
+
+
+#
+# Functions
+#
+
+def start(workers: int = None):
+    """
+    Start worker processes. From now on, core sends api calls through them.
+
+    workers:    how many processes (number of cpu cores if None)
+    """
+    if _shards:
+        stop()
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    context = multiprocessing.get_context()
+    for i in range(workers):
+        _shards.append(_Shard(context))
+
+
+def stop():
+    """
+    Stop worker processes. Core sends api calls on its own threads again.
+    """
+    while _shards:
+        _shards.pop().stop()
+
+
+def is_running():
+    """
+    Returns if worker processes are running.
+    """
+    return bool(_shards)
+
+
+def can_run(call):
+    """
+    Returns if call can be run in worker processes (is a module-level function
+    of SHARDED_MODULE, which workers import by name when unpickling it).
+    """
+    module = sys.modules.get(getattr(call, "__module__", None))
+    if module is None or module.__name__ != SHARDED_MODULE:
+        return False
+    return getattr(module, getattr(call, "__qualname__", ""), None) is call
+
+
+def shard_of(accountName: str):
+    """
+    Returns index of worker process handling account. Same account always
+    goes to same process, so that its connections are reused.
+    """
+    return zlib.crc32(bytes(accountName, 'utf8')) % len(_shards)
+
+
+def submit(account, call, **params):
+    """
+    Call to API for account in the worker process of its shard.
+
+    account:    account dict
+    call:       api function (has to pass can_run())
+    params:     parameters for call
+
+    Returns Future of response.
+    """
+    if not can_run(call):
+        future = Future()
+        future.set_exception(BitmexCoreException(
+            "Call can't be run in worker process: " + repr(call)))
+        return future
+    shard = _shards[shard_of(account["name"])]
+    return shard.submit(call, account["host"], account["key"], account["secret"],
+                        params)
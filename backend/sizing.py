@@ -0,0 +1,85 @@
+"""
+Order sizing. Turns available margins of many accounts into order quantities
+valid for the instrument (lot size, maximum order quantity) and finds orders
+the exchange would reject before they are sent.
+
+Pure python (list comprehensions over all accounts), so there is no dependency
+on numerical libraries.
+"""
+
+
+#
+# Functions
+#
+
+def round_to(value, step):
+    """
+    Round value to nearest multiple of step (tick or lot size).
+
+    Returns rounded number (int if step is whole).
+    """
+    rounded = step * round(float(value) / step)
+    if float(step).is_integer():
+        return int(rounded)
+    return rounded
+
+
+def quantities(margins, percent, marginPerContract, instrument):
+    """
+    Compute order quantity of each account from its available margin.
+
+    margins:            list of available margins (in bitcoins)
+    percent:            order value = (percent / 100) * available margin
+    marginPerContract:  how much margin is equal to one contract (in bitcoin)
+    instrument:         instrument dict with lotSize and maxOrderQty (see
+                        backend.instruments)
+
+    Returns list of ints, rounded to lot size and capped by maximum order
+    quantity (0 where margin isn't enough for one lot).
+    """
+    lot = instrument.get("lotSize") or 1
+    limit = instrument.get("maxOrderQty")
+    ratio = percent / 100.0 / marginPerContract
+    result = [round_to(x * ratio, lot) for x in margins]
+    if limit:
+        result = [min(x, limit) for x in result]
+    return result
+
+
+def check(instrument, orderQty=None, price=None, stopPx=None):
+    """
+    Find out whether the exchange would reject order because of its quantity
+    or prices.
+
+    instrument:     instrument dict (see backend.instruments)
+    orderQty:       order quantity (None to skip)
+    price:          limit price (None to skip)
+    stopPx:         trigger price (None to skip)
+
+    Returns reason str if order would be rejected, None otherwise.
+    """
+    lot = instrument.get("lotSize") or 1
+    tick = instrument.get("tickSize")
+    limit = instrument.get("maxOrderQty")
+    maxPrice = instrument.get("maxPrice")
+    if orderQty is not None:
+        if orderQty == 0:
+            return "Order quantity is zero."
+        if abs(orderQty) % lot:
+            return "Order quantity " + str(orderQty) + " isn't a multiple of lot " \
+                   "size " + str(lot) + "."
+        if limit and abs(orderQty) > limit:
+            return "Order quantity " + str(orderQty) + " exceeds maximum of " + \
+                   str(limit) + "."
+    for name, value in (("Price", price), ("Stop price", stopPx)):
+        if value is None:
+            continue
+        if value <= 0:
+            return name + " " + str(value) + " isn't positive."
+        if maxPrice and value > maxPrice:
+            return name + " " + str(value) + " exceeds maximum of " + \
+                   str(maxPrice) + "."
+        if tick and abs(value / tick - round(value / tick)) > 1e-9:
+            return name + " " + str(value) + " isn't a multiple of tick size " + \
+                   str(tick) + "."
+    return None
@@ -0,0 +1,298 @@
+"""
+Local persistent store of orders, executions, positions and margins.
+"""
+
+import sqlite3
+import threading
+
+from json import dumps, loads
+from datetime import datetime
+
+from backend.exceptions import BitmexStoreException
+
+
+#
+# Constants
+#
+
+SAVEFILE = "./store.db"  # Default store savefile location
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    account TEXT NOT NULL,
+    orderID TEXT NOT NULL,
+    symbol TEXT,
+    ordStatus TEXT,
+    ordType TEXT,
+    time TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (account, orderID)
+);
+CREATE INDEX IF NOT EXISTS ordersTime ON orders (account, symbol, time);
+CREATE INDEX IF NOT EXISTS ordersStatus ON orders (account, ordStatus);
+
+CREATE TABLE IF NOT EXISTS executions (
+    account TEXT NOT NULL,
+    execID TEXT NOT NULL,
+    symbol TEXT,
+    time TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (account, execID)
+);
+CREATE INDEX IF NOT EXISTS executionsTime ON executions (account, symbol, time);
+
+CREATE TABLE IF NOT EXISTS positions (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    isOpen INTEGER,
+    time TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (account, symbol)
+);
+
+CREATE TABLE IF NOT EXISTS margins (
+    account TEXT NOT NULL,
+    time TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS marginsTime ON margins (account, time);
+"""
+
+
+#
+# Connection
+#
+
+_connection = None  # Opened sqlite connection
+_lock = threading.Lock()  # Connection is shared by monitor threads
+
+
+#
+# Functions
+#
+
+# Utility
+
+def _execute(query: str, params=()):
+    """
+    Execute query on opened store and commit it.
+
+    Returns list of fetched rows.
+    """
+    if _connection is None:
+        raise BitmexStoreException("Store isn't opened.")
+    with _lock:
+        try:
+            rows = _connection.execute(query, params).fetchall()
+            _connection.commit()
+        except Exception as e:
+            raise BitmexStoreException(str(e))
+    return rows
+
+
+def _execute_many(query: str, params):
+    """
+    Execute query on opened store once for each item of params and commit.
+    """
+    if _connection is None:
+        raise BitmexStoreException("Store isn't opened.")
+    with _lock:
+        try:
+            _connection.executemany(query, params)
+            _connection.commit()
+        except Exception as e:
+            raise BitmexStoreException(str(e))
+
+
+# Manipulating with savefile
+
+def open(savefile: str = SAVEFILE):
+    """
+    Open store savefile (it will be created if it doesn't exist).
+
+    savefile:   location of savefile
+    """
+    global _connection
+    close()
+    try:
+        connection = sqlite3.connect(savefile, check_same_thread=False)
+        connection.executescript(SCHEMA)
+    except Exception as e:
+        raise BitmexStoreException("Internal Error: " + str(e) + " Is '" +
+                                   savefile + "' really a store savefile?")
+    _connection = connection
+
+
+def close():
+    """
+    Close opened store. Does nothing if no store is opened.
+    """
+    global _connection
+    if _connection is not None:
+        with _lock:
+            _connection.close()
+            _connection = None
+
+
+def is_open():
+    """
+    Returns if store is opened.
+    """
+    return _connection is not None
+
+
+# Watermarks
+
+def watermark(table: str, accountName: str):
+    """
+    Get time of newest stored record of account.
+
+    table:          "orders" or "executions"
+    accountName:    name of account
+
+    Returns time string or None if nothing is stored.
+    """
+    if table not in ("orders", "executions"):
+        raise BitmexStoreException("Internal Error: No watermark for table " +
+                                   str(table) + ".")
+    rows = _execute("SELECT MAX(time) FROM " + table + " WHERE account = ?",
+                    (accountName,))
+    return rows[0][0]
+
+
+# Writing
+
+def put_orders(accountName: str, orders):
+    """
+    Insert orders of account or replace older versions of them.
+
+    accountName:    name of account
+    orders:         iterable of raw order dicts
+    """
+    _execute_many("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  ((accountName, x["orderID"], x.get("symbol"), x.get("ordStatus"),
+                    x.get("ordType"), x.get("transactTime"), dumps(x))
+                   for x in orders))
+
+
+def put_executions(accountName: str, executions):
+    """
+    Insert executions of account (already stored ones are skipped).
+
+    accountName:    name of account
+    executions:     iterable of raw execution dicts
+    """
+    _execute_many("INSERT OR IGNORE INTO executions VALUES (?, ?, ?, ?, ?)",
+                  ((accountName, x["execID"], x.get("symbol"),
+                    x.get("transactTime"), dumps(x))
+                   for x in executions))
+
+
+def put_positions(accountName: str, positions):
+    """
+    Replace all stored positions of account.
+
+    accountName:    name of account
+    positions:      iterable of raw position dicts
+    """
+    _execute("DELETE FROM positions WHERE account = ?", (accountName,))
+    _execute_many("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?)",
+                  ((accountName, x["symbol"], int(bool(x.get("isOpen"))),
+                    x.get("timestamp"), dumps(x))
+                   for x in positions))
+
+
+def put_margin(accountName: str, margin: dict, time: datetime = None):
+    """
+    Append margin snapshot of account.
+
+    accountName:    name of account
+    margin:         raw user margin dict
+    time:           when was the snapshot taken (now if None)
+    """
+    if time is None:
+        time = datetime.utcnow()
+    _execute("INSERT INTO margins VALUES (?, ?, ?)",
+             (accountName, time.isoformat(), dumps(margin)))
+
+
+# Reading
+
+def get_orders(accountName: str, symbol: str = None, statuses=None,
+               startTime: str = None):
+    """
+    Get stored orders of account ordered by time.
+
+    accountName:    name of account
+    symbol:         only orders with this symbol
+    statuses:       only orders with one of these ordStatus values
+    startTime:      only orders with this or later transactTime
+
+    Returns list of raw order dicts.
+    """
+    query = "SELECT data FROM orders WHERE account = ?"
+    params = [accountName]
+    if symbol is not None:
+        query += " AND symbol = ?"
+        params.append(symbol)
+    if statuses is not None:
+        query += " AND ordStatus IN (" + ", ".join("?" for x in statuses) + ")"
+        params += list(statuses)
+    if startTime is not None:
+        query += " AND time >= ?"
+        params.append(startTime)
+    query += " ORDER BY time"
+    return [loads(x[0]) for x in _execute(query, params)]
+
+
+def get_executions(accountName: str, symbol: str = None, startTime: str = None):
+    """
+    Get stored executions of account ordered by time.
+
+    accountName:    name of account
+    symbol:         only executions with this symbol
+    startTime:      only executions with this or later transactTime
+
+    Returns list of raw execution dicts.
+    """
+    query = "SELECT data FROM executions WHERE account = ?"
+    params = [accountName]
+    if symbol is not None:
+        query += " AND symbol = ?"
+        params.append(symbol)
+    if startTime is not None:
+        query += " AND time >= ?"
+        params.append(startTime)
+    query += " ORDER BY time"
+    return [loads(x[0]) for x in _execute(query, params)]
+
+
+def get_positions(accountName: str, isOpen: bool = None):
+    """
+    Get stored positions of account.
+
+    accountName:    name of account
+    isOpen:         if set, only open (true) or closed (false) positions
+
+    Returns list of raw position dicts.
+    """
+    query = "SELECT data FROM positions WHERE account = ?"
+    params = [accountName]
+    if isOpen is not None:
+        query += " AND isOpen = ?"
+        params.append(int(isOpen))
+    return [loads(x[0]) for x in _execute(query, params)]
+
+
+def get_margin(accountName: str):
+    """
+    Get newest stored margin snapshot of account.
+
+    accountName:    name of account
+
+    Returns raw user margin dict or None if nothing is stored.
+    """
+    rows = _execute("SELECT data FROM margins WHERE account = ? "
+                    "ORDER BY time DESC LIMIT 1", (accountName,))
+    if not rows:
+        return None
+    return loads(rows[0][0])
@@ -0,0 +1,177 @@
+"""
+Lightweight tracing of core functions and api calls. Finished spans are kept in
+a ring buffer and can be dumped as Chrome trace-event JSON (open it in
+chrome://tracing or https://ui.perfetto.dev).
+"""
+
+import os
+import threading
+import functools
+
+from time import perf_counter
+from json import dumps
+from collections import deque
+
+from backend.exceptions import BitmexException
+
+
+#
+# Constants
+#
+
+SAVEFILE = "./trace.json"  # Default location of dumped traces
+BUFFER_SIZE = 100000  # How many finished spans to remember
+CAPTURED_ARGS = ("accountName", "accountNames", "symbol")  # Arguments of traced
+                                                           # functions saved in spans
+
+
+#
+# Buffer
+#
+
+enabled = True  # Set to false to turn tracing off
+_spans = deque(maxlen=BUFFER_SIZE)  # Finished spans
+_local = threading.local()  # Per thread stack of open span names
+_origin = perf_counter()  # Trace timestamps are relative to this
+
+
+#
+# Classes
+#
+
+class span:
+    """
+    Context manager measuring enclosed block as one span.
+
+    name:   span name (i.e. "order_limit" or "POST /order")
+    args:   additional values saved with span (account, symbol, endpoint, ...)
+    """
+
+    def __init__(self, name: str, **args):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        if enabled:
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            if stack:
+                self.args["parent"] = stack[-1]
+            stack.append(self.name)
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if self.start is None:
+            return False
+        end = perf_counter()
+        _local.stack.pop()
+        if excType is not None:
+            self.args["error"] = excType.__name__
+        _spans.append((self.name, self.start, end, threading.get_ident(),
+                       self.args))
+        return False
+
+
+#
+# Functions
+#
+
+def traced(function):
+    """
+    Decorator wrapping every call of function in a span. Arguments named in
+    CAPTURED_ARGS are saved with the span.
+    """
+    code = function.__code__
+    names = code.co_varnames[:code.co_argcount]
+    captured = [(i, name) for i, name in enumerate(names) if name in CAPTURED_ARGS]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        spanArgs = {}
+        for i, name in captured:
+            if i < len(args):
+                spanArgs[name] = args[i]
+            elif name in kwargs:
+                spanArgs[name] = kwargs[name]
+        with span(function.__name__, **spanArgs):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def current():
+    """
+    Returns name of innermost open span of this thread or None. Used to carry
+    parent span to worker threads.
+    """
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return None
+    return stack[-1]
+
+
+def record(name: str, start: float, end: float, **args):
+    """
+    Record finished span measured by caller (perf_counter() start and end).
+    Used by asyncio code, where many requests interleave on one thread and
+    can't share its stack of open spans.
+    """
+    if enabled:
+        _spans.append((name, start, end, threading.get_ident(), args))
+
+
+def clear():
+    """
+    Forget all recorded spans.
+    """
+    _spans.clear()
+
+
+def get_spans():
+    """
+    Returns list of recorded spans as {
+        "name": str,
+        "start": float (seconds),
+        "duration": float (seconds),
+        "thread": int,
+        "args": dict
+    }.
+    """
+    return [{
+        "name": name,
+        "start": start - _origin,
+        "duration": end - start,
+        "thread": thread,
+        "args": args
+    } for name, start, end, thread, args in list(_spans)]
+
+
+def dump(savefile: str = SAVEFILE):
+    """
+    Write recorded spans as Chrome trace-event JSON. Warning: Replaces old
+    savefile.
+    """
+    pid = os.getpid()
+    events = []
+    for name, start, end, thread, args in list(_spans):
+        events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - _origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": pid,
+            "tid": thread,
+            "args": {k: str(v) for k, v in args.items()}
+        })
+    try:
+        f = open(savefile, "w")
+    except Exception as e:
+        raise BitmexException(str(e))
+
+    f.write(dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+    f.close()
@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+"""
+Microbenchmark of request signing. Run from repository root:
+python3 -m benchmarks.signing
+"""
+
+import hashlib
+import hmac
+import timeit
+
+from urllib.parse import urlparse
+
+import backend.api as api
+
+
+#
+# Constants
+#
+
+NUMBER = 100000  # How many signatures per measurement
+KEY = "xxxxxxxxxxxxxxxxxxxxxxxx"
+SECRET = "yyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyy"
+URL = "https://www.bitmex.com/api/v1/order"
+PATH = "/api/v1/order"
+BODY = ('{"symbol": "XBTUSD", "ordType": "Limit", "orderQty": 100, '
+        '"price": 10000, "side": "Buy"}')
+
+
+#
+# Functions
+#
+
+def _old_signature(secret, verb, url, json, expires):
+    """
+    Signing as it was done before Signer was introduced.
+    """
+    parsedURL = urlparse(url)
+    path = parsedURL.path
+    if parsedURL.query:
+        path = path + '?' + parsedURL.query
+    message = verb + path + str(expires) + json
+    return hmac.new(bytes(secret, 'utf8'), bytes(message, 'utf8'),
+                    digestmod=hashlib.sha256).hexdigest()
+
+
+def main():
+    signer = api.Signer(KEY, SECRET)
+    body = bytes(BODY, 'utf8')
+    assert (signer.signature("POST", PATH, body, 1000) ==
+            _old_signature(SECRET, "POST", URL, BODY, 1000))
+
+    cases = (
+        ("urlparse + new hmac", lambda: _old_signature(SECRET, "POST", URL, BODY, 1000)),
+        ("Signer, str body", lambda: signer.signature("POST", PATH, BODY, 1000)),
+        ("Signer, bytes body", lambda: signer.signature("POST", PATH, body, 1000)),
+    )
+    for name, function in cases:
+        seconds = min(timeit.repeat(function, number=NUMBER, repeat=3))
+        print("%-22s %6.2f us per call" % (name, seconds / NUMBER * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -108,6 +108,16 @@ class Accounts(tkinter.Frame):
             self.names.append(name)
             self.vars.append(var)
 
+        for group in accounts.get_groups():
+            name = accounts.GROUP_PREFIX + group
+            var = tkinter.IntVar(self)
+
+            check = tkinter.Checkbutton(self, text=name, var=var)
+            check.pack(anchor=tkinter.W)
+
+            self.names.append(name)
+            self.vars.append(var)
+
     def get_names(self):
         """
         Returns currently selected account names.
@@ -337,6 +347,7 @@ class LossCalc(tkinter.Frame):
                                     command=lambda: window.calculate(short=False))
         shortButton = tkinter.Button(self, text="Calculate short",
                                      command=lambda: window.calculate(short=True))
+        self.detailLabel = tkinter.Label(self, text="", justify=tkinter.LEFT)
 
         textLabel.grid(column=0, row=0)
         self.numLabel.grid(column=1, row=0)
@@ -344,6 +355,7 @@ class LossCalc(tkinter.Frame):
         self.pctNumLabel.grid(column=1, row=1)
         longButton.grid(column=0, row=2)
         shortButton.grid(column=1, row=2)
+        self.detailLabel.grid(column=0, row=3, columnspan=2)
 
     def set_loss(self, loss):
         """
@@ -356,3 +368,10 @@ class LossCalc(tkinter.Frame):
         Sets currently displayed calculated loss in percent.
         """
         self.pctNumLabel.configure(text=str(percent))
+
+    def set_details(self, text):
+        """
+        Sets currently displayed per account details (share of margin,
+        liquidation price).
+        """
+        self.detailLabel.configure(text=text)
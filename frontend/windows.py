@@ -9,8 +9,12 @@ import tkinter.ttk
 import frontend.orderframes as orderframes
 
 import backend.accounts as accounts
+import backend.appsettings as appsettings
 import backend.core as core
-from backend.exceptions import BitmexAccountsException, BitmexGUIException
+import backend.pretrade as pretrade
+import backend.services as services
+from backend.exceptions import BitmexException, BitmexAccountsException, \
+                               BitmexGUIException
 
 from utility import significant_figures
 
@@ -25,6 +29,24 @@ RETRY_DELAY = 9000  # Standard delay before trying to request crucial data again
 SPINBOX_LIMIT = 1000000000
 
 
+#
+# Functions
+#
+
+def show_report(report):
+    """
+    Show error message listing accounts whose orders couldn't be cancelled or
+    amended. Takes result of core.order_cancel_many(), core.order_cancel_all()
+    or core.order_amend_many().
+    """
+    if report["failed"]:
+        lines = [name + ": " + error for name, error in report["failed"].items()]
+        succeeded = ", ".join(x + (" (partly)" if x in report["failed"] else "")
+                              for x in report["succeeded"]) or "none"
+        tkinter.messagebox.showerror("Error", "\n".join(lines) +
+                                     "\n\nSucceeded: " + succeeded)
+
+
 #
 # Classes
 #
@@ -51,6 +73,11 @@ class Main(tkinter.Tk):
             print("No accounts savefile found, creating a blank one now...")
             accounts.save()
             accounts.load()
+        try:
+            appsettings.load()
+        except BitmexException:
+            print("No app settings savefile found, creating one now...")
+            appsettings.save()
 
         # Frontend
         self.protocol("WM_DELETE_WINDOW", self.quit)
@@ -65,6 +92,7 @@ class Main(tkinter.Tk):
         accWindow = AccountManagement(hidden=True)
         newWindow = SelectOrder(hidden=True)
         calcWindow = Calculator(hidden=True)
+        ordsWindow.link(stpsWindow)
 
         self.windows = [
             posWindow,
@@ -118,6 +146,10 @@ class Main(tkinter.Tk):
                                     text="Show All Windows",
                                     command=lambda: [x.show() for x in self.windows],
                                     **self.BUTTON_PARAMS)
+        self.heartbeatVar = tkinter.IntVar(self, value=int(appsettings.get_heartbeat()))
+        heartbeatCheck = tkinter.Checkbutton(frame, var=self.heartbeatVar,
+                                             text="Cancel orders if this program dies",
+                                             command=lambda: self.toggle_heartbeat())
 
         posButton.grid(row=0, column=0)
         insButton.grid(row=0, column=1)
@@ -129,6 +161,7 @@ class Main(tkinter.Tk):
         calcButton.grid(row=3, column=1)
         hideButton.grid(row=4, column=0)
         showButton.grid(row=4, column=1)
+        heartbeatCheck.grid(row=5, column=0, columnspan=2)
         frame.pack()
 
         # Alive flag
@@ -142,6 +175,15 @@ class Main(tkinter.Tk):
             window.update()
         tkinter.Tk.update(self, *args, **kwargs)
 
+    def toggle_heartbeat(self):
+        """
+        Start or stop dead man's switch according to its checkbutton.
+        """
+        try:
+            services.set_heartbeat(bool(self.heartbeatVar.get()))
+        except BitmexException as e:
+            tkinter.messagebox.showerror("Error", str(e))
+
     def quit(self):
         """
         Cleans up and kills the program.
@@ -288,6 +330,10 @@ class Limit(AbstractOrder):
         self.stopLossFrame.pack()
         self.lossCalcFrame.pack()
 
+        self.short = None  # Side of last calculation, None if there wasn't any
+        self.bind("<KeyRelease>", self._live_calculate)
+        self.bind("<ButtonRelease>", self._live_calculate)
+
     def send(self, sell=False):
         accountNames = self.accFrame.get_names()
         symbol = self.mainFrame.get_symbol()
@@ -317,41 +363,69 @@ class Limit(AbstractOrder):
 
     def calculate(self, short=False):
         """
-        Calculates potential loss and updates loss calc label
+        Refresh instrument and margins of selected accounts, then calculate
+        potential loss.
         """
-        # Get values
         symbol = self.mainFrame.get_symbol()
-        qty = float(self.mainFrame.get_qty())
-        entryPx = float(self.limitFrame.get_limit_price())
-        exitPx = float(self.stopLossFrame.get_trigger_price())
-
         if symbol == "":
             tkinter.messagebox.showerror("Error", "Symbol is required.")
-
-        # Calculation
+            return
+        accountNames = self.accFrame.get_names() or [accounts.get_all()[0]["name"]]
         try:
-            foo = accounts.get_all()[0]["name"]
-            inverse = core.instrument_is_inverse(foo, symbol)
-            entryValue = core.instrument_margin_per_contract(foo, symbol, entryPx)
-            exitValue = core.instrument_margin_per_contract(foo, symbol, exitPx)
+            pretrade.refresh(accountNames, symbol)
         except Exception as e:
             tkinter.messagebox.showerror("Error", str(e))
             raise e
-        entryValue *= qty
-        exitValue *= qty
+        self.short = short
+        self._show_calculation()
 
-        if short != inverse:  # Note that we are calculating loss, not profit
-            # Short or (Long with inverse)stopLossFrame
-            loss = exitValue - entryValue
-        else:
-            # Long or (Short with inverse)
-            loss = entryValue - exitValue
-        percent = loss / entryValue * 100
-        percent = significant_figures(percent, self.SIGNIFICANT_FIGURES)
+    def _live_calculate(self, event=None):
+        """
+        Recalculate potential loss from cached data whenever inputs change
+        (after calculate() was used at least once).
+        Internal method.
+        """
+        if self.short is not None:
+            try:
+                self._show_calculation()
+            except Exception:  # Incomplete input while typing
+                pass
+
+    def _show_calculation(self):
+        """
+        Calculates potential loss of all selected accounts and updates loss calc
+        labels. Doesn't send any requests.
+        Internal method.
+        """
+        # Get values
+        symbol = self.mainFrame.get_symbol()
+        qty = float(self.mainFrame.get_qty())
+        entryPx = float(self.limitFrame.get_limit_price())
+        exitPx = float(self.stopLossFrame.get_trigger_price())
+        accountNames = self.accFrame.get_names() or [accounts.get_all()[0]["name"]]
+
+        # Calculation
+        result = pretrade.evaluate(accountNames, symbol, qty, entryPx, exitPx,
+                                   self.short)
+        loss = significant_figures(result["loss"], self.SIGNIFICANT_FIGURES)
+        percent = significant_figures(result["percent"], self.SIGNIFICANT_FIGURES)
+        lines = []
+        for account in result["accounts"]:
+            if account["marginPercent"] is None:
+                lines.append(account["name"] + ": margin unknown")
+            else:
+                lines.append("%s: %s %% of margin, uses %s %%" % (
+                    account["name"],
+                    significant_figures(account["marginPercent"], 3),
+                    significant_figures(account["marginUsage"], 3)))
+        liquidation = significant_figures(result["liquidationPrice"],
+                                          self.SIGNIFICANT_FIGURES)
+        lines.append("Liquidation ~ " + str(liquidation))
 
         # Set values
         self.lossCalcFrame.set_loss(loss)
         self.lossCalcFrame.set_percent(percent)
+        self.lossCalcFrame.set_details("\n".join(lines))
 
 
 class TriggerLimit(AbstractOrder):
@@ -872,12 +946,13 @@ class Positions(AbstractChild):
         self.tree.delete(*self.tree.get_children())
 
         # Get all acount names
-        names = [x["name"] for x in accounts.get_all()]
+        names = accounts.get_names()
 
         # Get info
         success = False
         try:
-            accs = core.position_info(names)
+            accs = core.position_info(names,
+                                      fromStore=services.from_store("positions"))
             success = True
             self.delay_multiplier = 1  # Reset to normal value
         except Exception as e:
@@ -1014,7 +1089,7 @@ class Instruments(AbstractChild):
         Query backend for open instruments and place them into treeview.
         """
         self.tree.delete(*self.tree.get_children())
-        accs = core.instrument_info([x["name"] for x in accounts.get_all()])
+        accs = core.instrument_info(accounts.get_names())
 
         # Fill tree
         for account in accs:
@@ -1069,65 +1144,41 @@ class Instruments(AbstractChild):
             tkinter.messagebox.showerror("Error", str(e))
 
 
-class ActiveOrders(AbstractChild):
+class AbstractOrders(AbstractChild):
     """
-    Window for listing all active orders per each account. Is able to set their
-    limit price and contract quantity.
+    Abstract class. Only for inheriting.
+
+    Super of active and stop orders windows. Lists open orders per each account
+    and is able to cancel and amend them, also many selected orders at once.
+    _order_info() method is supposed to be overridden.
     """
 
-    TITLE = "Active Orders"
     MIN_TREE_HEIGHT = 10
     MAX_TREE_HEIGHT = 30
     TREE_HEIGHT_MULTIPLIER = 3
     COLUMN_PARAMS = {
         "width": 100
     }
-    VAR = (
-        "qty",
-        "orderPrice",
-        "displayQty",
-        "filled",
-        "remaining",
-        "orderValue",
-        "fillPrice",
-        "type",
-        "status",
-        "execInst",
-        "time"
-    )
     FIRST_TEXT = "Symbol"
-    TEXT = (
-        "Qty",
-        "Order Price",
-        "Display Qty",
-        "Filled",
-        "Remaining",
-        "Order Value",
-        "Fill Price",
-        "Type",
-        "Status",
-        "execInst",
-        "Time"
-    )
     FIRST_WIDTH = 100
-    WIDTH = (
-        40,
-        100,
-        90,
-        60,
-        90,
-        100,
-        100,
-        50,
-        60,
-        200,
-        190
+    STOP = False  # Price shifts move stop price instead of limit price
+    SHIFT_TEXT = "Shift Prices"
+    ANY = "All"  # Filter value letting every order through
+    SIDES = ("Buy", "Sell")
+    AMENDED_COLUMNS = (  # Amended order field, tree column showing it
+        ("price", "orderPrice"),
+        ("stopPx", "stopPrice")
     )
 
     def __init__(self, *args, **kwargs):
         AbstractChild.__init__(self, *args, **kwargs)
 
         frame = tkinter.Frame(self)
+        filterFrame = tkinter.Frame(frame)
+        self.symbolBox = tkinter.ttk.Combobox(filterFrame, state="readonly")
+        self.sideBox = tkinter.ttk.Combobox(filterFrame, state="readonly",
+                                            values=(self.ANY,) + self.SIDES)
+        self.typeBox = tkinter.ttk.Combobox(filterFrame, state="readonly")
         self.tree = tkinter.ttk.Treeview(frame, height=self.MIN_TREE_HEIGHT)
         subframe = tkinter.Frame(frame)
         updateButton = tkinter.Button(subframe,
@@ -1136,6 +1187,9 @@ class ActiveOrders(AbstractChild):
         cancelButton = tkinter.Button(subframe,
                                       text="Cancel Order",
                                       command=self.cancel_order)
+        cancelAllButton = tkinter.Button(subframe,
+                                         text="Cancel All",
+                                         command=self.cancel_all)
         self.qtySpin = tkinter.Spinbox(subframe, from_=1, to=SPINBOX_LIMIT)
         qtyButton = tkinter.Button(subframe,
                                    text="Amend Quantity",
@@ -1144,6 +1198,26 @@ class ActiveOrders(AbstractChild):
         pxButton = tkinter.Button(subframe,
                                   text="Amend Order Price",
                                   command=self.amend_limit_price)
+        extraRows = self._extra_rows(subframe)
+        self.tickSpin = tkinter.Spinbox(subframe, from_=-SPINBOX_LIMIT, to=SPINBOX_LIMIT)
+        self.tickSpin.delete(0, "end")
+        self.tickSpin.insert(0, "1")
+        tickButton = tkinter.Button(subframe,
+                                    text=self.SHIFT_TEXT + " (ticks)",
+                                    command=self.shift_prices_ticks)
+        self.percentSpin = tkinter.Spinbox(subframe, from_=-100, to=SPINBOX_LIMIT,
+                                           increment=0.1)
+        self.percentSpin.delete(0, "end")
+        self.percentSpin.insert(0, "1")
+        percentButton = tkinter.Button(subframe,
+                                       text=self.SHIFT_TEXT + " (%)",
+                                       command=self.shift_prices_percent)
+        self.scaleSpin = tkinter.Spinbox(subframe, from_=1, to=SPINBOX_LIMIT)
+        self.scaleSpin.delete(0, "end")
+        self.scaleSpin.insert(0, "100")
+        scaleButton = tkinter.Button(subframe,
+                                     text="Scale Quantities (%)",
+                                     command=self.scale_quantities)
 
         self.tree["columns"] = self.VAR
         self.tree.heading("#0", text=self.FIRST_TEXT, anchor=tkinter.W)
@@ -1152,16 +1226,65 @@ class ActiveOrders(AbstractChild):
             self.tree.heading(v, text=t, anchor=tkinter.W)
             self.tree.column(v, width=w)
 
+        for column, (text, box) in enumerate((("Symbol", self.symbolBox),
+                                              ("Side", self.sideBox),
+                                              ("Type", self.typeBox))):
+            tkinter.Label(filterFrame, text=text).grid(column=2 * column, row=0)
+            box.set(self.ANY)
+            box.bind("<<ComboboxSelected>>", self._filter_changed)
+            box.grid(column=2 * column + 1, row=0)
+
         updateButton.grid(column=0, row=0)
         cancelButton.grid(column=1, row=0)
-        self.qtySpin.grid(column=0, row=1)
-        qtyButton.grid(column=1, row=1)
-        self.pxSpin.grid(column=0, row=2)
-        pxButton.grid(column=1, row=2)
+        cancelAllButton.grid(column=2, row=0)
+        rows = [(self.qtySpin, qtyButton), (self.pxSpin, pxButton)]
+        rows += extraRows
+        rows += [(self.tickSpin, tickButton), (self.percentSpin, percentButton),
+                 (self.scaleSpin, scaleButton)]
+        for row, (spin, button) in enumerate(rows, 1):
+            spin.grid(column=0, row=row)
+            button.grid(column=1, row=row)
+        filterFrame.pack()
         self.tree.pack()
         subframe.pack()
         frame.pack()
 
+        self.linked = None  # Orders window sharing snapshots with this one
+        self.snapshot = None  # Last shown open orders snapshot
+
+    def _extra_rows(self, subframe):
+        """
+        Create additional amending widgets shown under order price ones.
+        Internal method.
+
+        Returns list of (spinbox, button) tuples.
+        """
+        return []
+
+    def _order_info(self, names, snapshot):
+        """
+        Turn open orders snapshot into orders listed by this window.
+        Internal method.
+
+        Returns result of core.active_order_info() or core.stop_order_info().
+        """
+        pass
+
+    def _get_filters(self):
+        """
+        Returns (symbol, side, order type) chosen in filters, None for any.
+        """
+        return tuple(None if x.get() == self.ANY else x.get()
+                     for x in (self.symbolBox, self.sideBox, self.typeBox))
+
+    def _filter_changed(self, event=None):
+        """
+        Show last snapshot again with new filters, without asking server.
+        Internal method.
+        """
+        if self.snapshot is not None:
+            self.update_orders(self.snapshot)
+
     def _get_selected(self):
         """
         Returns tupple of currently selected (account name, order id).
@@ -1179,6 +1302,31 @@ class ActiveOrders(AbstractChild):
 
         return name, id
 
+    def _get_selection(self):
+        """
+        Returns list of (account name, order id) of all selected orders.
+        Selecting an account selects all of its orders.
+        """
+        result = []
+        for iid in self.tree.selection():
+            parent_iid = self.tree.parent(iid)
+            if parent_iid:  # Order
+                result.append((self.tree.item(parent_iid)["text"], iid))
+            else:  # Account
+                name = self.tree.item(iid)["text"]
+                result += [(name, x) for x in self.tree.get_children(iid)]
+        if not result:
+            tkinter.messagebox.showerror("Error", "No item selected.")
+            raise BitmexGUIException("No item selected.")
+        return list(dict.fromkeys(result))  # Without duplicates
+
+    def link(self, window):
+        """
+        Share open orders snapshots with other orders window.
+        """
+        self.linked = window
+        window.linked = self
+
     def show(self):
         """
         Overriding so that this window updates its positions when shown.
@@ -1186,17 +1334,46 @@ class ActiveOrders(AbstractChild):
         AbstractChild.show(self)
         self.update_orders()
 
-    def update_orders(self):
-        """
-        Query backend for active orders and place them into treeview.
-        """
+    def update_orders(self, snapshot=None):
+        """
+        Query backend for orders and place those passing filters into
+        treeview. Linked window (see link()) is filled from the same open
+        orders snapshot, so both windows are served by one request per account.
+        When local store is synced, that request syncs the store and orders
+        are read from it.
+
+        snapshot:   result of core.open_order_snapshot() to use instead of
+                    fetching a new one
+        """
+        names = accounts.get_names()
+        if snapshot is None and services.from_store("orders"):
+            core.sync_orders(names)
+            snapshot = core.open_order_snapshot(names, fromStore=True)
+            if self.linked is not None and not self.linked.hidden:
+                self.linked.update_orders(snapshot)
+        elif snapshot is None:
+            snapshot = core.open_order_snapshot(names)
+            if self.linked is not None and not self.linked.hidden:
+                self.linked.update_orders(snapshot)
+        self.snapshot = snapshot
         self.tree.delete(*self.tree.get_children())
-        accs = core.active_order_info([x["name"] for x in accounts.get_all()])
+        accs = self._order_info(names, snapshot)
+
+        # Fill filters
+        allOrders = [x for account in accs for x in account["orders"]]
+        self.symbolBox["values"] = (self.ANY,) + tuple(sorted(
+            {x["symbol"] for x in allOrders}))
+        self.typeBox["values"] = (self.ANY,) + tuple(sorted(
+            {x["type"] for x in allOrders}))
+        symbol, side, ordType = self._get_filters()
 
         # Fill tree
         for account in accs:
             name = account["name"]
-            orders = account["orders"]
+            orders = [x for x in account["orders"]
+                      if (symbol is None or x["symbol"] == symbol) and
+                      (side is None or (x["qty"] < 0) == (side == "Sell")) and
+                      (ordType is None or x["type"] == ordType)]
             orders.sort(key=lambda x: x["time"], reverse=True)  # Sort orders
 
             parent = self.tree.insert("", "end", text=name, open=True,
@@ -1223,12 +1400,42 @@ class ActiveOrders(AbstractChild):
 
     def cancel_order(self):
         """
-        Query backend to cancel order.
+        Query backend to cancel all selected orders at once.
         """
-        name, id = self._get_selected()
+        orders = self._get_selection()
+        try:
+            report = core.order_cancel_many(orders)
+            self.update_orders()
+            show_report(report)
+        except Exception as e:
+            tkinter.messagebox.showerror("Error", str(e))
+
+    def cancel_all(self):
+        """
+        Query backend to cancel all orders of all accounts matching filters at
+        once. Unless one order type is chosen, only types of listed orders are
+        cancelled, so that this window doesn't cancel orders of the other one.
+        """
+        names = []
+        types = set()
+        count = 0
+        for parent in self.tree.get_children():
+            children = self.tree.get_children(parent)
+            if children:
+                names.append(self.tree.item(parent)["text"])
+                types.update(self.tree.set(x, "type") for x in children)
+                count += len(children)
+        if not count:
+            return
+        if not tkinter.messagebox.askyesno("Cancel All", "Cancel " + str(count) +
+                                           " orders?"):
+            return
+        symbol, side, ordType = self._get_filters()
         try:
-            core.order_cancel(name, id)
+            report = core.order_cancel_all(names, symbol, side,
+                                           ordType or sorted(types))
             self.update_orders()
+            show_report(report)
         except Exception as e:
             tkinter.messagebox.showerror("Error", str(e))
 
@@ -1256,20 +1463,143 @@ class ActiveOrders(AbstractChild):
         except Exception as e:
             tkinter.messagebox.showerror("Error", str(e))
 
+    def _apply_amendments(self, amendments):
+        """
+        Show amended values in tree right away, before the server confirms them.
+        Internal method.
+        """
+        for name, id, values in amendments:
+            for field, column in self.AMENDED_COLUMNS:
+                if field in values and column in self.VAR:
+                    self.tree.set(id, column, str(values[field]))
+            if "leavesQty" in values:
+                sign = -1 if self.tree.set(id, "qty").startswith("-") else 1
+                filled = int(float(self.tree.set(id, "filled")))
+                self.tree.set(id, "qty", str(sign * (filled + values["leavesQty"])))
+                if "remaining" in self.VAR:
+                    self.tree.set(id, "remaining", str(values["leavesQty"]))
+
+    def _amend(self, amendments):
+        """
+        Query backend to amend orders at once, then reconcile tree with one
+        update.
+        Internal method.
+        """
+        if not amendments:
+            return
+        self._apply_amendments(amendments)
+        self.update_idletasks()
+        try:
+            report = core.order_amend_many(amendments)
+            self.update_orders()
+            show_report(report)
+        except Exception as e:
+            tkinter.messagebox.showerror("Error", str(e))
+            self.update_orders()
+
+    def shift_prices_ticks(self):
+        """
+        Query backend to shift prices of all selected orders by number of ticks.
+        """
+        orders = self._get_selection()
+        ticks = int(self.tickSpin.get())
+        try:
+            amendments = core.plan_price_shift(orders, ticks=ticks, stop=self.STOP)
+        except Exception as e:
+            tkinter.messagebox.showerror("Error", str(e))
+            return
+        self._amend(amendments)
+
+    def shift_prices_percent(self):
+        """
+        Query backend to shift prices of all selected orders by percentage.
+        """
+        orders = self._get_selection()
+        percent = float(self.percentSpin.get())
+        try:
+            amendments = core.plan_price_shift(orders, percent=percent, stop=self.STOP)
+        except Exception as e:
+            tkinter.messagebox.showerror("Error", str(e))
+            return
+        self._amend(amendments)
+
+    def scale_quantities(self):
+        """
+        Query backend to scale remaining quantities of all selected orders.
+        """
+        orders = self._get_selection()
+        factor = float(self.scaleSpin.get()) / 100
+        try:
+            amendments = core.plan_qty_scale(orders, factor)
+        except Exception as e:
+            tkinter.messagebox.showerror("Error", str(e))
+            return
+        self._amend(amendments)
+
+
+class ActiveOrders(AbstractOrders):
+    """
+    Window for listing all active orders per each account. Is able to set their
+    limit price and contract quantity, also for many selected orders at once.
+    """
+
+    TITLE = "Active Orders"
+    VAR = (
+        "qty",
+        "orderPrice",
+        "displayQty",
+        "filled",
+        "remaining",
+        "orderValue",
+        "fillPrice",
+        "type",
+        "status",
+        "execInst",
+        "time"
+    )
+    TEXT = (
+        "Qty",
+        "Order Price",
+        "Display Qty",
+        "Filled",
+        "Remaining",
+        "Order Value",
+        "Fill Price",
+        "Type",
+        "Status",
+        "execInst",
+        "Time"
+    )
+    WIDTH = (
+        40,
+        100,
+        90,
+        60,
+        90,
+        100,
+        100,
+        50,
+        60,
+        200,
+        190
+    )
+
+    def _order_info(self, names, snapshot):
+        """
+        Turn open orders snapshot into orders listed by this window.
+        Internal method.
+        """
+        return core.active_order_info(names, snapshot)
+
 
-class StopOrders(AbstractChild):
+class StopOrders(AbstractOrders):
     """
     Window for listing all stop and take profit orders per each account. Is able
-    to set their limit price, stop price and contract quantity.
+    to set their limit price, stop price and contract quantity, also for many
+    selected orders at once.
     """
 
     TITLE = "Stop Orders"
-    MIN_TREE_HEIGHT = 10
-    MAX_TREE_HEIGHT = 30
-    TREE_HEIGHT_MULTIPLIER = 3
-    COLUMN_PARAMS = {
-        "width": 100
-    }
     VAR = (
         "qty",
         "orderPrice",
@@ -1281,7 +1611,6 @@ class StopOrders(AbstractChild):
         "execInst",
         "time"
     )
-    FIRST_TEXT = "Symbol"
     TEXT = (
         "Qty",
         "Order Price",
@@ -1293,7 +1622,6 @@ class StopOrders(AbstractChild):
         "execInst",
         "Time"
     )
-    FIRST_WIDTH = 100
     WIDTH = (
         40,
         100,
@@ -1305,144 +1633,26 @@ class StopOrders(AbstractChild):
         200,
         200,
     )
+    STOP = True
+    SHIFT_TEXT = "Shift Stop Prices"
 
-    def __init__(self, *args, **kwargs):
-        AbstractChild.__init__(self, *args, **kwargs)
-
-        frame = tkinter.Frame(self)
-        self.tree = tkinter.ttk.Treeview(frame, height=self.MIN_TREE_HEIGHT)
-        subframe = tkinter.Frame(frame)
-        updateButton = tkinter.Button(subframe,
-                                      text="Update",
-                                      command=self.update_orders)
-        cancelButton = tkinter.Button(subframe,
-                                      text="Cancel Order",
-                                      command=self.cancel_order)
-        self.qtySpin = tkinter.Spinbox(subframe, from_=1, to=SPINBOX_LIMIT)
-        qtyButton = tkinter.Button(subframe,
-                                   text="Amend Quantity",
-                                   command=self.amend_quantity)
-        self.pxSpin = tkinter.Spinbox(subframe, from_=1, to=SPINBOX_LIMIT)
-        pxButton = tkinter.Button(subframe,
-                                  text="Amend Order Price",
-                                  command=self.amend_limit_price)
+    def _extra_rows(self, subframe):
+        """
+        Create stop price amending widgets.
+        Internal method.
+        """
         self.stopSpin = tkinter.Spinbox(subframe, from_=1, to=SPINBOX_LIMIT)
         stopButton = tkinter.Button(subframe,
                                     text="Amend Stop Price",
                                     command=self.amend_stop_price)
+        return [(self.stopSpin, stopButton)]
 
-        self.tree["columns"] = self.VAR
-        self.tree.heading("#0", text=self.FIRST_TEXT, anchor=tkinter.W)
-        self.tree.column("#0", width=self.FIRST_WIDTH)
-        for v, t, w in zip(self.VAR, self.TEXT, self.WIDTH):
-            self.tree.heading(v, text=t, anchor=tkinter.W)
-            self.tree.column(v, width=w)
-
-        updateButton.grid(column=0, row=0)
-        cancelButton.grid(column=1, row=0)
-        self.qtySpin.grid(column=0, row=1)
-        qtyButton.grid(column=1, row=1)
-        self.pxSpin.grid(column=0, row=2)
-        pxButton.grid(column=1, row=2)
-        self.stopSpin.grid(column=0, row=3)
-        stopButton.grid(column=1, row=3)
-        self.tree.pack()
-        subframe.pack()
-        frame.pack()
-
-    def _get_selected(self):
-        """
-        Returns tupple of currently selected (account name, order id).
-        """
-        selected_iid = self.tree.focus()
-        parent_iid = self.tree.parent(selected_iid)
-        parent = self.tree.item(parent_iid)
-
-        if not selected_iid:  # No item selected
-            tkinter.messagebox.showerror("Error", "No item selected.")
-            raise BitmexGUIException("No item selected.")
-
-        name = parent["text"]
-        id = selected_iid
-
-        return name, id
-
-    def show(self):
-        """
-        Overriding so that this window updates its positions when shown.
-        """
-        AbstractChild.show(self)
-        self.update_orders()
-
-    def update_orders(self):
-        """
-        Query backend for stop orders and place them into treeview.
-        """
-        self.tree.delete(*self.tree.get_children())
-        accs = core.stop_order_info([x["name"] for x in accounts.get_all()])
-
-        # Fill tree
-        for account in accs:
-            name = account["name"]
-            orders = account["orders"]
-            orders.sort(key=lambda x: x["time"], reverse=True)  # Sort orders
-
-            parent = self.tree.insert("", "end", text=name, open=True,
-                                      values=["" for x in self.VAR])
-
-            for order in orders:
-                values = []
-                for v in self.VAR:
-                    values.append(str(order[v]))
-
-                self.tree.insert(parent, "end", iid=order["orderID"],
-                                 text=order["symbol"], values=values)
-                #self.tree.insert("", "end", text=position["symbol"],
-                #                 values=values)
-
-        # Resize tree
-        new_height = len(self.tree.get_children()) * self.TREE_HEIGHT_MULTIPLIER
-        if new_height < self.MIN_TREE_HEIGHT:
-            new_height = self.MIN_TREE_HEIGHT
-        if new_height > self.MAX_TREE_HEIGHT:
-            new_height = self.MAX_TREE_HEIGHT
-        self.tree.configure(height=new_height)
-        self.tree.pack()
-
-    def cancel_order(self):
-        """
-        Query backend to cancel order.
-        """
-        name, id = self._get_selected()
-        try:
-            core.order_cancel(name, id)
-            self.update_orders()
-        except Exception as e:
-            tkinter.messagebox.showerror("Error", str(e))
-
-    def amend_quantity(self):
+    def _order_info(self, names, snapshot):
         """
-        Query backend to set new order quantity.
+        Turn open orders snapshot into orders listed by this window.
+        Internal method.
         """
-        name, id = self._get_selected()
-        qty = int(self.qtySpin.get())
-        try:
-            core.order_qty(name, id, qty)
-            self.update_orders()
-        except Exception as e:
-            tkinter.messagebox.showerror("Error", str(e))
-
-    def amend_limit_price(self):
-        """
-        Query backend to set new limit price.
-        """
-        name, id = self._get_selected()
-        price = int(self.pxSpin.get())
-        try:
-            core.order_price(name, id, price)
-            self.update_orders()
-        except Exception as e:
-            tkinter.messagebox.showerror("Error", str(e))
+        return core.stop_order_info(names, snapshot)
 
     def amend_stop_price(self):
         """
@@ -1541,7 +1751,7 @@ class OrderHistory(AbstractChild):
         Query backend for order history and place it into treeview.
         """
         self.tree.delete(*self.tree.get_children())
-        accs = core.history_order_info([x["name"] for x in accounts.get_all()])
+        accs = core.history_order_info(accounts.get_names())
 
         # Fill tree
         for account in accs:
@@ -0,0 +1,149 @@
+"""
+Runs many bots at once, each with its own settings profile.
+"""
+
+import threading
+
+from time import monotonic
+
+import backend.botsettings as settings
+
+from backend.exceptions import BitmexBotException
+
+from multithreaded.multithreaded import Bot
+
+
+#
+# Classes
+#
+
+class RequestBudget:
+    """
+    Requests per minute shared by many bots. Refills continuously up to one
+    minute worth of requests.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens = float(requests_per_minute)
+        self.refilled = monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, count=1, force=False):
+        """
+        Take count requests from budget.
+        force:  take them even if budget is exhausted (for requests which have
+                to be sent, like closing a position)
+
+        Returns if requests were taken.
+        """
+        with self._lock:
+            now = monotonic()
+            self.tokens = min(self.requests_per_minute, self.tokens +
+                              (now - self.refilled) * self.requests_per_minute / 60)
+            self.refilled = now
+            if self.tokens < count and not force:
+                return False
+            self.tokens -= count
+            return True
+
+    def get_remaining(self):
+        """
+        Returns how many requests can be taken right now.
+        """
+        with self._lock:
+            return max(0, int(self.tokens))
+
+
+class BotManager:
+    """
+    Runs many bots, one per bot settings profile. Every bot keeps its own
+    holding state and writes its own log (LOG_PREFIX + profile name). Prices
+    come from the shared quote cache, so dozens of bots watching the same
+    contracts cost as many requests as one, and opening trades of all bots
+    are limited by one shared request budget.
+    """
+
+    REQUESTS_PER_MINUTE = 30  # Order requests of all bots together
+    LOG_PREFIX = "./botlog-"
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE):
+        self.budget = RequestBudget(requests_per_minute)
+        self.bots = {}  # profile name -> Bot
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        """
+        Create (not yet running) bot for existing settings profile.
+        Returns the Bot.
+        """
+        if not settings.exists(profile):
+            raise BitmexBotException("Bot settings profile '" + profile +
+                                     "' doesn't exist.")
+        with self._lock:
+            if profile in self.bots:
+                raise BitmexBotException("Bot of profile '" + profile +
+                                         "' already exists.")
+            bot = Bot(profile=profile, savefile=self.LOG_PREFIX + profile,
+                      budget=self.budget)
+            self.bots[profile] = bot
+        return bot
+
+    def remove(self, profile):
+        """
+        Stop bot of profile (closing its position) and forget it.
+        """
+        with self._lock:
+            bot = self.bots.pop(profile, None)
+        if bot is not None and bot.is_running():
+            bot.stop()
+
+    def get(self, profile):
+        """
+        Returns Bot of profile or None.
+        """
+        return self.bots.get(profile)
+
+    def start(self, profiles=None):
+        """
+        Start bots of profiles (all bots if None) which aren't running. Bots of
+        profiles without one are created first.
+        """
+        if profiles is None:
+            profiles = list(self.bots.keys())
+        for profile in profiles:
+            bot = self.bots.get(profile) or self.add(profile)
+            if not bot.is_running():
+                bot.run()
+
+    def stop(self, profiles=None):
+        """
+        Stop running bots of profiles (all bots if None). Bots holding
+        contracts close their positions first.
+        """
+        if profiles is None:
+            profiles = list(self.bots.keys())
+        bots = [self.bots[x] for x in profiles if x in self.bots]
+        threads = [threading.Thread(target=x.stop) for x in bots if x.is_running()]
+        for thread in threads:  # Close positions of all bots at once
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def status(self):
+        """
+        Returns dict of profile name -> {
+            "running": bool,
+            "holding": bool,
+            "iterations": int,
+            "lastResults": dict (see Bot.get_last_prices()),
+            "lastExecution": dict or None (see Bot.get_last_execution())
+        }.
+        """
+        return {name: {
+            "running": bot.is_running(),
+            "holding": bot.is_holding(),
+            "iterations": bot.get_iterations_made(),
+            "lastResults": bot.get_last_prices(),
+            "lastExecution": bot.get_last_execution()
+        } for name, bot in list(self.bots.items())}
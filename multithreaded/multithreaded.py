@@ -2,18 +2,45 @@
 Contains classes with routines on their own threads.
 """
 
+import os
 import threading
 
-from time import sleep
+from time import sleep, perf_counter, monotonic, time
 from datetime import datetime
 
+import backend.api as api
 import backend.core as core
 import backend.accounts as accounts
+import backend.instruments as instruments
+import backend.quotes as quotes
+import backend.sizing as sizing
+import backend.services as services
 
 from backend.exceptions import BitmexBotException
 
 import backend.log as log
 import backend.botsettings as settings
+import backend.metrics as metrics
+
+from backend.portfolio import Portfolio
+from backend.fakeexchange import FakeExchange
+
+
+#
+# Internal functions
+#
+
+def _post_timed(host, key, secret, post, **params):
+    """
+    Send order and note when its response arrived. Measured on the thread
+    sending it, so the time is known as soon as the result is.
+
+    post:       order_post function of api or fake exchange
+
+    Returns (order dict, perf_counter() when response arrived).
+    """
+    order = post(host, key, secret, **params)
+    return order, perf_counter()
 
 
 #
@@ -126,35 +153,72 @@ class Multithreaded:
 class Bot(Multithreaded):
     """
     Class representing contract prices comparing bot.
+
+    Prices are read from shared quote cache (backend.quotes). Bot compares them
+    whenever a quote of its contracts changes, or after delay if none did.
+
+    profile:    name of bot settings profile (None for settings without profile)
+    savefile:   log savefile of this bot
+    budget:     shared request budget limiting opening trades (None for no
+                limit), object with take() (see multithreaded.botmanager)
     """
 
-    REQUESTS_PER_MINUTE = 30
+    REQUESTS_PER_MINUTE = 30  # Only sets delay between comparisons when
+                              # quotes don't change
+    DEBOUNCE_SECONDS = 0.05  # Quote changes this close together are compared once
 
     PRICE_TYPE = "lastPrice"  # Which price data to use
                               # lastPrice, bidPrice, midPrice, askPrice
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, profile=None, savefile=log.SAVEFILE, budget=None,
+                 **kwargs):
         Multithreaded.__init__(self, *args, **kwargs)
+        self.profile = profile
+        self.savefile = savefile
+        self.budget = budget
+        if not os.path.exists(savefile):
+            log.reset(savefile)
         self.new_entry = 1  # Are there new entries in log?
-        self.last_results = log.read_entries(1)[0]
+        self.last_results = log.read_entries(1, savefile)[0]
 
         self.holding = False  # Is bot currently holding contracts?
         self.first_price_bigger = False  # How did the prices compare when
                                          # last bot traded contracts
+        self.legs = []  # (symbol, side, quantity) of legs currently held
+        self.held_exchange = None  # Exchange legs were opened on (see _exchange())
+        self.last_execution = None  # See get_last_execution()
+        self.dry_exchange = FakeExchange()  # Receives orders in dry-run mode
+        self.watched = None  # (account name, symbols) watched in quote cache
+        self._wake = threading.Event()  # Set when quote changes or bot stops
 
     def stop(self):
         """
-        Kills bots thread. Closes bot position if holding contract and writes
-        coresponding log.
+        Kills bots thread. Once it finished, closes bot position if holding
+        contract and writes coresponding log.
         Overriding.
         """
+        self._kill_thread = True
+        self._wake.set()
+        Multithreaded.stop(self)
         if self.holding:
             results = self._compare()
             results["action"] = "close"
             self.last_results = results
             self._log_results(results)
             self._close()
-        Multithreaded.stop(self)
+        quotes.remove_listener(self._on_quote)
+        self._watch(None)
+
+    def run(self):
+        """
+        Starts watching quotes of configured contracts and creates and starts
+        bots thread.
+        Overriding.
+        """
+        self._kill_thread = False
+        self._wake.clear()
+        quotes.add_listener(self._on_quote)
+        Multithreaded.run(self)
 
     def has_new_entry(self):
         """
@@ -177,27 +241,253 @@ class Bot(Multithreaded):
         """
         return self.holding
 
+    def get_last_execution(self):
+        """
+        Returns measurements of last paired execution (None if bot didn't
+        trade yet).
+        Returns {
+            "legs": list of {
+                "symbol": str,
+                "side": str,
+                "orderQty": int,
+                "cumQty": int (how many contracts were filled),
+                "seconds": float or None (time until response of this leg),
+                "error": str or None
+            },
+            "seconds": float or None (time until both legs were filled),
+            "skew": float or None (time between fills of the two legs),
+            "hedged": bool (filled legs were unwound because other leg failed),
+            "unhedged": list of (symbol, side, quantity) still held because
+                        unwinding failed,
+            "dryRun": bool,
+            "sent": float (local unix time when all legs were sent)
+        }.
+        """
+        return self.last_execution
+
+    def _exchange(self):
+        """
+        Returns object with order calls which bot should use (api or fake
+        exchange in dry-run mode).
+        Internal method.
+        """
+        if settings.get_dry_run(self.profile):
+            return self.dry_exchange
+        return api
+
+    def _leg_quantity(self, account_name, symbol):
+        """
+        Returns configured leg quantity rounded to lot size of instrument (from
+        instrument registry, so it's downloaded only once an hour).
+        Internal method.
+        """
+        try:
+            lot = instruments.get(account_name, symbol)["lotSize"] or 1
+        except Exception:
+            lot = 1
+        return max(lot, sizing.round_to(settings.get_quantity(self.profile), lot))
+
+    def _send_legs(self, legs, exchange, hedge=True):
+        """
+        Send market orders of all legs at once, each from its own worker
+        thread, so that they reach the exchange as close to each other as
+        possible.
+        Internal method.
+
+        legs:       list of (symbol, side, quantity)
+        exchange:   object with order calls (see _exchange())
+        hedge:      if one leg fails, unwind the filled ones with opposite
+                    market orders
+
+        Returns execution dict (see get_last_execution()).
+        """
+        account_name = settings.get_account(self.profile)
+        account = accounts.get(account_name)
+        if account is None:
+            raise BitmexBotException("Account '" + account_name + "' doesn't exist.")
+        if self.budget is not None and exchange is api:
+            # Only opening trades may be refused, closing and unwinding must go
+            if not self.budget.take(len(legs), force=not hedge):
+                raise BitmexBotException("Request budget of bots is exhausted.")
+
+        start = perf_counter()
+        ends = [None] * len(legs)
+        jobs = []
+        for symbol, side, qty in legs:
+            jobs.append(core.submit(account, _post_timed, post=exchange.order_post,
+                                    symbol=symbol, side=side, orderQty=qty,
+                                    ordType="Market"))
+        sent = time()
+
+        execution = {
+            "legs": [],
+            "seconds": None,
+            "skew": None,
+            "hedged": False,
+            "unhedged": [],
+            "dryRun": exchange is self.dry_exchange,
+            "sent": sent
+        }
+        for i, ((symbol, side, qty), (foo, job)) in enumerate(zip(legs, jobs)):
+            leg = {
+                "symbol": symbol,
+                "side": side,
+                "orderQty": qty,
+                "cumQty": 0,
+                "seconds": None,
+                "error": None
+            }
+            try:
+                order, ends[i] = job.result()
+                leg["cumQty"] = order.get("cumQty") or 0
+                if order["ordStatus"] in core.OPEN_STATUSES:  # Rest isn't wanted
+                    exchange.order_delete(account["host"], account["key"],
+                                          account["secret"], orderID=order["orderID"])
+            except Exception as e:
+                metrics.error("bot", e)
+                leg["error"] = str(e)
+            execution["legs"].append(leg)
+        for leg, end in zip(execution["legs"], ends):
+            leg["seconds"] = end - start if end is not None else None
+
+        complete = all(x["cumQty"] >= x["orderQty"] for x in execution["legs"])
+        if complete:
+            execution["seconds"] = max(ends) - start
+            execution["skew"] = max(ends) - min(ends)
+            labels = {"bot": self.profile or "", "dryRun": execution["dryRun"]}
+            metrics.observe("bitmex_bot_legs_seconds", labels, execution["seconds"])
+            metrics.observe("bitmex_bot_leg_skew_seconds", labels, execution["skew"])
+        elif hedge:
+            unwind = [(x["symbol"], "Sell" if x["side"] == "Buy" else "Buy", x["cumQty"])
+                      for x in execution["legs"] if x["cumQty"]]
+            if unwind:
+                try:
+                    unwound = self._send_legs(unwind, exchange, hedge=False)["legs"]
+                except Exception as e:
+                    metrics.error("bot", e)
+                    unwound = [{"cumQty": 0} for x in unwind]
+                # Unfilled rest of unwinding orders is still held
+                execution["unhedged"] = [
+                    (x, "Sell" if y == "Buy" else "Buy", z - w["cumQty"])
+                    for (x, y, z), w in zip(unwind, unwound) if w["cumQty"] < z]
+            execution["hedged"] = True
+        self.last_execution = execution
+        return execution
+
+    def _watch(self, symbols):
+        """
+        Make quote cache poll symbols on server of configured account instead
+        of previously watched ones (None to stop watching).
+        Internal method.
+        """
+        account_name = settings.get_account(self.profile) if symbols else None
+        watched = (account_name, tuple(symbols)) if symbols else None
+        if watched == self.watched:
+            return
+        if self.watched is not None:
+            quotes.unwatch(*self.watched)
+            self.watched = None
+        if watched is not None:
+            quotes.watch(*watched)
+            self.watched = watched
+
+    def _on_quote(self, host, quote):
+        """
+        Wake bot thread when quote of one of its contracts changes. Called by
+        quote cache.
+        Internal method.
+        """
+        if self.watched is not None and quote["symbol"] in self.watched[1]:
+            self._wake.set()
+
+    def _main(self):
+        """
+        Main function of bot. Compares prices right after quote of its
+        contracts changes (waiting DEBOUNCE_SECONDS for the other one to
+        change too) or after delay if they don't change. After a failed
+        iteration the whole delay is waited.
+        Internal method.
+        Overriding.
+        """
+        while not self._kill_thread:
+            self._wake.clear()
+            if self._do_iteration():
+                self.delay_multiplier = 1
+                self.iterations_made += 1
+            else:  # Spaces between iterations will get bigger and bigger as they fail
+                self.delay_multiplier += self.DELAY_MULTIPLIER_ON_FAIL
+
+            deadline = monotonic() + self._get_delay()
+            while not self._kill_thread:
+                remaining = deadline - monotonic()
+                self.seconds_remaining = max(0, int(remaining))
+                if remaining <= 0:
+                    break
+                if self._wake.wait(remaining) and self.delay_multiplier == 1:
+                    sleep(self.DEBOUNCE_SECONDS)
+                    break
+                self._wake.clear()  # Failing, quote changes have to wait
+
     def _trade(self, first_price_bigger=False):
         """
         Buys contracts with first contract symbol and sells contracts with
         second contract symbol if first_price_bigger is True.
         Sells contracts with first contract symbol and buys contracts with
         second contract symbol if first_price_bigger is False.
+        Both legs are sent at once. If one of them fails, the other one is
+        closed again.
         Marks that bot is now holding contracts and which price was bigger.
         Internal method.
-        """
-        # TODO
+
+        Returns action for log: "trade" if both legs were filled, "hedge" if
+        filled legs were closed again because other one failed, "unhedged" if
+        they couldn't be closed (bot holds them and closes them later).
+        """
+        account_name = settings.get_account(self.profile)
+        first_contract = settings.get_first_contract(self.profile)
+        second_contract = settings.get_second_contract(self.profile)
+        first_side, second_side = ("Buy", "Sell") if first_price_bigger else ("Sell", "Buy")
+        legs = [
+            (first_contract, first_side, self._leg_quantity(account_name, first_contract)),
+            (second_contract, second_side, self._leg_quantity(account_name, second_contract))
+        ]
+
+        exchange = self._exchange()
+        execution = self._send_legs(legs, exchange)
+        if execution["unhedged"]:  # Kept, so that they are closed later
+            self.legs = execution["unhedged"]
+            self.holding = True
+            self.held_exchange = exchange
+            self.first_price_bigger = first_price_bigger
+            metrics.error("bot", BitmexBotException(
+                "Couldn't unwind filled legs, holding " + str(self.legs)))
+            return "unhedged"
+        if execution["hedged"]:
+            return "hedge"
+        self.legs = legs
         self.holding = True
+        self.held_exchange = exchange
         self.first_price_bigger = first_price_bigger
+        return "trade"
 
     def _close(self):
         """
-        Buys back sold contracts and sells bought contracts.
+        Buys back sold contracts and sells bought contracts on the exchange
+        they were opened on. Both legs are sent at once. Legs which fail to
+        close are kept and closed next time.
         Marks that bot is holding contracts no more.
         Internal method.
+
+        Returns if all legs were closed.
         """
-        # TODO
-        self.holding = False
+        legs = [(x, "Sell" if y == "Buy" else "Buy", z) for x, y, z in self.legs]
+        execution = self._send_legs(legs, self.held_exchange, hedge=False)
+        self.legs = [(x, "Sell" if y == "Buy" else "Buy", z - w["cumQty"])
+                     for (x, y, z), w in zip(legs, execution["legs"]) if w["cumQty"] < z]
+        self.holding = bool(self.legs)
+        if not self.holding:
+            self.held_exchange = None
+        return not self.holding
 
     def _do_iteration(self):
         """
@@ -208,26 +498,43 @@ class Bot(Multithreaded):
         try:
             results = self._compare()
         except Exception as e:
-            print(str(e))
+            metrics.error("monitor." + type(self).__name__, e)
             return False
 
-        if results["action"] == "trade":
-            self._trade(results["price1"] > results["price2"])
-        elif results["action"] == "close":
-            self._close()
+        # Simulated orders fill at compared prices
+        if (settings.get_dry_run(self.profile) or
+                self.held_exchange is self.dry_exchange):
+            self.dry_exchange.set_price(results["price1"], results["contract1"])
+            self.dry_exchange.set_price(results["price2"], results["contract2"])
+
+        try:
+            if results["action"] == "trade":
+                results["action"] = self._trade(results["price1"] > results["price2"])
+            elif results["action"] == "close":
+                self._close()
+        except Exception as e:
+            metrics.error("bot", e)
+            return False
+
+        if results["action"] in ("trade", "close", "hedge", "unhedged"):
+            decided = results.pop("decided")
+            results["quoteLatency"] = (decided - results["quoteTime"]) * 1000
+            results["sendLatency"] = (self.last_execution["sent"] - decided) * 1000
+            metrics.observe("bitmex_bot_decision_seconds", {"bot": self.profile or ""},
+                            results["quoteLatency"] / 1000)
 
         self.last_results = results
-        if results["action"] == "trade" or results["action"] == "close":
+        if results["action"] in ("trade", "close", "hedge", "unhedged"):
             self._log_results(results)
 
-        return True
+        return results["action"] != "unhedged"  # Held legs wait for closing
 
     def _log_results(self, results):
         """
         Writes results given as arg to log.
         Internal method.
         """
-        log.new_entry(results)
+        log.new_entry(results, self.savefile)
         self.new_entry = 2
 
     def _compare(self):
@@ -244,24 +551,38 @@ class Bot(Multithreaded):
             difference: difference between the prices,
             key:        name of key of account on which bot currently runs,
             action:     one of "wait", "trade", "hold" or "close" depending on
-                        what should currently be done
+                        what should currently be done,
+            quoteTime:  local unix time of newer of the two quotes,
+            decided:    local unix time when action was decided
         }.
         """
-        account_name = settings.get_account()
+        account_name = settings.get_account(self.profile)
 
         if not account_name:
             raise BitmexBotException("No account selected")
 
-        first_contract = settings.get_first_contract()
-        second_contract = settings.get_second_contract()
-        trade_difference = settings.get_trade_difference()
-        close_difference = settings.get_close_difference()
-
-        first_price = core.instrument_price(account_name, first_contract)[self.PRICE_TYPE]
-        second_price = core.instrument_price(account_name, second_contract)[self.PRICE_TYPE]
+        first_contract = settings.get_first_contract(self.profile)
+        second_contract = settings.get_second_contract(self.profile)
+        trade_difference = settings.get_trade_difference(self.profile)
+        close_difference = settings.get_close_difference(self.profile)
+
+        account = accounts.get(account_name)
+        if account is None:
+            raise BitmexBotException("Account '" + account_name + "' doesn't exist.")
+        self._watch([first_contract, second_contract])
+
+        prices = []
+        quote_time = 0
+        for symbol in (first_contract, second_contract):
+            quote = quotes.refresh(account["host"], symbol)
+            if quote is None:
+                raise BitmexBotException("No quote of '" + symbol + "'. Is it open?")
+            prices.append(quote[self.PRICE_TYPE])
+            quote_time = max(quote_time, quote["time"])
+        first_price, second_price = prices
         difference = abs(first_price - second_price)
 
-        key = accounts.get(settings.get_account())["key"]
+        key = account["key"]
 
         if self.holding:
             if difference <= close_difference:
@@ -282,7 +603,9 @@ class Bot(Multithreaded):
             "price2": second_price,
             "difference": difference,
             "key": key,
-            "action": action
+            "action": action,
+            "quoteTime": quote_time,
+            "decided": time()
         }
 
 
@@ -318,13 +641,14 @@ class Accounts(Multithreaded):
         Overriding.
         """
         # Get all acount names
-        names = [x["name"] for x in accounts.get_all()]
+        names = accounts.get_names()
 
         # Get info
         try:
-            accs = core.account_margin_stats(names)
+            accs = core.account_margin_stats(names,
+                                             fromStore=services.from_store("margins"))
         except Exception as e:
-            print(str(e))
+            metrics.error("monitor." + type(self).__name__, e)
             return False
 
         accs.sort(key=lambda x: x["name"], reverse=False)  # Sort
@@ -354,6 +678,7 @@ class Positions(Multithreaded):
         Multithreaded.__init__(self, *args, **kwargs)
 
         self.positions = []
+        self.portfolio = Portfolio()  # Aggregated risk of all accounts
 
     def get_positions(self):
         """
@@ -379,6 +704,13 @@ class Positions(Multithreaded):
         """
         return self.positions
 
+    def get_portfolio(self):
+        """
+        Return backend.portfolio.Portfolio aggregating last fetched positions
+        of all accounts.
+        """
+        return self.portfolio
+
     def _do_iteration(self):
         """
         Query backend for all accounts position stats and save them in this
@@ -387,19 +719,27 @@ class Positions(Multithreaded):
         Overriding.
         """
         # Get all acount names
-        names = [x["name"] for x in accounts.get_all()]
+        names = accounts.get_names()
 
         # Get info
         try:
-            positions = core.position_info(names)
+            positions = core.position_info(names,
+                                           fromStore=services.from_store("positions"))
         except Exception as e:
-            print(str(e))
+            metrics.error("monitor." + type(self).__name__, e)
             return False
 
         for account in positions:
             account["positions"].sort(key=lambda x: x["symbol"], reverse=False)
         self.positions = positions
 
+        # Update aggregates (margins from last margin stats, no more requests)
+        self.portfolio.load(positions)
+        for name in names:
+            cached = core.cached_available_margin(name)
+            if cached is not None:
+                self.portfolio.update_margin(name, cached[1])
+
         return True
 
     def _get_delay(self):
@@ -315,7 +315,7 @@ class Positions(tkinter.Frame):
         self.tree.delete(*self.tree.get_children())
 
         # Get all acount names
-        names = [x["name"] for x in accounts.get_all()]
+        names = accounts.get_names()
 
         # Fill tree
         for name in names:
@@ -732,7 +732,7 @@ class Bot(tkinter.Frame):
         self.runVar.set(0)
         self.accountVar = tkinter.StringVar(self)
         self.dryVar = tkinter.IntVar(self)
-        self.dryVar.set(1)
+        self.dryVar.set(int(backend.botsettings.get_dry_run()))
 
         runFrame = tkinter.Frame(self)
         self.runButton = tkinter.Button(runFrame, text=self.TEXT_OFF,
@@ -743,7 +743,7 @@ class Bot(tkinter.Frame):
                                                   **self.RUN_WIDGET_PARAMS)
         self.dryCheck = tkinter.Checkbutton(runFrame, text="Dry run",
                                             var=self.dryVar,
-                                            **self.RUN_WIDGET_PARAMS)  # TODO
+                                            **self.RUN_WIDGET_PARAMS)
 
         currFrame = tkinter.Frame(self)
         self.firstContractLabel = tkinter.Label(currFrame, text="", **self.LABEL_PARAMS)
@@ -786,7 +786,7 @@ class Bot(tkinter.Frame):
         """
         Query backend for logged in accounts and adjust ui adequately.
         """
-        names = [account["name"] for account in accounts.get_all()]
+        names = accounts.get_names()
         self.accountsCombo["values"] = names
         if self.accountVar.get() in names:
             backend.botsettings.set_account(self.accountVar.get())
@@ -879,6 +879,7 @@ class Bot(tkinter.Frame):
         else:
             # Bot
             backend.botsettings.set_account(self.accountVar.get())
+            backend.botsettings.set_dry_run(bool(self.dryVar.get()))
             self.bot.run()
             # Frontend
             self.runVar.set(1)
@@ -109,17 +109,22 @@ class BotManagement(tkinter.Frame):
         # Frontend
         self.firstVar = tkinter.StringVar(self)
         self.secondVar = tkinter.StringVar(self)
+        self.dryRunVar = tkinter.BooleanVar(self)
 
         firstLabel = tkinter.Label(self, text="First contract symbol:")
         secondLabel = tkinter.Label(self, text="Second contract symbol:")
         tradeLabel = tkinter.Label(self, text="Trade if difference this high:")
         closeLabel = tkinter.Label(self, text="Close if difference this low:")
+        quantityLabel = tkinter.Label(self, text="Contracts in each leg:")
         self.savedLabel = tkinter.Label(self, text="")
 
         self.firstCombo = tkinter.ttk.Combobox(self, textvariable=self.firstVar)
         self.secondCombo = tkinter.ttk.Combobox(self, textvariable=self.secondVar)
         self.tradeSpin = tkinter.Spinbox(self, from_=1, to=SPINBOX_LIMIT)
         self.closeSpin = tkinter.Spinbox(self, from_=1, to=SPINBOX_LIMIT)
+        self.quantitySpin = tkinter.Spinbox(self, from_=1, to=SPINBOX_LIMIT)
+        dryRunCheck = tkinter.Checkbutton(self, text="Dry run (don't send orders)",
+                                          variable=self.dryRunVar)
 
         self.tradeSpin.delete(0)
         self.tradeSpin.insert(0, self.DEFAULT_TRADE_PX)
@@ -141,8 +146,11 @@ class BotManagement(tkinter.Frame):
         self.tradeSpin.grid(column=1, row=2)
         closeLabel.grid(column=0, row=3)
         self.closeSpin.grid(column=1, row=3)
-        self.savedLabel.grid(column=0, row=4)
-        saveButton.grid(column=1, row=4)
+        quantityLabel.grid(column=0, row=4)
+        self.quantitySpin.grid(column=1, row=4)
+        dryRunCheck.grid(column=1, row=5)
+        self.savedLabel.grid(column=0, row=6)
+        saveButton.grid(column=1, row=6)
 
     def update_values(self):
         """
@@ -157,6 +165,9 @@ class BotManagement(tkinter.Frame):
         self.tradeSpin.insert(0, backend.botsettings.get_trade_difference())
         self.closeSpin.delete(0, len(self.closeSpin.get()))
         self.closeSpin.insert(0, backend.botsettings.get_close_difference())
+        self.quantitySpin.delete(0, len(self.quantitySpin.get()))
+        self.quantitySpin.insert(0, backend.botsettings.get_quantity())
+        self.dryRunVar.set(backend.botsettings.get_dry_run())
         # Set saved notification off
         self.savedLabel.configure(text="")
 
@@ -169,6 +180,8 @@ class BotManagement(tkinter.Frame):
         backend.botsettings.set_second_contract(self.secondVar.get())
         backend.botsettings.set_trade_difference(int(self.tradeSpin.get()))
         backend.botsettings.set_close_difference(int(self.closeSpin.get()))
+        backend.botsettings.set_quantity(int(self.quantitySpin.get()))
+        backend.botsettings.set_dry_run(self.dryRunVar.get())
         self.update_values()
         # Set saved notification on
         self.savedLabel.configure(text="")
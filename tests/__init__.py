@@ -0,0 +1,4 @@
+"""
+Tests of the backend. Run from repository root:
+python3 -m unittest
+"""
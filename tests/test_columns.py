@@ -0,0 +1,201 @@
+"""
+Tests that column lists requested by info functions contain every field those
+functions read. Server responses are replaced by full records as BitMEX sends
+them and projection (api.PROJECT_COLUMNS) drops all not requested fields, so
+reading a field missing from a column list fails the test.
+"""
+
+import unittest
+
+from unittest import mock
+from urllib.parse import unquote
+
+import backend.api as api
+import backend.core as core
+import backend.accounts as accounts
+import backend.instruments as instruments
+import backend.quotes as quotes
+
+
+#
+# Constants
+#
+
+ACCOUNT = "test-columns"
+HOST = "https://testnet.bitmex.com"
+TIME = "2020-05-20T12:00:00.000Z"
+
+POSITION = {  # Full position record
+    "account": 12345, "symbol": "XBTUSD", "currency": "XBt", "underlying": "XBT",
+    "quoteCurrency": "USD", "commission": 0.00075, "initMarginReq": 0.01,
+    "maintMarginReq": 0.005, "riskLimit": 20000000000, "leverage": 100,
+    "crossMargin": False, "deleveragePercentile": 1, "rebalancedPnl": 0,
+    "prevRealisedPnl": 0, "prevUnrealisedPnl": 0, "prevClosePrice": 9500,
+    "openingTimestamp": TIME, "openingQty": 0, "openingCost": 0,
+    "openingComm": 0, "openOrderBuyQty": 0, "openOrderBuyCost": 0,
+    "openOrderBuyPremium": 0, "openOrderSellQty": 0, "openOrderSellCost": 0,
+    "openOrderSellPremium": 0, "execBuyQty": 100, "execBuyCost": 1052600,
+    "execSellQty": 0, "execSellCost": 0, "execQty": 100, "execCost": -1052600,
+    "execComm": 789, "currentTimestamp": TIME, "currentQty": 100,
+    "currentCost": -1052600, "currentComm": 789, "realisedCost": 0,
+    "unrealisedCost": -1052600, "grossOpenCost": 0, "grossOpenPremium": 0,
+    "grossExecCost": 1052600, "isOpen": True, "markPrice": 9510.5,
+    "markValue": -1051470, "riskValue": 1051470, "homeNotional": 0.0105147,
+    "foreignNotional": -100, "posState": "", "posCost": -1052600,
+    "posCost2": -1052600, "posCross": 0, "posInit": 10526, "posComm": 797,
+    "posLoss": 0, "posMargin": 11323, "posMaint": 6060, "posAllowance": 0,
+    "taxableMargin": 0, "initMargin": 0, "maintMargin": 12453,
+    "sessionMargin": 0, "targetExcessMargin": 0, "varMargin": 0,
+    "realisedGrossPnl": 0, "realisedTax": 0, "realisedPnl": -789,
+    "unrealisedGrossPnl": 1130, "longBankrupt": 0, "shortBankrupt": 0,
+    "taxBase": 0, "indicativeTaxRate": 0, "indicativeTax": 0,
+    "unrealisedTax": 0, "unrealisedPnl": 1130, "unrealisedPnlPcnt": 0.0011,
+    "unrealisedRoePcnt": 0.1074, "simpleQty": None, "simpleCost": None,
+    "simpleValue": None, "simplePnl": None, "simplePnlPcnt": None,
+    "avgCostPrice": 9500.5, "avgEntryPrice": 9500.5, "breakEvenPrice": 9507.5,
+    "marginCallPrice": 9455, "liquidationPrice": 9455, "bankruptPrice": 9409,
+    "timestamp": TIME, "lastPrice": 9510.5, "lastValue": -1051470
+}
+
+ORDER = {  # Full order record
+    "orderID": "6a1d3a3a-0000-4000-8000-000000000001", "clOrdID": "",
+    "clOrdLinkID": "", "account": 12345, "symbol": "XBTUSD", "side": "Buy",
+    "simpleOrderQty": None, "orderQty": 100, "price": 9000, "displayQty": None,
+    "stopPx": None, "pegOffsetValue": None, "pegPriceType": "",
+    "currency": "USD", "settlCurrency": "XBt", "ordType": "Limit",
+    "timeInForce": "GoodTillCancel", "execInst": "ParticipateDoNotInitiate",
+    "contingencyType": "", "exDestination": "XBME", "ordStatus": "New",
+    "triggered": "", "workingIndicator": True, "ordRejReason": "",
+    "simpleLeavesQty": None, "leavesQty": 100, "simpleCumQty": None,
+    "cumQty": 0, "avgPx": None, "multiLegReportingType": "SingleSecurity",
+    "text": "Submitted via API.", "transactTime": TIME, "timestamp": TIME
+}
+
+STOP_ORDER = dict(ORDER, orderID="6a1d3a3a-0000-4000-8000-000000000002",
+                  side="Sell", price=None, stopPx=9400, ordType="Stop",
+                  execInst="LastPrice", workingIndicator=False)
+
+INSTRUMENT = {  # Full instrument record
+    "symbol": "XBTUSD", "rootSymbol": "XBT", "state": "Open", "typ": "FFWCSX",
+    "listing": TIME, "front": TIME, "expiry": None, "settle": None,
+    "relistInterval": None, "inverseLeg": "", "sellLeg": "", "buyLeg": "",
+    "optionStrikePcnt": None, "optionStrikeRound": None,
+    "optionStrikePrice": None, "optionMultiplier": None,
+    "positionCurrency": "USD", "underlying": "XBT", "quoteCurrency": "USD",
+    "underlyingSymbol": "XBT=", "reference": "BMEX", "referenceSymbol": ".BXBT",
+    "calcInterval": None, "publishInterval": None, "publishTime": None,
+    "maxOrderQty": 10000000, "maxPrice": 1000000, "lotSize": 100,
+    "tickSize": 0.5, "multiplier": -100000000, "settlCurrency": "XBt",
+    "underlyingToPositionMultiplier": None, "underlyingToSettleMultiplier": -100000000,
+    "quoteToSettleMultiplier": None, "isQuanto": False, "isInverse": True,
+    "initMargin": 0.01, "maintMargin": 0.005, "riskLimit": 20000000000,
+    "riskStep": 15000000000, "limit": None, "capped": False, "taxed": True,
+    "deleverage": True, "makerFee": -0.00025, "takerFee": 0.00075,
+    "settlementFee": 0, "insuranceFee": 0, "fundingBaseSymbol": ".XBTBON8H",
+    "fundingQuoteSymbol": ".USDBON8H", "fundingPremiumSymbol": ".XBTUSDPI8H",
+    "fundingTimestamp": TIME, "fundingInterval": TIME, "fundingRate": 0.0001,
+    "indicativeFundingRate": 0.0001, "rebalanceTimestamp": None,
+    "rebalanceInterval": None, "openingTimestamp": TIME, "closingTimestamp": TIME,
+    "sessionInterval": TIME, "prevClosePrice": 9500, "limitDownPrice": None,
+    "limitUpPrice": None, "bankruptLimitDownPrice": None,
+    "bankruptLimitUpPrice": None, "prevTotalVolume": 1000000000,
+    "totalVolume": 1000100000, "volume": 100000, "volume24h": 5000000,
+    "prevTotalTurnover": 10000000000, "totalTurnover": 10001000000,
+    "turnover": 1000000, "turnover24h": 50000000, "homeNotional24h": 500,
+    "foreignNotional24h": 5000000, "prevPrice24h": 9400, "vwap": 9450,
+    "highPrice": 9600, "lowPrice": 9300, "lastPrice": 9510.5,
+    "lastPriceProtected": 9510.5, "lastTickDirection": "PlusTick",
+    "lastChangePcnt": 0.0117, "bidPrice": 9510, "midPrice": 9510.25,
+    "askPrice": 9510.5, "impactBidPrice": 9509.8, "impactMidPrice": 9510.2,
+    "impactAskPrice": 9510.6, "hasLiquidity": True, "openInterest": 1000000000,
+    "openValue": 10000000000, "fairMethod": "FundingRate",
+    "fairBasisRate": 0.1095, "fairBasis": 0.5, "fairPrice": 9510.5,
+    "markMethod": "FairPrice", "markPrice": 9510.5, "indicativeTaxRate": 0,
+    "indicativeSettlePrice": 9510, "optionUnderlyingPrice": None,
+    "settledPrice": None, "timestamp": TIME
+}
+
+
+#
+# Helpers
+#
+
+def _response(verb, host, key, secret, path, body, life, reconcile=None):
+    """
+    Replacement of api._request answering GET requests with full records.
+    """
+    if "/position" in path:
+        if "isOpen" in unquote(path):  # Filtered to open positions
+            return [dict(POSITION)]
+        return [dict(POSITION), dict(POSITION, symbol="ETHUSD", isOpen=False,
+                                     crossMargin=True, riskLimit=None)]
+    if "/order" in path:
+        return [dict(ORDER), dict(STOP_ORDER)]
+    if "/instrument" in path:
+        return [dict(INSTRUMENT)]
+    raise AssertionError("Unexpected request " + verb + " " + path)
+
+
+#
+# Tests
+#
+
+class ColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(api, "PROJECT_COLUMNS", True),
+            mock.patch.object(api, "_request", side_effect=_response)
+        ]
+        for patch in self.patches:
+            patch.start()
+        accounts.new(ACCOUNT, "key", "secret", HOST)
+        instruments.clear()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        accounts.delete(ACCOUNT)
+        instruments.clear()
+
+    def test_projection_is_on(self):
+        with self.assertRaises(api.BitmexApiException):
+            api.position_get(HOST, "key", "secret", columns=["notAColumn"])
+
+    def test_position_info(self):
+        position = core.position_info([ACCOUNT])[0]["positions"][0]
+        self.assertEqual(position["size"], 100)
+        self.assertEqual(position["liqPrice"], 9455)
+
+    def test_position_info_all(self):
+        positions = core.position_info_all([ACCOUNT])[0]["positions"]
+        self.assertEqual([x["leverage"] for x in positions], ["100", "cross"])
+
+    def test_order_info(self):
+        snapshot = core.open_order_snapshot([ACCOUNT], incremental=False)
+        orders = core.active_order_info([ACCOUNT], snapshot)[0]["orders"]
+        self.assertEqual([x["remaining"] for x in orders], [100])
+        stopOrders = core.stop_order_info([ACCOUNT], snapshot)[0]["orders"]
+        self.assertEqual([x["stopPrice"] for x in stopOrders], [9400])
+
+    def test_instrument_functions(self):
+        self.assertEqual(core.instrument_price(ACCOUNT, "XBTUSD")["midPrice"], 9510.25)
+        self.assertEqual(core.instrument_tick(ACCOUNT, "XBTUSD"), 0.5)
+        self.assertTrue(core.instrument_is_inverse(ACCOUNT, "XBTUSD"))
+        self.assertEqual(core.instrument_contract_value(ACCOUNT, "XBTUSD"), 1)
+        self.assertEqual(core.open_instruments(ACCOUNT), ["XBTUSD"])
+
+    def test_instrument_registry(self):
+        instrument = instruments.get(ACCOUNT, "XBTUSD")
+        self.assertEqual(sorted(instrument), sorted(instruments.COLUMNS))
+
+    def test_quotes(self):
+        quotes._download(HOST, {"account": ACCOUNT, "symbols": {"XBTUSD": 1}})
+        try:
+            self.assertEqual(quotes.get(HOST, "XBTUSD")["askPrice"], 9510.5)
+        finally:
+            quotes._quotes.pop((HOST, "XBTUSD"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
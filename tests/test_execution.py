@@ -0,0 +1,106 @@
+"""
+Tests of execution algorithms against backend.fakeexchange.
+"""
+
+import unittest
+
+import backend.accounts as accounts
+import backend.execution as execution
+
+from backend.fakeexchange import FakeExchange
+
+
+#
+# Constants
+#
+
+ACCOUNTS = ["test-execution-1", "test-execution-2"]
+SYMBOL = "XBTUSD"
+
+
+#
+# Tests
+#
+
+class ExecutionTest(unittest.TestCase):
+
+    def setUp(self):
+        for i, name in enumerate(ACCOUNTS):
+            accounts.new(name, "key" + str(i), "secret")
+            self.addCleanup(accounts.delete, name)
+        self.exchange = FakeExchange(price=100)
+
+    def accounts_status(self, algorithm):
+        return algorithm.status()["accounts"]
+
+    def test_twap_market(self):
+        twap = execution.TWAP(ACCOUNTS, SYMBOL, 300, duration=3, slices=3, lot=100,
+                              exchange=self.exchange)
+        for i in range(3):
+            self.assertFalse(twap.done)
+            twap.step()
+        self.assertTrue(twap.done)
+        for state in self.accounts_status(twap).values():
+            self.assertEqual(state["filled"], 300)
+            self.assertEqual(state["children"], 3)
+        self.assertEqual(self.exchange.posted, 6)
+
+    def test_twap_limit_rest_moves_to_next_slice(self):
+        twap = execution.TWAP(ACCOUNTS[:1], SYMBOL, 200, duration=2, slices=2,
+                              limitPrice=90, lot=100, exchange=self.exchange)
+        twap.step()  # First slice rests in the book
+        state = self.accounts_status(twap)[ACCOUNTS[0]]
+        self.assertEqual(state["filled"], 0)
+        self.assertIsNotNone(state["working"])
+        self.exchange.set_price(90)
+        twap.step()  # Resting slice is cancelled, second one carries all 200
+        state = self.accounts_status(twap)[ACCOUNTS[0]]
+        self.assertEqual(state["filled"], 200)
+        self.assertEqual(state["children"], 2)
+        self.assertTrue(twap.done)
+
+    def test_iceberg(self):
+        iceberg = execution.Iceberg(ACCOUNTS, SYMBOL, 300, visibleQty=100,
+                                    limitPrice=90, lot=100, exchange=self.exchange)
+        iceberg.step()
+        iceberg.step()  # Child isn't filled, no other one is placed
+        self.assertEqual(self.exchange.posted, 2)
+        for i in range(3):
+            self.exchange.set_price(90)
+            iceberg.step()
+            self.exchange.set_price(100)
+        self.assertTrue(iceberg.done)
+        for state in self.accounts_status(iceberg).values():
+            self.assertEqual(state["filled"], 300)
+            self.assertEqual(state["children"], 3)
+            self.assertIsNone(state["error"])
+
+    def test_missing_child_gives_account_up(self):
+        iceberg = execution.Iceberg(ACCOUNTS, SYMBOL, 300, visibleQty=100,
+                                    limitPrice=90, lot=100, exchange=self.exchange)
+        iceberg.step()
+        missing = self.accounts_status(iceberg)[ACCOUNTS[0]]["working"]
+        del self.exchange.orders[missing]  # order_get finds nothing
+        for i in range(execution.MAX_FAILURES):
+            self.assertFalse(iceberg.done)
+            iceberg.step()
+        state = self.accounts_status(iceberg)[ACCOUNTS[0]]
+        self.assertIn(missing, state["error"])
+        self.assertEqual(state["children"], 1)
+        # Other account goes on
+        self.assertIsNone(self.accounts_status(iceberg)[ACCOUNTS[1]]["error"])
+        self.assertFalse(iceberg.done)
+        iceberg.cancel()
+        self.assertTrue(iceberg.done)
+
+    def test_missing_account(self):
+        twap = execution.TWAP(["test-execution-missing"], SYMBOL, 100, duration=1,
+                              slices=1, lot=100, exchange=self.exchange)
+        twap.step()
+        self.assertTrue(twap.done)
+        self.assertIsNotNone(self.accounts_status(twap)["test-execution-missing"]["error"])
+        self.assertEqual(self.exchange.posted, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
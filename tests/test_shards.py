@@ -0,0 +1,73 @@
+"""
+Tests that only calls worker processes can unpickle are sent to them.
+"""
+
+import functools
+import unittest
+
+from unittest import mock
+
+import backend.api as api
+import backend.core as core
+import backend.shards as shards
+
+
+#
+# Constants
+#
+
+ACCOUNT = {"name": "test-shards", "key": "key", "secret": "secret",
+           "host": "https://testnet.bitmex.com"}
+
+
+#
+# Tests
+#
+
+class CanRunTest(unittest.TestCase):
+
+    def test_api_functions(self):
+        self.assertTrue(shards.can_run(api.order_get))
+        self.assertTrue(shards.can_run(api.position_get))
+
+    def test_other_calls(self):
+        def nested(host, key, secret, **params):
+            return params
+
+        self.assertFalse(shards.can_run(lambda host, key, secret: None))
+        self.assertFalse(shards.can_run(nested))
+        self.assertFalse(shards.can_run(functools.partial(api.order_get, life=1)))
+        self.assertFalse(shards.can_run(api.Signer("key", "secret").headers))
+        self.assertFalse(shards.can_run(core.position_info))
+
+    def test_submit_refuses_other_calls(self):
+        future = shards.submit(ACCOUNT, lambda host, key, secret: None)
+        with self.assertRaises(shards.BitmexCoreException):
+            future.result()
+
+
+class SubmitTest(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(shards, "is_running", return_value=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        patch = mock.patch.object(shards, "submit")
+        self.submit = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_api_function_goes_to_shard(self):
+        core._submit(ACCOUNT, api.order_get, symbol="XBTUSD")
+        self.submit.assert_called_once_with(ACCOUNT, api.order_get, symbol="XBTUSD")
+
+    def test_other_call_falls_back_to_threads(self):
+        def call(host, key, secret, **params):
+            return (host, params)
+
+        account, future = core._submit(ACCOUNT, call, symbol="XBTUSD")
+        self.assertEqual(future.result(), (ACCOUNT["host"], {"symbol": "XBTUSD"}))
+        self.submit.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()